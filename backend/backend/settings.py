@@ -12,6 +12,8 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 
 from pathlib import Path
 
+from corsheaders.defaults import default_headers
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -44,11 +46,17 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # measures the whole request, does nothing unless API_METRICS is set
+    "contactsApp.metrics.MetricsMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
     "django.contrib.auth.middleware.AuthenticationMiddleware",
+    # newer typeahead requests supersede the earlier ones of the same lookup
+    "contactsApp.typeahead.LookupMiddleware",
+    # does nothing unless READ_DATABASES is set
+    "contactsApp.routing.ReadDatabaseMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
     "corsheaders.middleware.CorsMiddleware",
@@ -60,12 +68,15 @@ REST_FRAMEWORK = {
         "django_filters.rest_framework.DjangoFilterBackend",
         "rest_framework.filters.OrderingFilter",
     ],
-    "DEFAULT_PAGINATION_CLASS": "rest_framework.pagination.LimitOffsetPagination",
+    "DEFAULT_PAGINATION_CLASS": "contactsApp.pagination.KeysetPagination",
     "PAGE_SIZE": 10,
     "MAX_PAGE_SIZE": 100,
 }
 
 CORS_ALLOW_ALL_ORIGINS = True
+CORS_ALLOW_HEADERS = (*default_headers, "x-lookup-key", "x-read-primary-until")
+# echoed back by djangoStore after a write, see contactsApp/routing.py
+CORS_EXPOSE_HEADERS = ["x-read-primary-until"]
 
 ROOT_URLCONF = "backend.urls"
 
@@ -96,6 +107,8 @@ DATABASES = {
         "NAME": BASE_DIR / "db.sqlite3",
     }
 }
+# GET requests of the API read from READ_DATABASES when set, see settings_production.py
+DATABASE_ROUTERS = ["contactsApp.routing.ReadDatabaseRouter"]
 
 
 # Password validation
@@ -0,0 +1,80 @@
+"""
+Production settings: the project settings with the SQLite database tuned for concurrent requests.
+
+Use with DJANGO_SETTINGS_MODULE=backend.settings_production. The database is switched to WAL, so
+readers don't block the writer and the writer doesn't block readers, writers take the lock when
+their transaction starts and wait up to SQLITE_BUSY_TIMEOUT seconds for it (environment variable,
+default 20), and connections are kept between requests. The GET requests of the API ViewSets read
+through the READ_DATABASES aliases, here "readonly", a query_only connection to the same file (see
+contactsApp/routing.py). settings_replicas.py reads from copies of the file instead.
+
+The cache is shared by the worker processes (see CACHES below), so a write drops the cached
+responses, counts and ETags of every process.
+"""
+import os
+
+from .settings import *  # noqa: F401,F403
+from .settings import BASE_DIR
+
+# seconds a write waits for the database lock before failing with "database is locked"
+SQLITE_BUSY_TIMEOUT = float(os.environ.get("SQLITE_BUSY_TIMEOUT", 20))
+
+# run on every new connection
+SQLITE_PRAGMAS = [
+    "PRAGMA journal_mode=WAL",
+    # in WAL mode only a power loss can lose the last transactions, never corrupt the file
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA mmap_size=268435456",
+    # negative sizes are in KiB
+    "PRAGMA cache_size=-65536",
+    "PRAGMA temp_store=MEMORY",
+]
+
+
+def sqlite_database(*pragmas, name=BASE_DIR / "db.sqlite3", **options):
+    return {
+        "ENGINE": "django.db.backends.sqlite3",
+        "NAME": name,
+        "CONN_MAX_AGE": 600,
+        "CONN_HEALTH_CHECKS": True,
+        "OPTIONS": {
+            "timeout": SQLITE_BUSY_TIMEOUT,
+            "init_command": ";".join([*SQLITE_PRAGMAS, *pragmas]),
+            **options,
+        },
+    }
+
+
+DATABASES = {
+    # a deferred transaction that reads first fails at once when it can't upgrade to write
+    "default": sqlite_database(transaction_mode="IMMEDIATE"),
+    "readonly": {
+        **sqlite_database("PRAGMA query_only=ON"),
+        # in tests the same database as default, read through the default connection
+        "TEST": {"MIRROR": "default"},
+    },
+}
+READ_DATABASES = ["readonly"]
+# readonly reads the same file, it never misses a write
+READ_YOUR_WRITES_SECONDS = 0
+
+# the cached values are keyed on model versions bumped by writes, a per process cache would keep
+# serving the old responses of the processes that didn't handle the write.
+# REDIS_URL (e.g. redis://localhost:6379/0) uses Redis and needs the redis package, otherwise the
+# cache is a directory shared by the processes of this host
+if os.environ.get("REDIS_URL"):
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": os.environ["REDIS_URL"],
+        }
+    }
+else:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+            "LOCATION": os.environ.get("CACHE_DIR", BASE_DIR / "cache"),
+            # the default 300 entries would evict the model versions with the first pages cached
+            "OPTIONS": {"MAX_ENTRIES": 20000},
+        }
+    }
@@ -0,0 +1,24 @@
+"""
+Production settings reading from two replicas of the database, to try the replica routing locally.
+
+The replicas are copies of db.sqlite3 made by the replicate_database command, run it with
+--interval to keep them up to date. The copies lag behind by up to the interval, keep it below
+READ_YOUR_WRITES_SECONDS.
+"""
+from .settings_production import *  # noqa: F401,F403
+from .settings_production import BASE_DIR, DATABASES, sqlite_database
+
+REPLICAS = ["replica1", "replica2"]
+
+DATABASES = {
+    **DATABASES,
+    **{
+        alias: {
+            **sqlite_database("PRAGMA query_only=ON", name=BASE_DIR / f"{alias}.sqlite3"),
+            "TEST": {"MIRROR": "default"},
+        }
+        for alias in REPLICAS
+    },
+}
+READ_DATABASES = REPLICAS
+READ_YOUR_WRITES_SECONDS = 10
@@ -1,7 +1,10 @@
 from django.contrib import admin
 from django.urls import include, path
 
+from contactsApp.metrics import MetricsView
+
 urlpatterns = [
     path("admin/", admin.site.urls),
     path("api/contacts/", include("contactsApp.urls")),
+    path("api/_metrics", MetricsView.as_view()),
 ]
@@ -1,7 +1,6 @@
 from django.contrib import admin
 from .models import Register, Contact, Country, Region, City, Branch, Division, Sign, Deposit, ProfilesAndSubagencies
 
-admin.site.register(Register)
 admin.site.register(Contact)
 admin.site.register(Country)
 admin.site.register(Region)
@@ -10,4 +9,11 @@ admin.site.register(Branch)
 admin.site.register(Division)
 admin.site.register(Sign)
 admin.site.register(Deposit)
-admin.site.register(ProfilesAndSubagencies)
\ No newline at end of file
+admin.site.register(ProfilesAndSubagencies)
+
+
+@admin.register(Register)
+class RegisterAdmin(admin.ModelAdmin):
+    list_display = ["last_name", "first_name", "email", "registry_type", "is_client", "is_supplier"]
+    list_filter = ["is_client", "is_supplier"]
+    list_select_related = ["registry_type"]
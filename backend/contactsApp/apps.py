@@ -1,6 +1,17 @@
 from django.apps import AppConfig
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_migrate, pre_migrate
 
 
 class ContactsappConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'contactsApp'
+
+    def ready(self):
+        from . import signals  # noqa: F401
+        from .search import create_search_indexes, drop_search_triggers
+        from .typeahead import install_lookup_wrapper
+
+        pre_migrate.connect(drop_search_triggers, sender=self)
+        post_migrate.connect(create_search_indexes, sender=self)
+        connection_created.connect(install_lookup_wrapper)
@@ -0,0 +1,122 @@
+"""
+In-process prefix index over City names and postcodes, used by the city autocomplete endpoint
+"""
+import threading
+import time
+import unicodedata
+from bisect import bisect_left
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+
+from .caching import model_version
+from .models import City
+
+
+def normalize(value):
+    """
+    Lowercases and removes the accents, so "Forlì" matches "forli"
+    """
+    value = unicodedata.normalize("NFKD", value)
+    return "".join(char for char in value if not unicodedata.combining(char)).casefold()
+
+
+class CityIndex:
+    """
+    Sorted arrays of (normalised name or postcode, city id), one per (country, region), one per country
+    and one for all cities, keyed (country, region), (country, None) and (None, None).
+
+    The index is built lazily on the first search and rebuilt once the shared version of City
+    changes (bumped by the writes of any process, see caching.py) or once it is older than
+    CITY_AUTOCOMPLETE_TTL seconds, which covers the writes that don't bump it.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._data = None
+        self._built_at = 0
+        self._version = None
+
+    def is_stale(self, version):
+        ttl = getattr(settings, "CITY_AUTOCOMPLETE_TTL", 300)
+        return (
+            self._data is None
+            or self._version != version
+            or time.monotonic() - self._built_at > ttl
+        )
+
+    def data(self):
+        # read before building, a write during the build bumps it again for the next search
+        version = model_version(City)
+        if self.is_stale(version):
+            with self._lock:
+                if self.is_stale(version):
+                    self._data = self.build()
+                    self._built_at = time.monotonic()
+                    self._version = version
+        return self._data
+
+    def build(self):
+        cities = {}
+        regions = {}  # region id -> country id
+        entries = {}
+        # from default, a replica may miss the write that invalidated the index
+        rows = City.objects.using(DEFAULT_DB_ALIAS).values_list("id", "name", "postcode", "region_id", "country_id")
+        for pk, name, postcode, region_id, country_id in rows.iterator(chunk_size=5000):
+            cities[pk] = (name, postcode, region_id, country_id)
+            if region_id is not None:
+                regions[region_id] = country_id
+            for value in (name, postcode):
+                if value:
+                    entries.setdefault((country_id, region_id), []).append((normalize(value), pk))
+
+        countries = {}
+        for (country_id, region_id), items in entries.items():
+            countries.setdefault(country_id, []).extend(items)
+        every_country = [item for items in countries.values() for item in items]
+
+        scopes = {}
+        for (country_id, region_id), items in entries.items():
+            if region_id is not None:
+                scopes[(country_id, region_id)] = self.sorted_arrays(items)
+        for country_id, items in countries.items():
+            scopes[(country_id, None)] = self.sorted_arrays(items)
+        scopes[(None, None)] = self.sorted_arrays(every_country)
+        return cities, regions, scopes
+
+    @staticmethod
+    def sorted_arrays(items):
+        items.sort()
+        return [key for key, _ in items], [pk for _, pk in items]
+
+    def search(self, query, country=None, region=None, limit=10):
+        """
+        Returns up to limit cities with a name or postcode starting with query, in alphabetical order
+        """
+        cities, regions, scopes = self.data()
+        prefix = normalize(query)
+        scope = (country, None)
+        if region is not None:
+            # a region of another country matches nothing
+            scope = (regions.get(region) if country is None else country, region)
+        keys, ids = scopes.get(scope, ([], []))
+
+        results = []
+        seen = set()
+        for position in range(bisect_left(keys, prefix), len(keys)):
+            if not keys[position].startswith(prefix):
+                break
+            pk = ids[position]
+            if pk in seen:
+                continue
+            name, postcode, region_id, country_id = cities[pk]
+            seen.add(pk)
+            results.append(
+                {"id": pk, "name": name, "region": region_id, "postcode": postcode, "country": country_id}
+            )
+            if len(results) >= limit:
+                break
+        return results
+
+
+city_index = CityIndex()
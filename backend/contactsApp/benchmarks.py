@@ -0,0 +1,146 @@
+"""
+Request patterns of the frontend, replayed against the router endpoints by the benchmark_api command.
+
+A scenario is a generator yielding (path, params) for each GET request and receiving the response,
+so it can follow the cursors and counts returned, as the DevExtreme stores do. The grids load pages
+of PAGE_SIZE rows with limit/offset or the keyset cursor, sort by a column, filter a column and open
+the detail rows; the lookups search as the user types and load the selected row by id.
+"""
+from urllib.parse import parse_qs, urlsplit
+
+from django.conf import settings
+from django.core.exceptions import FieldDoesNotExist
+from rest_framework.filters import OrderingFilter
+
+from .urls import router
+
+# DevExtreme default page size
+PAGE_SIZE = 20
+# pages loaded by scrolling a grid
+SCROLL_PAGES = 5
+# characters typed in a lookup
+TYPED = 4
+
+
+def allowed_host():
+    # the links in the responses need a host allowed by the settings
+    return next((host for host in settings.ALLOWED_HOSTS if "*" not in host), "localhost").lstrip(".")
+
+
+def page(**params):
+    # a grid page loaded from its offset, as djangoStore does for any non sequential page
+    return {"limit": PAGE_SIZE, "cursor": "", "offset": 0, **params}
+
+
+def next_cursor(response):
+    link = response.json().get("next")
+    if not link:
+        return None
+    return parse_qs(urlsplit(link).query).get("cursor", [None])[0]
+
+
+def first_page(path, sample):
+    yield path, page()
+
+
+def scroll(path, sample):
+    response = yield path, page()
+    for _ in range(SCROLL_PAGES - 1):
+        cursor = next_cursor(response)
+        if cursor is None:
+            return
+        response = yield path, {"limit": PAGE_SIZE, "cursor": cursor}
+
+
+def jump(path, sample):
+    response = yield path, page()
+    count = response.json().get("count") or 0
+    for fraction in (4, 2):
+        offset = count // fraction // PAGE_SIZE * PAGE_SIZE
+        if offset:
+            yield path, page(offset=offset)
+
+
+def sort(field):
+    def scenario(path, sample):
+        # djangoStore sends the field for the descending sort
+        yield path, page(ordering=field)
+        yield path, page(ordering=f"-{field}")
+    return scenario
+
+
+def filter_value(value):
+    # a few characters from the middle, as typed in a filter row
+    value = str(value)
+    middle = len(value) // 2
+    return value[max(middle - 2, 0):middle + 1]
+
+
+def column_filter(name, field):
+    def scenario(path, sample):
+        yield path, page(**{name: filter_value(sample[field])})
+    return scenario
+
+
+def detail(name):
+    # detail grid of a row, filtered on its id
+    def scenario(path, sample):
+        yield path, page(**{name: sample[name]})
+    return scenario
+
+
+def search(field):
+    def scenario(path, sample):
+        for length in range(1, TYPED + 1):
+            yield path, page(_search=str(sample[field])[:length])
+    return scenario
+
+
+def by_key(path, sample):
+    yield f"{path}{sample['id']}/", {}
+
+
+def scenarios(viewset, sample):
+    """
+    {name: scenario} of the requests the frontend makes to a ViewSet, sample is a row of its list
+    """
+    result = {"first page": first_page, "scroll": scroll, "jump": jump}
+    if sample is None:
+        return result
+    if "id" in sample:
+        result["by key"] = by_key
+
+    if OrderingFilter in viewset().filter_backends:
+        for field in getattr(viewset, "ordering_fields", None) or []:
+            result[f"sort {field}"] = sort(field)
+
+    filterset_class = getattr(viewset, "filterset_class", None)
+    if filterset_class is None:
+        return result
+    model = filterset_class._meta.model
+    for name, filter in filterset_class.base_filters.items():
+        if name == "_search":
+            field = next((field for field in ("name", "last_name") if sample.get(field)), None)
+            if field is not None:
+                result["search"] = search(field)
+        elif name.endswith("__icontains"):
+            field = name[:-len("__icontains")]
+            if sample.get(field):
+                result[f"filter {field}"] = column_filter(name, field)
+        elif not filter.exclude:
+            try:
+                model_field = model._meta.get_field(name)
+            except FieldDoesNotExist:
+                continue
+            if model_field.many_to_one and sample.get(name) is not None:
+                result[f"detail {name}"] = detail(name)
+    return result
+
+
+def endpoints():
+    """
+    (prefix, ViewSet, list path) of the router endpoints
+    """
+    for prefix, viewset, basename in router.registry:
+        yield prefix, viewset, f"/api/contacts/{prefix}/"
+
@@ -0,0 +1,152 @@
+"""
+Batch create/update/delete endpoint for the ViewSets edited through the grids
+"""
+from collections import defaultdict
+
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from rest_framework import status
+from rest_framework.decorators import action
+from rest_framework.response import Response
+
+from .models import DisplayColumnsModel
+from .serializer import PrefetchedPrimaryKeyRelatedField
+
+
+def related_ids(serializer, items):
+    """
+    Maps each prefetchable related field of the serializer to its model and the ids used by the items
+    """
+    fields = {}
+    for name, field in serializer.fields.items():
+        if isinstance(field, PrefetchedPrimaryKeyRelatedField) and not field.read_only:
+            ids = set()
+            for item in items:
+                value = item.get(name) if isinstance(item, dict) else None
+                if isinstance(value, (int, str)) and not isinstance(value, bool):
+                    try:
+                        ids.add(field.get_queryset().model._meta.pk.to_python(value))
+                    except ValidationError:
+                        # reported by the field validation
+                        pass
+            fields[name] = (field, ids)
+    return fields
+
+
+def prefetch_related(serializer, items):
+    """
+    Loads the rows referenced by the items with one in_bulk per model, returns {field name: {pk: row}}
+    """
+    fields = related_ids(serializer, items)
+    by_model = defaultdict(set)
+    for field, ids in fields.values():
+        by_model[field.get_queryset().model].update(ids)
+    rows = {model: model._default_manager.in_bulk(ids) if ids else {} for model, ids in by_model.items()}
+
+    related = {}
+    for name, (field, ids) in fields.items():
+        queryset = field.get_queryset()
+        found = rows[queryset.model]
+        if queryset.query.where and ids:
+            # choices restricted by the field queryset (e.g. limit_choices_to)
+            allowed = set(queryset.filter(pk__in=ids).values_list("pk", flat=True))
+            found = {pk: row for pk, row in found.items() if pk in allowed}
+        related[name] = found
+    return related
+
+
+class BulkMixin:
+    """
+    ViewSet mixin adding POST <endpoint>/bulk/ with {"create": [data], "update": [data with id],
+    "delete": [ids]}. The related ids of all the items are loaded with one query per model and the
+    whole batch is saved in one transaction. If any item is invalid nothing is saved and the response
+    is a 400 with {"errors": {"create": [...], "update": [...], "delete": [...]}}, one entry per item
+    (empty for the valid ones). A row can't be both updated and deleted by the same batch.
+    """
+
+    bulk_operations = ("create", "update", "delete")
+
+    @action(detail=False, methods=["post"], url_path="bulk")
+    def bulk(self, request):
+        if not isinstance(request.data, dict):
+            return Response({"error": "expected an object"}, status=status.HTTP_400_BAD_REQUEST)
+        batch = {}
+        for operation in self.bulk_operations:
+            batch[operation] = request.data.get(operation, [])
+            if not isinstance(batch[operation], list):
+                return Response(
+                    {"error": f"{operation} must be a list"},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+
+        context = self.get_serializer_context()
+        context["related"] = prefetch_related(
+            self.get_serializer_class()(context=context), batch["create"] + batch["update"]
+        )
+        instances = self.bulk_instances(batch["update"] + batch["delete"])
+
+        errors = {operation: [{} for _ in batch[operation]] for operation in self.bulk_operations}
+        # position of the update of each row
+        updates = {}
+        to_save = []
+        for position, data in enumerate(batch["create"]):
+            serializer = self.get_serializer(data=data, context=context)
+            if serializer.is_valid():
+                to_save.append(serializer)
+            else:
+                errors["create"][position] = serializer.errors
+        for position, data in enumerate(batch["update"]):
+            pk = data.get("id") if isinstance(data, dict) else None
+            instance = instances.get(pk) if isinstance(pk, (int, str)) else None
+            if instance is None:
+                errors["update"][position] = {"id": ["Not found."]}
+                continue
+            updates[instance.pk] = position
+            serializer = self.get_serializer(instance, data=data, partial=True, context=context)
+            if serializer.is_valid():
+                to_save.append(serializer)
+            else:
+                errors["update"][position] = serializer.errors
+        for position, pk in enumerate(batch["delete"]):
+            if not isinstance(pk, (int, str)) or instances.get(pk) is None:
+                errors["delete"][position] = {"id": ["Not found."]}
+            elif instances[pk].pk in updates:
+                errors["delete"][position] = {"id": ["Also updated by this batch."]}
+                update_errors = errors["update"][updates[instances[pk].pk]]
+                update_errors["id"] = update_errors.get("id", []) + ["Also deleted by this batch."]
+
+        if any(any(item) for item in errors.values()):
+            return Response({"errors": errors}, status=status.HTTP_400_BAD_REQUEST)
+
+        with transaction.atomic():
+            for serializer in to_save:
+                serializer.save()
+            if batch["delete"]:
+                self.get_queryset().filter(pk__in=[instances[pk].pk for pk in batch["delete"]]).delete()
+
+        created = [serializer.data for serializer in to_save[:len(batch["create"])]]
+        updated = [serializer.data for serializer in to_save[len(batch["create"]):]]
+        return Response({"created": created, "updated": updated, "deleted": batch["delete"]})
+
+    def bulk_instances(self, items):
+        """
+        Rows to update or delete with one query, keyed by the ids as sent
+        """
+        ids = {}
+        pk_field = self.get_queryset().model._meta.pk
+        for item in items:
+            value = item.get("id") if isinstance(item, dict) else item
+            if not isinstance(value, (int, str)) or isinstance(value, bool):
+                continue
+            try:
+                ids[value] = pk_field.to_python(value)
+            except ValidationError:
+                continue
+        queryset = self.get_queryset()
+        # the display columns are refreshed on save from the related rows
+        if issubclass(queryset.model, DisplayColumnsModel):
+            queryset = queryset.select_related(
+                *(foreign_key for foreign_key, _, _ in queryset.model.display_fields.values())
+            )
+        rows = queryset.in_bulk(set(ids.values()))
+        return {value: rows[pk] for value, pk in ids.items() if pk in rows}
@@ -0,0 +1,226 @@
+"""
+Cache helpers shared by the API.
+
+Cached values are keyed on a per-model version counter which is bumped by the save/delete
+signals of the model, so a write makes every cached value of that model unreachable at once.
+Writes that don't send signals (bulk_create, update()) are covered by the cache timeouts.
+The versions live in the default cache, which must be shared by the worker processes: with the
+per process LocMemCache of the development settings a write only reaches the process that handled
+it, the others serve their cached values until the timeouts. settings_production.py sets a shared one.
+Identical requests missing the cache at the same time run the view once (see typeahead.py).
+"""
+import hashlib
+import time
+
+from django.apps import apps
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Max
+from django.db.models.sql import Query
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
+from rest_framework.response import Response
+
+from .routing import read_source, replica_timeout
+from .typeahead import shared_call, shared_response
+
+
+def version_key(model):
+    return f"contactsApp:version:{model._meta.label_lower}"
+
+
+def new_version():
+    # a restarted counter must not reuse the versions of the evicted one
+    return time.time_ns() // 1000
+
+
+def model_version(model):
+    return cache.get_or_set(version_key(model), new_version, timeout=None)
+
+
+def model_versions(models):
+    """
+    Versions of the models, read with a single cache request once they exist
+    """
+    keys = [version_key(model) for model in models]
+    versions = cache.get_many(keys)
+    return [versions[key] if key in versions else model_version(model) for key, model in zip(keys, models)]
+
+
+def bump_model_version(model):
+    try:
+        cache.incr(version_key(model))
+    except ValueError:
+        cache.set(version_key(model), new_version(), timeout=None)
+
+
+def query_models(query):
+    """
+    Models of the tables the query reads, its joins and the ones of its subqueries
+    """
+    tables = {model._meta.db_table: model for model in apps.get_models()}
+    models = set()
+    queries = [query]
+    while queries:
+        query = queries.pop()
+        models.add(query.model)
+        models.update(tables[join.table_name] for join in query.alias_map.values() if join.table_name in tables)
+        for leaf in query.where.leaves():
+            for node in leaf.flatten():
+                if isinstance(node, Query):
+                    queries.append(node)
+                elif isinstance(getattr(node, "query", None), Query):
+                    queries.append(node.query)
+    return sorted(models, key=lambda model: model._meta.label_lower)
+
+
+def params_hash(params, exclude=()):
+    """
+    Hash of the query params normalised by name and value order, ignoring the empty ones
+    """
+    items = sorted(
+        (name, sorted(values))
+        for name, values in params.lists()
+        if name not in exclude and any(values)
+    )
+    return hashlib.md5(repr(items).encode("utf-8")).hexdigest()
+
+
+def representation_key(request):
+    """
+    What the response of a GET depends on besides the data: renderer, URL and query params
+    """
+    return "{}:{}:{}".format(
+        request.accepted_renderer.format,
+        # links in paginated responses are absolute
+        request.build_absolute_uri(request.path),
+        params_hash(request.query_params),
+    )
+
+
+def make_etag(value):
+    return '"{}"'.format(hashlib.md5(value.encode("utf-8")).hexdigest())
+
+
+class CachedResponseMixin:
+    """
+    ViewSet mixin caching the list and retrieve responses for RESPONSE_CACHE_TIMEOUT seconds
+    (default 300), keyed on the model version, the URL and the normalised query params.
+
+    Responses carry an ETag and a Last-Modified header and must be revalidated by the browser,
+    which gets a 304 without touching the database while the model is unchanged.
+    """
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(super().retrieve, request, *args, **kwargs)
+
+    def response_cache_key(self, request, version):
+        return "contactsApp:response:{}:{}:{}:{}".format(
+            self.get_queryset().model._meta.label_lower, version, read_source(), representation_key(request)
+        )
+
+    def cached_response(self, handler, request, *args, **kwargs):
+        key = self.response_cache_key(request, model_version(self.get_queryset().model))
+        cached = cache.get(key)
+        if cached is None:
+            response = shared_response(key, lambda: handler(request, *args, **kwargs))
+            if response.status_code != 200:
+                return response
+            cached = (response.data, int(time.time()))
+            cache.set(key, cached, replica_timeout(getattr(settings, "RESPONSE_CACHE_TIMEOUT", 300)))
+
+        data, last_modified = cached
+        # the key changes with the content, so it identifies the representation
+        etag = make_etag(key)
+        response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if response is None:
+            response = Response(data)
+        response.headers["ETag"] = etag
+        response.headers["Last-Modified"] = http_date(last_modified)
+        patch_cache_control(response, no_cache=True)
+        return response
+
+
+class ConditionalResponseMixin:
+    """
+    ViewSet mixin sending an ETag and a Last-Modified header with the list and retrieve responses,
+    computed from the number of rows and their last updated_at (and the one of the related rows in
+    etag_related), so a request with a matching If-None-Match gets a 304 without loading and
+    serialising the rows.
+
+    The stamp is cached per endpoint and filter params for ETAG_CACHE_TIMEOUT seconds (default 30),
+    keyed on the versions of the listed model, of the etag_related ones and of the models the
+    filters join, so while they are unchanged a request costs no query until the response.
+    """
+
+    # foreign keys whose rows are shown in the response, e.g. through an annotation
+    etag_related = ()
+    # params that change the page but not the rows of the stamp
+    stamp_ignored_params = ("limit", "offset", "cursor", "ordering")
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        return self.conditional_response(super().list, queryset, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        queryset = self.filter_queryset(self.get_queryset()).filter(
+            **{self.lookup_field: self.kwargs[lookup_url_kwarg]}
+        )
+        return self.conditional_response(super().retrieve, queryset, request, *args, **kwargs)
+
+    def etag_stamps(self):
+        stamps = {"count": Count("pk"), "updated_at": Max("updated_at")}
+        for name in self.etag_related:
+            stamps[name] = Max(f"{name}__updated_at")
+        return stamps
+
+    def stamp_key(self, request, queryset):
+        related = [queryset.model._meta.get_field(name).related_model for name in self.etag_related]
+        models = sorted(
+            {*query_models(queryset.query), *related}, key=lambda model: model._meta.label_lower
+        )
+        return "contactsApp:stamp:{}:{}:{}:{}:{}".format(
+            queryset.model._meta.label_lower,
+            ".".join(str(version) for version in model_versions(models)),
+            read_source(),
+            request.path,
+            params_hash(request.query_params, exclude=self.stamp_ignored_params),
+        )
+
+    def response_stamp(self, key, queryset):
+        stamp = cache.get(key)
+        if stamp is None:
+            # identical requests missing the cache run the aggregate once
+            stamp = shared_call(key, lambda: self.aggregate_stamp(key, queryset))
+        return stamp
+
+    def aggregate_stamp(self, key, queryset):
+        stamp = queryset.order_by().aggregate(**self.etag_stamps())
+        cache.set(key, stamp, replica_timeout(getattr(settings, "ETAG_CACHE_TIMEOUT", 30)))
+        return stamp
+
+    def response_etag(self, request, stamp):
+        return make_etag("{}:{}".format(sorted(stamp.items()), representation_key(request)))
+
+    def conditional_response(self, handler, queryset, request, *args, **kwargs):
+        key = self.stamp_key(request, queryset)
+        stamp = self.response_stamp(key, queryset)
+        etag = self.response_etag(request, stamp)
+        updated = [value for name, value in stamp.items() if name != "count" and value is not None]
+        last_modified = int(max(updated).timestamp()) if updated else None
+        response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if response is None:
+            # identical requests share the view, keyed on the endpoint, params and model versions
+            flight = "{}:{}".format(key, representation_key(request))
+            response = shared_response(flight, lambda: handler(request, *args, **kwargs))
+            if response.status_code != 200:
+                return response
+        response.headers["ETag"] = etag
+        if last_modified is not None:
+            response.headers["Last-Modified"] = http_date(last_modified)
+        patch_cache_control(response, no_cache=True)
+        return response
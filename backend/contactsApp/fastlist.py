@@ -0,0 +1,108 @@
+"""
+Fast path for the list actions: the page is fetched with values() and the rows are turned into the
+serializer output directly, without building a model instance and going through every serializer
+field per row. The output is the same as the serializer's.
+"""
+from django.core.exceptions import FieldDoesNotExist
+from rest_framework import serializers
+from rest_framework.fields import empty
+from rest_framework.response import Response
+
+# fields returning the database value unchanged when it has the given type
+PASSTHROUGH = [
+    (serializers.CharField, str),
+    (serializers.IntegerField, int),
+    (serializers.BooleanField, bool),
+]
+
+
+def converter(field):
+    """
+    Function turning a column value into the field representation, None if it is returned as is
+    """
+    if isinstance(field, serializers.PrimaryKeyRelatedField) and field.pk_field is None:
+        # values() returns the id the field would output
+        return None
+    if isinstance(field, serializers.RelatedField):
+        return False
+    for field_class, python_type in PASSTHROUGH:
+        if isinstance(field, field_class) and type(field).to_representation is field_class.to_representation:
+            to_representation = field.to_representation
+            return lambda value: value if type(value) is python_type else to_representation(value)
+    return field.to_representation
+
+
+def field_columns(serializer, queryset):
+    """
+    Returns [(output name, values() lookup, converter)] reproducing the serializer output for the
+    queryset rows, or None if a field doesn't map onto a column (nested, method or property sources)
+    """
+    model = queryset.model
+    annotations = queryset.query.annotations
+    columns = []
+    for name, field in serializer.fields.items():
+        if field.write_only:
+            continue
+        source = field.source
+        if source == "*" or "." in source:
+            return None
+
+        if source in annotations:
+            lookup = source
+        else:
+            try:
+                model_field = model._meta.get_field(source)
+            except FieldDoesNotExist:
+                if hasattr(model, source) or field.default is not empty or field.allow_null:
+                    return None
+                # the serializer skips the attributes missing on the rows
+                continue
+            if model_field.is_relation and not model_field.many_to_one:
+                return None
+            lookup = model_field.attname
+
+        convert = converter(field)
+        if convert is False:
+            return None
+        columns.append((name, lookup, convert))
+    return columns
+
+
+def list_values(queryset, columns):
+    # the primary key is needed by the keyset pagination cursor
+    return queryset.values(*{queryset.model._meta.pk.attname, *(lookup for _, lookup, _ in columns)})
+
+
+def serialize_row(columns, row):
+    item = {}
+    for name, lookup, convert in columns:
+        value = row[lookup]
+        item[name] = value if value is None or convert is None else convert(value)
+    return item
+
+
+def serialize_rows(columns, rows):
+    return [serialize_row(columns, row) for row in rows]
+
+
+class FastListMixin:
+    """
+    ViewSet mixin serialising the list action through values(), for list serializers made of plain
+    column fields. Falls back to the serializer when a field can't be read from a column.
+    """
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        serializer = self.get_serializer()
+        columns = field_columns(serializer, queryset)
+        if columns is None:
+            page = self.paginate_queryset(queryset)
+            if page is not None:
+                return self.get_paginated_response(self.get_serializer(page, many=True).data)
+            return Response(self.get_serializer(queryset, many=True).data)
+
+        rows = list_values(queryset, columns)
+        page = self.paginate_queryset(rows)
+        if page is not None:
+            return self.get_paginated_response(serialize_rows(columns, page))
+        return Response(serialize_rows(columns, rows))
@@ -0,0 +1,453 @@
+"""
+Parsing and bulk loading of the geographic reference data (Countries, Regions, Cities)
+"""
+import csv
+import hashlib
+import re
+from collections import namedtuple
+from functools import partial
+from itertools import islice
+
+from django.db import transaction
+from django.db.models import Count
+from django.utils import timezone
+
+from .models import City, Contact, Country, GeoImportCheckpoint, GeoImportManifest, GeoImportRow, Region
+
+# one normalised CSV row, whatever the source file layout
+# source_id identifies the row inside its file across different versions of the file
+GeoRow = namedtuple(
+    "GeoRow",
+    ["source_id", "country_iso", "country_name", "region_name", "region_code", "city_name", "postcode"],
+)
+
+
+ZIPCODES_FILE = re.compile(r"^zipcodes\.([a-z]{2})\.csv$", re.IGNORECASE)
+
+
+def read_worldcities(path, skip=("ITA",)):
+    """
+    Yields a GeoRow for each row of worldcities.csv, skipping the countries loaded from zipcodes files
+    """
+    with open(path, "r", encoding="utf-8", newline="") as csvfile:
+        for row in csv.DictReader(csvfile):
+            iso_code = row.get("code")
+
+            # Skip countries with a zipcodes file, they're loaded from there
+            if iso_code in skip:
+                continue
+
+            yield GeoRow(
+                source_id=row.get("geoname_id"),
+                country_iso=iso_code,
+                country_name=row.get("country"),
+                region_name=row.get("province") or None,
+                region_code=None,
+                city_name=row.get("name_en"),
+                postcode=None,
+            )
+
+
+def read_zipcodes(path, country_iso="ITA", country_name="Italy"):
+    """
+    Yields a GeoRow for each row of a zipcodes.<country>.csv file
+    """
+    with open(path, "r", encoding="utf-8", newline="") as csvfile:
+        for row in csv.DictReader(csvfile):
+            yield GeoRow(
+                source_id=f"{row.get('zipcode')}/{row.get('place')}",
+                country_iso=country_iso,
+                country_name=country_name,
+                region_name=row.get("province") or None,
+                region_code=row.get("province_code") or None,
+                city_name=row.get("place"),
+                postcode=row.get("zipcode") or None,
+            )
+
+
+def country_codes(path):
+    """
+    Map alpha-2 code -> (alpha-3 code, name) of the countries in worldcities.csv
+    """
+    with open(path, "r", encoding="utf-8", newline="") as csvfile:
+        return {row["code2"]: (row["code"], row["country"]) for row in csv.DictReader(csvfile)}
+
+
+def source_readers(paths, codes):
+    """
+    Returns a (name, reader) pair for each source file, reader being a picklable callable
+    that yields the GeoRows of the file. zipcodes.<alpha-2>.csv files use the zipcodes layout,
+    any other file the worldcities one.
+    """
+    zipcodes = {}
+    for path in paths:
+        match = ZIPCODES_FILE.match(path.name)
+        if match:
+            alpha2 = match.group(1).upper()
+            if alpha2 not in codes:
+                raise ValueError(f"Unknown country code {alpha2} for {path.name}")
+            zipcodes[path] = codes[alpha2]
+
+    skip = tuple(iso_code for iso_code, _ in zipcodes.values())
+    readers = []
+    for path in paths:
+        if path in zipcodes:
+            country_iso, country_name = zipcodes[path]
+            reader = partial(read_zipcodes, path, country_iso, country_name)
+        else:
+            reader = partial(read_worldcities, path, skip)
+        readers.append((path.name, reader))
+    return readers
+
+
+def load_dataset(reader):
+    """
+    Parses and deduplicates a whole source file, used as process pool task
+    """
+    return GeoDataSet().update(reader())
+
+
+class GeoDataSet:
+    """
+    In memory, deduplicated set of countries, regions and cities keyed by natural keys
+    """
+
+    def __init__(self):
+        self.rows = 0
+        self.countries = {}  # iso_code -> name
+        self.regions = set()  # (iso_code, name, code)
+        self.cities = set()  # (iso_code, region_name, region_code, name, postcode)
+
+    def add(self, row):
+        self.rows += 1
+        self.countries[row.country_iso] = row.country_name
+        if row.region_name:
+            self.regions.add((row.country_iso, row.region_name, row.region_code))
+        self.cities.add(
+            (row.country_iso, row.region_name, row.region_code, row.city_name, row.postcode)
+        )
+
+    def update(self, rows):
+        for row in rows:
+            self.add(row)
+        return self
+
+    def merge(self, other):
+        self.rows += other.rows
+        self.countries.update(other.countries)
+        self.regions |= other.regions
+        self.cities |= other.cities
+        return self
+
+
+def save_countries(countries, batch_size=1000):
+    """
+    Upserts the countries on iso_code, returns the map iso_code -> id
+    """
+    Country.objects.bulk_create(
+        [Country(iso_code=iso_code, name=name) for iso_code, name in countries.items()],
+        batch_size=batch_size,
+        update_conflicts=True,
+        unique_fields=["iso_code"],
+        update_fields=["name", "updated_at"],
+    )
+    return dict(
+        Country.objects.filter(iso_code__in=countries).values_list("iso_code", "id")
+    )
+
+
+def region_ids(country_ids):
+    """
+    Map (country_id, name, code) -> id of the regions already stored for the given countries
+    """
+    regions = Region.objects.filter(country_id__in=country_ids).values_list(
+        "id", "country_id", "name", "code"
+    )
+    return {(country_id, name, code): pk for pk, country_id, name, code in regions}
+
+
+def save_regions(regions, country_ids, batch_size=1000):
+    """
+    Inserts the regions that don't exist yet, returns the number of inserted rows
+    and the map (country_id, name, code) -> id
+    """
+    existing = region_ids(country_ids.values())
+    missing = [
+        Region(country_id=country_ids[iso_code], name=name, code=code)
+        for iso_code, name, code in regions
+        if (country_ids[iso_code], name, code) not in existing
+    ]
+    Region.objects.bulk_create(missing, batch_size=batch_size)
+    return len(missing), region_ids(country_ids.values())
+
+
+def city_ids(country_ids, names=None):
+    """
+    Map (country_id, region_id, name, postcode) -> id of the cities already stored for the given countries,
+    optionally only the ones with the given names
+    """
+    queryset = City.objects.filter(country_id__in=country_ids)
+    if names is None:
+        querysets = [queryset]
+    else:
+        # keep each query below the SQLite bound parameters limit
+        names = list(names)
+        querysets = [
+            queryset.filter(name__in=names[start:start + 500]) for start in range(0, len(names), 500)
+        ]
+
+    result = {}
+    for queryset in querysets:
+        for pk, country_id, region_id, name, postcode in queryset.values_list(
+            "id", "country_id", "region_id", "name", "postcode"
+        ):
+            result[(country_id, region_id, name, postcode)] = pk
+    return result
+
+
+def city_key(row, country_ids, region_map):
+    """
+    Natural key (country_id, region_id, name, postcode) of the City a GeoRow-like tuple refers to
+    """
+    country_id = country_ids[row.country_iso]
+    region_id = None
+    if row.region_name:
+        region_id = region_map[(country_id, row.region_name, row.region_code)]
+    return (country_id, region_id, row.city_name, row.postcode)
+
+
+def save_cities(cities, country_ids, region_map, batch_size=1000, scoped=False):
+    """
+    Inserts the cities that don't exist yet, returns the number of inserted rows.
+    If scoped, only the stored cities with the same names are loaded to find the existing ones.
+    """
+    names = {city[3] for city in cities} if scoped else None
+    existing = city_ids(country_ids.values(), names)
+    missing = []
+    for iso_code, region_name, region_code, name, postcode in cities:
+        country_id = country_ids[iso_code]
+        region_id = region_map[(country_id, region_name, region_code)] if region_name else None
+        key = (country_id, region_id, name, postcode)
+        if key not in existing:
+            existing[key] = None
+            missing.append(
+                City(country_id=country_id, region_id=region_id, name=name, postcode=postcode)
+            )
+    City.objects.bulk_create(missing, batch_size=batch_size)
+    return len(missing)
+
+
+# Chunked streaming import
+# ===========================
+
+ChunkResult = namedtuple("ChunkResult", ["offset", "rows", "created"])
+
+
+def chunked(iterable, size):
+    """
+    Yields lists of at most size items, consuming the iterable lazily
+    """
+    iterator = iter(iterable)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
+
+def stream_source(source, path, rows, chunk_size=10000, batch_size=1000):
+    """
+    Imports a source file chunk_size rows at a time, each chunk in its own transaction.
+
+    The number of committed rows is saved in a GeoImportCheckpoint together with the chunk,
+    so an interrupted import of the same file version resumes after the last committed chunk.
+    Only one chunk is held in memory at a time. Yields a ChunkResult after each commit.
+    """
+    checksum = file_checksum(path)
+    checkpoint = GeoImportCheckpoint.objects.filter(source=source, checksum=checksum).first()
+    offset = checkpoint.offset if checkpoint else 0
+
+    for chunk in chunked(islice(rows, offset, None), chunk_size):
+        dataset = GeoDataSet().update(chunk)
+        with transaction.atomic():
+            country_ids = save_countries(dataset.countries, batch_size)
+            _, region_map = save_regions(dataset.regions, country_ids, batch_size)
+            created = save_cities(dataset.cities, country_ids, region_map, batch_size, scoped=True)
+            offset += len(chunk)
+            GeoImportCheckpoint.objects.update_or_create(
+                source=source, defaults={"checksum": checksum, "offset": offset}
+            )
+        yield ChunkResult(offset, len(chunk), created)
+
+    GeoImportCheckpoint.objects.filter(source=source).delete()
+
+
+# Incremental sync
+# ===========================
+
+SyncResult = namedtuple("SyncResult", ["skipped", "inserted", "updated", "deleted", "kept"])
+
+
+def file_checksum(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        for chunk in iter(lambda: file.read(1 << 16), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def row_fingerprint(row):
+    return hashlib.sha1("\x1f".join(value or "" for value in row).encode("utf-8")).hexdigest()
+
+
+def sync_source(source, path, rows, batch_size=1000):
+    """
+    Applies to the database only the rows of a source file that changed since its last import.
+
+    Every imported row is tracked in GeoImportRow with its fingerprint and the City it produced,
+    so rows missing from the new file version delete their City (unless a Contact still uses it)
+    and rows with a different fingerprint update it. Only a City the row created and no other
+    import row uses is changed in place, a row sharing its City or matched to an existing one is
+    pointed to the City of its new values instead. A file with the same checksum as the last
+    import is skipped without reading it.
+    """
+    checksum = file_checksum(path)
+    manifest = GeoImportManifest.objects.filter(source=source).first()
+    if manifest and manifest.checksum == checksum:
+        return SyncResult(True, 0, 0, 0, 0)
+
+    # diff the file against the manifest outside of the transaction, so the database
+    # is only locked while the actual changes are written
+    stored = {}
+    if manifest:
+        stored = {
+            key: (fingerprint, city_id, created)
+            for key, fingerprint, city_id, created in manifest.rows.values_list(
+                "key", "fingerprint", "city_id", "created"
+            )
+        }
+    changed = {}
+    fingerprints = {}
+    for row in rows:
+        fingerprint = row_fingerprint(row)
+        fingerprints[row.source_id] = fingerprint
+        if row.source_id not in stored or stored[row.source_id][0] != fingerprint:
+            changed[row.source_id] = row
+    removed = [key for key in stored if key not in fingerprints]
+
+    dataset = GeoDataSet().update(changed.values())
+    inserted = updated = deleted = kept = 0
+
+    with transaction.atomic():
+        if manifest is None:
+            manifest = GeoImportManifest.objects.create(source=source, checksum=checksum)
+
+        country_ids = save_countries(dataset.countries, batch_size)
+        _, region_map = save_regions(dataset.regions, country_ids, batch_size)
+        existing = city_ids(country_ids.values())
+        owned = owned_cities(stored, [key for key in changed if key in stored], batch_size)
+
+        # cities owned by the changed rows are updated in place, the other rows are matched
+        # on their natural key, so a sync can adopt rows loaded by a full import
+        now = timezone.now()
+        to_update = {}
+        to_create = {}
+        updated_keys = set()
+        for key, row in changed.items():
+            natural_key = city_key(row, country_ids, region_map)
+            country_id, region_id, name, postcode = natural_key
+            city_id = stored[key][1] if key in stored else None
+            if city_id in owned and natural_key not in existing:
+                to_update[city_id] = City(
+                    id=city_id, country_id=country_id, region_id=region_id, name=name, postcode=postcode,
+                    updated_at=now,
+                )
+                existing[natural_key] = city_id
+                updated_keys.add(key)
+            elif natural_key not in existing and natural_key not in to_create:
+                to_create[natural_key] = (key, City(
+                    country_id=country_id, region_id=region_id, name=name, postcode=postcode
+                ))
+
+        City.objects.bulk_update(
+            to_update.values(), ["country", "region", "name", "postcode", "updated_at"], batch_size=batch_size
+        )
+        City.objects.bulk_create([city for _, city in to_create.values()], batch_size=batch_size)
+        inserted, updated = len(to_create), len(to_update)
+        if to_create:
+            existing = city_ids(country_ids.values())
+
+        creators = {key for key, _ in to_create.values()}
+        import_rows = [
+            GeoImportRow(
+                manifest=manifest,
+                key=key,
+                fingerprint=fingerprints[key],
+                city_id=existing[city_key(row, country_ids, region_map)],
+                created=key in creators or key in updated_keys,
+            )
+            for key, row in changed.items()
+        ]
+        GeoImportRow.objects.bulk_create(
+            import_rows,
+            batch_size=batch_size,
+            update_conflicts=True,
+            unique_fields=["manifest", "key"],
+            update_fields=["fingerprint", "city", "created"],
+        )
+
+        live = {stored[key][1] for key in fingerprints if key in stored and key not in changed}
+        live.update(import_row.city_id for import_row in import_rows)
+        # owned cities left behind by rows now matching another city
+        moved = [key for key in changed if key in stored and stored[key][1] in owned and stored[key][1] not in live]
+        if removed or moved:
+            deleted, kept = delete_stale_cities(manifest, removed + moved, stored, live, batch_size)
+
+        manifest.checksum = checksum
+        manifest.save()
+
+    return SyncResult(False, inserted, updated, deleted, kept)
+
+
+def owned_cities(stored, keys, batch_size=1000):
+    """
+    Ids of the cities created by the given stored rows which no other import row uses
+    """
+    candidates = list({stored[key][1] for key in keys if stored[key][2]})
+    shared = set()
+    for start in range(0, len(candidates), batch_size):
+        shared.update(
+            GeoImportRow.objects.filter(city_id__in=candidates[start:start + batch_size])
+            .values("city_id")
+            .annotate(rows=Count("id"))
+            .filter(rows__gt=1)
+            .values_list("city_id", flat=True)
+        )
+    return set(candidates) - shared
+
+
+def delete_stale_cities(manifest, removed, stored, live, batch_size=1000):
+    """
+    Deletes the cities produced by rows that are no longer in the source file.
+    Cities still produced by another row (live), or used by a Contact, are kept.
+    Returns the number of deleted and kept cities.
+    """
+    candidates = {stored[key][1] for key in removed}
+    in_use = candidates & live
+    in_use.update(
+        GeoImportRow.objects.filter(city_id__in=candidates)
+        .exclude(manifest=manifest)
+        .values_list("city_id", flat=True)
+    )
+    referenced = set(
+        Contact.objects.filter(city_id__in=candidates).values_list("city_id", flat=True)
+    )
+    stale = candidates - in_use - referenced
+
+    # the manifest rows of the deleted cities go away with them, rows pointing to a referenced
+    # city are kept so the deletion is retried by the next sync of a changed file
+    for start in range(0, len(removed), batch_size):
+        batch = [key for key in removed[start:start + batch_size] if stored[key][1] in in_use]
+        GeoImportRow.objects.filter(manifest=manifest, key__in=batch).delete()
+    stale = list(stale)
+    for start in range(0, len(stale), batch_size):
+        City.objects.filter(id__in=stale[start:start + batch_size]).delete()
+
+    return len(stale), len(candidates & referenced - in_use)
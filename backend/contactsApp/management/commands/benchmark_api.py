@@ -0,0 +1,201 @@
+import json
+import math
+import subprocess
+import time
+from contextlib import ExitStack
+from pathlib import Path
+
+from django.apps import apps
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from contactsApp.benchmarks import allowed_host, endpoints, page, scenarios
+from contactsApp.routing import read_databases
+
+# cold runs clear this one before every request, not the cache shared with the running servers
+PRIVATE_CACHE = {
+    "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache", "LOCATION": "benchmark_api"}
+}
+
+def percentile(samples, percent):
+    # nearest rank
+    ordered = sorted(samples)
+    return ordered[max(math.ceil(len(ordered) * percent / 100) - 1, 0)]
+
+
+def commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def returned_rows(response):
+    if response.status_code >= 400:
+        return 0
+    data = response.json()
+    if isinstance(data, dict):
+        return len(data["results"]) if "results" in data else 1
+    return len(data)
+
+
+class Command(BaseCommand):
+    help = (
+        "Replays the grid and lookup requests of the frontend against every API endpoint and reports "
+        "latency percentiles, queries per request and rows/s, optionally as JSON to compare between commits"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--repeat", type=int, default=3, help="Runs of each scenario")
+        parser.add_argument(
+            "--endpoint",
+            action="append",
+            help="Router prefix to benchmark, can be repeated (default: all)",
+        )
+        parser.add_argument(
+            "--warm-cache",
+            action="store_true",
+            help="Keep the API caches between requests, by default every request starts from an empty private cache",
+        )
+        parser.add_argument("--output", type=Path, help="Write the results to this JSON file")
+        parser.add_argument(
+            "--compare",
+            type=Path,
+            help="JSON results of an earlier run, the p50 and p95 of each scenario are compared with them",
+        )
+        parser.add_argument(
+            "--threshold",
+            type=float,
+            default=1.2,
+            help="Slowdown ratio reported as a regression by --compare",
+        )
+
+    def handle(self, *args, **options):
+        baseline = None
+        if options["compare"]:
+            try:
+                baseline = json.loads(options["compare"].read_text())["scenarios"]
+            except (OSError, ValueError, KeyError) as e:
+                raise CommandError(f"Can't read {options['compare']}: {e}")
+
+        self.client = Client(HTTP_HOST=allowed_host())
+        self.warm_cache = options["warm_cache"]
+        with override_settings(**({} if self.warm_cache else {"CACHES": PRIVATE_CACHE})):
+            results = self.benchmark(options["endpoint"], options["repeat"])
+
+        report = {
+            "commit": commit(),
+            "date": timezone.now().isoformat(),
+            "database": connections["default"].vendor,
+            "repeat": options["repeat"],
+            "warm_cache": self.warm_cache,
+            "rows": {
+                model._meta.label_lower: model.objects.count()
+                for model in apps.get_app_config("contactsApp").get_models()
+            },
+            "scenarios": results,
+        }
+        if options["output"]:
+            options["output"].write_text(json.dumps(report, indent=2))
+            self.stdout.write(f"Results written to {options['output']}")
+        if baseline is not None:
+            self.compare(baseline, results, options["threshold"])
+
+    def benchmark(self, prefixes, repeat):
+        """
+        Runs the scenarios of the endpoints, returns the summary of each one by name
+        """
+        results = {}
+        for prefix, viewset, path in endpoints():
+            if prefixes and prefix not in prefixes:
+                continue
+            response = self.request(path, page())
+            rows = response.json().get("results") if response.status_code == 200 else None
+            sample = rows[0] if rows else None
+
+            for name, scenario in scenarios(viewset, sample).items():
+                # first run not measured
+                self.run(scenario, path, sample)
+                measures = []
+                for _ in range(repeat):
+                    measures += self.run(scenario, path, sample)
+                result = self.summary(measures)
+                results[f"{prefix} {name}"] = result
+                self.stdout.write(
+                    f"{prefix} {name}: p50 {result['p50_ms']:.1f}ms p95 {result['p95_ms']:.1f}ms "
+                    f"p99 {result['p99_ms']:.1f}ms, {result['queries_per_request']:.1f} queries, "
+                    f"{result['rows_per_second']:.0f} rows/s"
+                )
+                if result["errors"]:
+                    self.stdout.write(self.style.ERROR(f"    {result['errors']} requests failed"))
+        return results
+
+    def request(self, path, params):
+        if not self.warm_cache:
+            # PRIVATE_CACHE during the cold runs
+            cache.clear()
+        return self.client.get(path, params)
+
+    def run(self, scenario, path, sample):
+        """
+        Sends the requests of the scenario, returns [(milliseconds, queries, rows, status)]
+        """
+        measures = []
+        requests = scenario(path, sample)
+        response = None
+        while True:
+            try:
+                path, params = requests.send(response)
+            except StopIteration:
+                return measures
+            with ExitStack() as stack:
+                queries = [
+                    stack.enter_context(CaptureQueriesContext(connections[alias]))
+                    for alias in {DEFAULT_DB_ALIAS, *read_databases()}
+                ]
+                start = time.perf_counter()
+                response = self.request(path, params)
+                elapsed = (time.perf_counter() - start) * 1000
+            measures.append((
+                elapsed,
+                sum(len(captured) for captured in queries),
+                returned_rows(response),
+                response.status_code,
+            ))
+
+    def summary(self, measures):
+        times = [elapsed for elapsed, _, _, _ in measures]
+        return {
+            "requests": len(measures),
+            "errors": sum(1 for _, _, _, status in measures if status >= 400),
+            "mean_ms": round(sum(times) / len(times), 3),
+            "p50_ms": round(percentile(times, 50), 3),
+            "p95_ms": round(percentile(times, 95), 3),
+            "p99_ms": round(percentile(times, 99), 3),
+            "queries_per_request": round(sum(queries for _, queries, _, _ in measures) / len(measures), 2),
+            "rows_per_second": round(sum(rows for _, _, rows, _ in measures) / (sum(times) / 1000), 1),
+        }
+
+    def compare(self, baseline, results, threshold):
+        regressions = 0
+        self.stdout.write("\nCompared with the baseline (ratio of the new times to the old ones):")
+        for name, result in results.items():
+            old = baseline.get(name)
+            if old is None:
+                continue
+            ratios = [result[key] / old[key] if old[key] else 1 for key in ("p50_ms", "p95_ms")]
+            line = f"{name}: p50 {ratios[0]:.2f}x p95 {ratios[1]:.2f}x"
+            if result["queries_per_request"] != old["queries_per_request"]:
+                line += f", queries {old['queries_per_request']} -> {result['queries_per_request']}"
+            if ratios[0] > threshold:
+                regressions += 1
+                self.stdout.write(self.style.WARNING(line))
+            else:
+                self.stdout.write(line)
+        self.stdout.write(f"{regressions} scenarios slower than {threshold}x")
@@ -0,0 +1,206 @@
+import json
+import random
+import sys
+import threading
+import time
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.core.signals import got_request_exception
+from django.db import close_old_connections, connections
+from django.test import Client, override_settings
+from django.utils import timezone
+
+from contactsApp.benchmarks import allowed_host, endpoints, page, scenarios
+from contactsApp.management.commands.benchmark_api import commit, percentile
+from contactsApp.management.commands.loadtest_lookups import NO_CACHE
+from contactsApp.models import Contact, Register
+
+# scenarios sending requests which don't depend on the previous responses
+READ_SCENARIOS = ("first page", "by key", "search")
+# rows the writes are spread over
+WRITE_ROWS = 1000
+
+
+def read_requests():
+    """
+    [(path, params)] of the first page, searches and by key requests of every endpoint
+    """
+    client = Client(HTTP_HOST=allowed_host())
+    requests = []
+    for prefix, viewset, path in endpoints():
+        response = client.get(path, page())
+        rows = response.json().get("results") if response.status_code == 200 else None
+        sample = rows[0] if rows else None
+        for name, scenario in scenarios(viewset, sample).items():
+            if name in READ_SCENARIOS:
+                requests += list(scenario(path, sample))
+    return requests
+
+
+def write_requests(rng):
+    """
+    [(path, data)] of grid edits, changing the phone of registers and contacts
+    """
+    requests = []
+    for prefix, model in (("register", Register), ("contacts", Contact)):
+        ids = list(model.objects.order_by("?").values_list("pk", flat=True)[:WRITE_ROWS])
+        requests += [
+            (f"/api/contacts/{prefix}/{pk}/", {"phone": f"+39 0{rng.randint(10, 99)} {rng.randint(1000000, 9999999)}"})
+            for pk in ids
+        ]
+    return requests
+
+
+class Command(BaseCommand):
+    help = (
+        "Sends concurrent grid reads and edits from several threads and reports the throughput, the "
+        "latency of reads and writes and the failed requests, to compare database settings. "
+        "journal_mode=WAL stays set in the database file, measure the settings without it on a copy "
+        "of the file that was never opened with it."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--threads", type=int, default=8, help="Clients sending requests at the same time")
+        parser.add_argument("--requests", type=int, default=100, help="Requests sent by each client")
+        parser.add_argument("--writes", type=float, default=0.2, help="Share of the requests that are edits")
+        parser.add_argument("--seed", type=int, default=0, help="Random seed")
+        parser.add_argument(
+            "--warm-cache",
+            action="store_true",
+            help="Use the API caches, by default they are replaced with a dummy cache so every read queries the database",
+        )
+        parser.add_argument("--output", type=Path, help="Write the results to this JSON file")
+        parser.add_argument(
+            "--compare",
+            type=Path,
+            help="JSON results of an earlier run, e.g. with other settings, to compare with",
+        )
+
+    def handle(self, *args, **options):
+        if options["threads"] < 1 or options["requests"] < 1 or not 0 <= options["writes"] <= 1:
+            raise CommandError("--threads and --requests must be positive, --writes between 0 and 1")
+        baseline = None
+        if options["compare"]:
+            try:
+                baseline = json.loads(options["compare"].read_text())["results"]
+            except (OSError, ValueError, KeyError) as e:
+                raise CommandError(f"Can't read {options['compare']}: {e}")
+
+        rng = random.Random(options["seed"])
+        caches = {} if options["warm_cache"] else {"CACHES": NO_CACHE}
+        with override_settings(**caches):
+            reads = read_requests()
+            writes = write_requests(rng)
+            if not reads or (options["writes"] and not writes):
+                raise CommandError("No rows, run generate_data first")
+            close_old_connections()
+
+            self.measures = []
+            self.errors = []
+            got_request_exception.connect(self.record_exception)
+            try:
+                start = time.perf_counter()
+                threads = [
+                    threading.Thread(
+                        target=self.client,
+                        args=(reads, writes, options["requests"], options["writes"], random.Random(rng.random())),
+                    )
+                    for _ in range(options["threads"])
+                ]
+                for thread in threads:
+                    thread.start()
+                for thread in threads:
+                    thread.join()
+                elapsed = time.perf_counter() - start
+            finally:
+                got_request_exception.disconnect(self.record_exception)
+
+        results = {"requests_per_second": round(len(self.measures) / elapsed, 1)}
+        for kind in ("read", "write"):
+            results[kind] = self.summary([measure for measure in self.measures if measure[0] == kind])
+        locked = sum(1 for error in self.errors if "database is locked" in str(error))
+        results["locked"] = locked
+
+        self.stdout.write(f"{results['requests_per_second']:.0f} requests/s, journal mode {self.journal_mode()}")
+        for kind in ("read", "write"):
+            result = results[kind]
+            if result["requests"]:
+                self.stdout.write(
+                    f"{kind}: {result['requests']} requests, p50 {result['p50_ms']:.1f}ms "
+                    f"p95 {result['p95_ms']:.1f}ms, {result['errors']} failed"
+                )
+        if locked:
+            self.stdout.write(self.style.ERROR(f"{locked} requests failed with database is locked"))
+
+        if options["output"]:
+            report = {
+                "commit": commit(),
+                "date": timezone.now().isoformat(),
+                "settings": settings.SETTINGS_MODULE,
+                "journal_mode": self.journal_mode(),
+                "databases": sorted(connections),
+                "threads": options["threads"],
+                "writes": options["writes"],
+                "results": results,
+            }
+            options["output"].write_text(json.dumps(report, indent=2))
+            self.stdout.write(f"Results written to {options['output']}")
+        if baseline is not None:
+            self.compare(baseline, results)
+
+    def client(self, reads, writes, total, write_share, rng):
+        client = Client(HTTP_HOST=allowed_host(), raise_request_exception=False)
+        try:
+            for _ in range(total):
+                if writes and rng.random() < write_share:
+                    kind = "write"
+                    path, data = rng.choice(writes)
+                    start = time.perf_counter()
+                    response = client.patch(path, data, content_type="application/json")
+                else:
+                    kind = "read"
+                    path, params = rng.choice(reads)
+                    start = time.perf_counter()
+                    response = client.get(path, params)
+                self.measures.append((kind, (time.perf_counter() - start) * 1000, response.status_code))
+                # as the request_finished signal, which the test client doesn't send
+                close_old_connections()
+        finally:
+            connections.close_all()
+
+    def record_exception(self, sender, request=None, **kwargs):
+        # sent while the exception is handled
+        self.errors.append(sys.exc_info()[1])
+
+    def summary(self, measures):
+        times = [elapsed for _, elapsed, _ in measures]
+        if not times:
+            return {"requests": 0, "errors": 0}
+        return {
+            "requests": len(measures),
+            "errors": sum(1 for _, _, status in measures if status >= 500),
+            "p50_ms": round(percentile(times, 50), 3),
+            "p95_ms": round(percentile(times, 95), 3),
+        }
+
+    def journal_mode(self):
+        if connections["default"].vendor != "sqlite":
+            return None
+        with connections["default"].cursor() as cursor:
+            cursor.execute("PRAGMA journal_mode")
+            return cursor.fetchone()[0]
+
+    def compare(self, baseline, results):
+        self.stdout.write("\nCompared with the baseline:")
+        old, new = baseline["requests_per_second"], results["requests_per_second"]
+        self.stdout.write(f"throughput: {old:.0f} -> {new:.0f} requests/s ({new / old if old else 1:.2f}x)")
+        for kind in ("read", "write"):
+            if not baseline[kind]["requests"] or not results[kind]["requests"]:
+                continue
+            self.stdout.write(
+                f"{kind} p95: {baseline[kind]['p95_ms']:.1f} -> {results[kind]['p95_ms']:.1f}ms, "
+                f"failed {baseline[kind]['errors']} -> {results[kind]['errors']}"
+            )
+        self.stdout.write(f"database is locked: {baseline['locked']} -> {results['locked']}")
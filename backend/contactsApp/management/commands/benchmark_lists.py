@@ -0,0 +1,59 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.mixins import ListModelMixin
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIRequestFactory
+
+from contactsApp.fastlist import FastListMixin
+from contactsApp.urls import router
+
+
+def list_view(viewset, basename, params):
+    view = viewset(action_map={"get": "list"}, basename=basename, format_kwarg=None, args=(), kwargs={})
+    # the next/previous links need a host allowed by the settings
+    host = next((host for host in settings.ALLOWED_HOSTS if "*" not in host), "localhost").lstrip(".")
+    view.request = view.initialize_request(APIRequestFactory().get("/", params, HTTP_HOST=host))
+    return view
+
+
+def render(view, list_method):
+    response = list_method(view, view.request)
+    data = response.data
+    rows = len(data["results"]) if isinstance(data, dict) and "results" in data else len(data)
+    return JSONRenderer().render(data), rows
+
+
+def rows_per_second(view, list_method, repeat):
+    rows = 0
+    start = time.perf_counter()
+    for _ in range(repeat):
+        rows += render(view, list_method)[1]
+    return rows / (time.perf_counter() - start)
+
+
+class Command(BaseCommand):
+    help = "Compares rows/s of the serializer and of the values() fast path on the ViewSets using FastListMixin"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--limit", type=int, default=100, help="Page size")
+        parser.add_argument("--repeat", type=int, default=20, help="Pages rendered per path")
+
+    def handle(self, *args, **options):
+        scenarios = [{"limit": options["limit"]}, {"limit": options["limit"], "cursor": ""}]
+        for prefix, viewset, basename in router.registry:
+            if not issubclass(viewset, FastListMixin):
+                continue
+            for params in scenarios:
+                view = list_view(viewset, basename, params)
+                expected, _ = render(view, ListModelMixin.list)
+                if render(view, FastListMixin.list)[0] != expected:
+                    raise CommandError(f"{prefix} {params}: fast path output differs from the serializer")
+
+                serializer = rows_per_second(view, ListModelMixin.list, options["repeat"])
+                fast = rows_per_second(view, FastListMixin.list, options["repeat"])
+                self.stdout.write(
+                    f"{prefix} {params}: serializer {serializer:.0f} rows/s, "
+                    f"fast path {fast:.0f} rows/s ({fast / serializer:.1f}x)"
+                )
@@ -0,0 +1,133 @@
+from django.core.exceptions import FieldDoesNotExist
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Value
+from django.db.models.functions import Lower
+from rest_framework.filters import OrderingFilter
+from rest_framework.test import APIRequestFactory
+
+from contactsApp.models import Register
+from contactsApp.urls import router
+
+# plan lines that mean a whole table is read or the rows are sorted after reading them
+SQLITE_SCAN = "SCAN "
+SQLITE_SORT = "USE TEMP B-TREE"
+POSTGRESQL_SCAN = "Seq Scan"
+POSTGRESQL_SORT = "Sort"
+
+
+def scenarios(viewset):
+    """
+    Typical list requests of a ViewSet: default page, each ordering, _search and each foreign key
+    or excluded_* filter
+    """
+    yield {}
+
+    if OrderingFilter in viewset().filter_backends:
+        for field in getattr(viewset, "ordering_fields", None) or []:
+            yield {"ordering": field}
+
+    filterset_class = getattr(viewset, "filterset_class", None)
+    if filterset_class is None:
+        return
+    filters = filterset_class.base_filters
+    if "_search" in filters:
+        yield {"_search": "san"}
+    model = filterset_class._meta.model
+    for name, filter in filters.items():
+        try:
+            field = model._meta.get_field(filter.field_name)
+        except FieldDoesNotExist:
+            continue
+        if field.primary_key and filter.exclude:
+            # e.g. excluded_id
+            sample = model.objects.values_list("pk", flat=True).first()
+            if sample is not None:
+                yield {name: sample}
+        elif field.many_to_one:
+            # filters may restrict the choices, e.g. supplier only accepts suppliers
+            choices = getattr(filter, "queryset", None)
+            if choices is None:
+                choices = field.related_model.objects.all()
+            sample = choices.values_list("pk", flat=True).first()
+            if sample is not None:
+                yield {name: sample}
+
+
+def list_queryset(viewset, basename, params):
+    factory = APIRequestFactory()
+    view = viewset(action_map={"get": "list"}, basename=basename, format_kwarg=None, args=(), kwargs={})
+    view.request = view.initialize_request(factory.get("/", params))
+    queryset = view.filter_queryset(view.get_queryset())
+    # first page, as the pagination does
+    return queryset[:10]
+
+
+def problems(plan):
+    if connection.vendor == "postgresql":
+        scan, sort = POSTGRESQL_SCAN, POSTGRESQL_SORT
+    else:
+        scan, sort = SQLITE_SCAN, SQLITE_SORT
+
+    found = []
+    for line in plan.splitlines():
+        # sqlite rows are "id parent notused detail", postgresql nodes are indented with "->"
+        line = line.strip(" -|`>")
+        if connection.vendor == "sqlite":
+            line = line.split(" ", 3)[-1]
+        # walking an index in order stops after the page and full text matches go through their
+        # own index, only a plain scan reads the whole table
+        if line.startswith(scan) and not (" USING " in line or " VIRTUAL TABLE INDEX " in line):
+            found.append(line)
+        elif line.startswith(sort):
+            found.append(line)
+    return found
+
+
+class Command(BaseCommand):
+    help = "Runs EXPLAIN on the typical queries of each API ViewSet and flags full table scans and sorts"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--fail",
+            action="store_true",
+            help="Exit with an error if any query scans a whole table",
+        )
+        parser.add_argument(
+            "--verbose-plans",
+            action="store_true",
+            help="Print the whole plan of every query",
+        )
+
+    def handle(self, *args, **options):
+        queries = []
+        for prefix, viewset, basename in router.registry:
+            for params in scenarios(viewset):
+                queries.append((f"{prefix} {params or ''}".strip(), list_queryset(viewset, basename, params)))
+
+        queries.append((
+            "register check-email",
+            Register.objects.alias(email_lower=Lower("email"))
+            .filter(email_lower=Lower(Value("x@example.com")))
+            .order_by(),
+        ))
+
+        scans = 0
+        for name, queryset in queries:
+            plan = queryset.explain()
+            found = problems(plan)
+            if any(not line.startswith((SQLITE_SORT, POSTGRESQL_SORT)) for line in found):
+                scans += 1
+
+            if found:
+                self.stdout.write(self.style.WARNING(f"{name}:"))
+                for line in found:
+                    self.stdout.write(f"    {line}")
+            else:
+                self.stdout.write(self.style.SUCCESS(f"{name}: ok"))
+            if options["verbose_plans"]:
+                self.stdout.write(plan)
+
+        self.stdout.write(f"{len(queries)} queries, {scans} with full table scans")
+        if options["fail"] and scans:
+            raise CommandError(f"{scans} queries scan a whole table")
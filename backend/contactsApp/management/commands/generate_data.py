@@ -0,0 +1,242 @@
+import random
+import time
+from array import array
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Max
+
+from contactsApp.caching import bump_model_version
+from contactsApp.models import (
+    Branch,
+    City,
+    Contact,
+    Deposit,
+    Division,
+    ProfilesAndSubagencies,
+    Register,
+    RegistryType,
+    Sign,
+)
+
+LAST_NAMES = [
+    "Rossi", "Russo", "Ferrari", "Esposito", "Bianchi", "Romano", "Colombo", "Ricci", "Marino", "Greco",
+    "Bruno", "Gallo", "Conti", "De Luca", "Mancini", "Costa", "Giordano", "Rizzo", "Lombardi", "Moretti",
+    "Barbieri", "Fontana", "Santoro", "Mariani", "Rinaldi", "Caruso", "Ferrara", "Galli", "Martini", "Leone",
+    "Longo", "Gentile", "Martinelli", "Vitale", "Lombardo", "Serra", "Coppola", "De Santis", "D'Angelo", "Marchetti",
+]
+FIRST_NAMES = [
+    "Marco", "Luca", "Giuseppe", "Francesco", "Alessandro", "Andrea", "Matteo", "Lorenzo", "Davide", "Simone",
+    "Giulia", "Chiara", "Francesca", "Sara", "Anna", "Martina", "Valentina", "Elena", "Alessia", "Federica",
+]
+COMPANY_WORDS = [
+    "Meccanica", "Tessile", "Alimentari", "Logistica", "Impianti", "Costruzioni", "Trasporti", "Elettronica",
+    "Plastica", "Forniture", "Metalli", "Ricambi", "Servizi", "Imballaggi", "Chimica", "Legnami",
+]
+COMPANY_FORMS = ["S.r.l.", "S.p.A.", "S.n.c.", "S.a.s."]
+STREETS = ["Via Roma", "Via Garibaldi", "Via Mazzini", "Corso Italia", "Via Verdi", "Viale Europa", "Via Dante"]
+DOMAINS = ["example.com", "example.it", "example.org", "example.net"]
+BRANCHES = [("MI", "Sede Milano"), ("RM", "Sede Roma"), ("TO", "Sede Torino"), ("NA", "Sede Napoli"), ("BO", "Sede Bologna")]
+# share of registers by registry type
+REGISTRY_TYPES = [("Cliente", 0.5), ("Fornitore", 0.3), ("Cliente/Fornitore", 0.2)]
+
+
+def slug(value):
+    return "".join(char for char in value.lower() if char.isalnum())
+
+
+def phone(rng):
+    return f"+39 0{rng.randint(10, 99)} {rng.randint(1000000, 9999999)}"
+
+
+def register_names(rng):
+    """
+    (last_name, first_name), a company name for one register out of three
+    """
+    if rng.random() < 1 / 3:
+        company = f"{rng.choice(LAST_NAMES)} {rng.choice(COMPANY_WORDS)} {rng.choice(COMPANY_FORMS)}"
+        return company, None
+    return rng.choice(LAST_NAMES), rng.choice(FIRST_NAMES)
+
+
+class Command(BaseCommand):
+    help = (
+        "Generates synthetic registers, contacts and profiles linked to the imported cities, "
+        "for benchmarks at a given scale"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--registers", type=int, default=10000, help="Registers to create")
+        parser.add_argument(
+            "--contacts",
+            type=int,
+            help="Contacts to create, spread over the new registers (default: 2 per register)",
+        )
+        parser.add_argument(
+            "--profiles",
+            type=int,
+            help="Profiles and subagencies to create between the new clients and suppliers (default: 1 per register)",
+        )
+        parser.add_argument(
+            "--cities",
+            type=int,
+            default=5000,
+            help="Number of imported cities the contacts are spread over",
+        )
+        parser.add_argument("--batch-size", type=int, default=5000, help="Rows inserted together")
+        parser.add_argument("--seed", type=int, default=0, help="Random seed, the same seed generates the same rows")
+
+    def handle(self, *args, **options):
+        if not connection.features.can_return_rows_from_bulk_insert:
+            raise CommandError("The database doesn't return the ids of bulk inserts")
+
+        self.rng = random.Random(options["seed"])
+        self.batch_size = options["batch_size"]
+        registers = options["registers"]
+        contacts = 2 * registers if options["contacts"] is None else options["contacts"]
+        profiles = registers if options["profiles"] is None else options["profiles"]
+
+        city_ids = list(City.objects.order_by("pk").values_list("pk", flat=True))
+        if not city_ids:
+            raise CommandError("No cities, run import_worldcities first")
+        sample = sorted(self.rng.sample(city_ids, min(options["cities"], len(city_ids))))
+        self.cities = list(City.objects.filter(pk__in=sample).select_related("region", "country").order_by("pk"))
+        self.branches = [Branch.objects.get_or_create(code=code, defaults={"name": name})[0] for code, name in BRANCHES]
+        self.registry_types = [RegistryType.objects.get_or_create(name=name)[0] for name, _ in REGISTRY_TYPES]
+
+        start = time.perf_counter()
+        self.create_registers(registers)
+        self.stdout.write(f"registers: {registers} rows in {time.perf_counter() - start:.2f}s")
+
+        start = time.perf_counter()
+        contacts = self.create_contacts(contacts)
+        self.stdout.write(f"contacts: {contacts} rows in {time.perf_counter() - start:.2f}s")
+
+        start = time.perf_counter()
+        created = self.create_tabs(profiles)
+        self.stdout.write(f"divisions, signs, deposits and profiles: {created} rows in {time.perf_counter() - start:.2f}s")
+
+        # bulk_create sends no signals
+        for model in (Register, Contact, Division, Sign, Deposit, ProfilesAndSubagencies):
+            bump_model_version(model)
+
+    def batches(self, total, make_row):
+        for start in range(0, total, self.batch_size):
+            yield [make_row(position) for position in range(start, min(start + self.batch_size, total))]
+
+    def create_registers(self, total):
+        # ids of the new registers, arrays keep millions of them small
+        self.register_ids = array("q")
+        self.client_ids = array("q")
+        self.supplier_ids = array("q")
+        # emails are unique per run
+        first_id = (Register.objects.aggregate(last=Max("pk"))["last"] or 0) + 1
+        weights = [weight for _, weight in REGISTRY_TYPES]
+
+        def make_register(position):
+            last_name, first_name = register_names(self.rng)
+            register = Register(
+                last_name=last_name,
+                first_name=first_name,
+                email=f"{slug(first_name or 'info')}.{slug(last_name)}.{first_id + position}@{self.rng.choice(DOMAINS)}",
+                phone=phone(self.rng),
+                mobile=f"+39 3{self.rng.randint(100000000, 999999999)}" if self.rng.random() < 0.5 else None,
+                vat_number=f"IT{self.rng.randint(10 ** 10, 10 ** 11 - 1)}" if first_name is None else None,
+                registry_type=self.rng.choices(self.registry_types, weights)[0],
+            )
+            register.refresh_roles()
+            return register
+
+        for batch in self.batches(total, make_register):
+            with transaction.atomic():
+                Register.objects.bulk_create(batch)
+            for register in batch:
+                self.register_ids.append(register.pk)
+                if register.is_client:
+                    self.client_ids.append(register.pk)
+                if register.is_supplier:
+                    self.supplier_ids.append(register.pk)
+
+    def create_contacts(self, total):
+        if not self.register_ids:
+            return 0
+
+        def make_contact(position):
+            city = self.rng.choice(self.cities)
+            name = f"{self.rng.choice(LAST_NAMES)} {self.rng.choice(COMPANY_WORDS)}"
+            contact = Contact(
+                register_id=self.rng.choice(self.register_ids),
+                branch=self.rng.choice(self.branches),
+                name=name,
+                phone=phone(self.rng),
+                phone_ext=str(self.rng.randint(100, 999)) if self.rng.random() < 0.3 else None,
+                email=f"{slug(name)}.{position}@{self.rng.choice(DOMAINS)}",
+                country=city.country,
+                region=city.region,
+                city=city,
+                address=f"{self.rng.choice(STREETS)} {self.rng.randint(1, 200)}",
+            )
+            # the related rows are loaded, no queries
+            contact.refresh_display()
+            return contact
+
+        for batch in self.batches(total, make_contact):
+            with transaction.atomic():
+                Contact.objects.bulk_create(batch)
+        return total
+
+    def create_tabs(self, profiles):
+        """
+        Divisions, signs and deposits of the new suppliers (one each per 20 suppliers) and the profiles
+        """
+        if not self.client_ids or not self.supplier_ids:
+            return 0
+        per_model = max(len(self.supplier_ids) // 20, 1)
+
+        def make_division(position):
+            return Division(
+                name=f"Divisione {self.rng.choice(COMPANY_WORDS)}",
+                code=f"DV{position}",
+                client_id=self.rng.choice(self.client_ids),
+                supplier_id=self.rng.choice(self.supplier_ids),
+            )
+
+        def make_supplier_row(model, prefix, code):
+            return lambda position: model(
+                name=f"{prefix} {self.rng.choice(LAST_NAMES)}",
+                code=f"{code}{position}",
+                supplier_id=self.rng.choice(self.supplier_ids),
+            )
+
+        ids = {}
+        for model, make_row in (
+            (Division, make_division),
+            (Sign, make_supplier_row(Sign, "Insegna", "IN")),
+            (Deposit, make_supplier_row(Deposit, "Deposito", "DP")),
+        ):
+            ids[model] = []
+            for batch in self.batches(per_model, make_row):
+                with transaction.atomic():
+                    model.objects.bulk_create(batch)
+                    if model is Division:
+                        Division.refresh_display_columns(Division.objects.filter(pk__in=[row.pk for row in batch]))
+                ids[model] += [row.pk for row in batch]
+
+        def make_profile(position):
+            return ProfilesAndSubagencies(
+                client_id=self.rng.choice(self.client_ids),
+                supplier_id=self.rng.choice(self.supplier_ids),
+                division_id=self.rng.choice(ids[Division]) if self.rng.random() < 0.7 else None,
+                sign_id=self.rng.choice(ids[Sign]),
+                deposit_id=self.rng.choice(ids[Deposit]) if self.rng.random() < 0.7 else None,
+                corresponding_code=f"CC{self.rng.randint(1, 10 ** 6):06d}",
+            )
+
+        for batch in self.batches(profiles, make_profile):
+            with transaction.atomic():
+                ProfilesAndSubagencies.objects.bulk_create(batch)
+                # the display columns come from the related rows, which aren't loaded
+                ProfilesAndSubagencies.refresh_display_columns(
+                    ProfilesAndSubagencies.objects.filter(pk__in=[row.pk for row in batch])
+                )
+        return 3 * per_model + profiles
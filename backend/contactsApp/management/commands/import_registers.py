@@ -0,0 +1,61 @@
+import csv
+import time
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from contactsApp.masterdata import format_errors, import_rows, read_csv
+
+
+class Command(BaseCommand):
+    help = "Imports registers and their contacts from a CSV file, writing the rejected rows to a reject file"
+
+    def add_arguments(self, parser):
+        parser.add_argument("file", type=Path, help="CSV file with a header row")
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=1000,
+            help="Number of rows validated and inserted together",
+        )
+        parser.add_argument("--delimiter", default=",", help="CSV field delimiter")
+        parser.add_argument(
+            "--rejects",
+            type=Path,
+            help="Where to write the rejected rows, defaults to <file>.rejects.csv next to the file",
+        )
+
+    def handle(self, *args, **options):
+        path = options["file"]
+        if not path.is_file():
+            raise CommandError(f"File not found: {path}")
+        rejects_path = options["rejects"] or path.with_name(f"{path.stem}.rejects.csv")
+
+        start = time.perf_counter()
+        with open(path, newline="", encoding="utf-8-sig") as source, \
+                open(rejects_path, "w", newline="", encoding="utf-8") as rejects_file:
+            try:
+                rows = read_csv(source, options["delimiter"])
+            except ValueError as e:
+                raise CommandError(str(e))
+
+            # the rejected rows as read, with their line and errors
+            writer = csv.writer(rejects_file)
+            writer.writerow(["line", *rows.fieldnames, "errors"])
+
+            def on_reject(reject):
+                writer.writerow([reject.line, *(reject.row.get(field) for field in rows.fieldnames), format_errors(reject.errors)])
+
+            try:
+                result = import_rows(rows, batch_size=options["batch_size"], on_reject=on_reject)
+            except UnicodeDecodeError:
+                raise CommandError("The file is not UTF-8 encoded, the rows before the error were imported")
+
+        self.stdout.write(
+            f"{result.rows} rows: {result.registers} registers and {result.contacts} contacts created, "
+            f"{result.rejected} rejected in {time.perf_counter() - start:.2f}s"
+        )
+        if result.rejected:
+            self.stdout.write(self.style.WARNING(f"Rejected rows written to {rejects_path}"))
+        else:
+            rejects_path.unlink()
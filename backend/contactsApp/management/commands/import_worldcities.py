@@ -1,81 +1,155 @@
-import csv
+import time
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
+
+import django
 from django.conf import settings
 from django.db import transaction
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
+
+from contactsApp.caching import bump_model_version
+from contactsApp.geodata import (
+    GeoDataSet,
+    country_codes,
+    load_dataset,
+    save_cities,
+    save_countries,
+    save_regions,
+    source_readers,
+    stream_source,
+    sync_source,
+)
+from contactsApp.models import City, Country, Region
 
-from contactsApp.models import Country, City, Region
+# bundled source files, imported when no file is given
+DEFAULT_FILES = ["worldcities.csv", "zipcodes.it.csv"]
 
 
 class Command(BaseCommand):
+    help = "Imports countries, regions and cities from worldcities.csv and zipcodes.<country>.csv files"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "files",
+            nargs="*",
+            type=Path,
+            help="Source files to import, defaults to the bundled worldcities.csv and zipcodes.it.csv",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=1000,
+            help="Number of rows per INSERT statement",
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=1,
+            help="Number of processes parsing the source files in parallel",
+        )
+        parser.add_argument(
+            "--sync",
+            action="store_true",
+            help="Only apply the rows that changed since the last sync, deleting the removed ones",
+        )
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            help="Stream the files committing every CHUNK_SIZE rows, resuming an interrupted import",
+        )
+
     def handle(self, *args, **options):
         # path creation
         base_path = Path(settings.BASE_DIR) / "contactsApp/data"
 
+        paths = options["files"] or [base_path / filename for filename in DEFAULT_FILES]
+        for path in paths:
+            if not path.is_file():
+                raise CommandError(f"File not found: {path}")
+        try:
+            readers = source_readers(paths, country_codes(base_path / "worldcities.csv"))
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        try:
+            self.import_files(readers, paths, options)
+        finally:
+            # bulk_create sends no signals, the chunks committed by a failed import count too
+            for model in (Country, Region, City):
+                bump_model_version(model)
+
+    def import_files(self, readers, paths, options):
+        batch_size = options["batch_size"]
+        if options["sync"]:
+            for (name, reader), path in zip(readers, paths):
+                self.sync(name, path, reader, batch_size)
+            return
+
+        if options["chunk_size"]:
+            for (name, reader), path in zip(readers, paths):
+                self.stream(name, path, reader, options["chunk_size"], batch_size)
+            return
+
+        start = time.perf_counter()
+        dataset = GeoDataSet()
+        for parsed in self.parse(readers, options["workers"]):
+            dataset.merge(parsed)
+        self.log_phase("parse", dataset.rows, start)
+
         with transaction.atomic():
-            with (base_path / "worldcities.csv").open("r", encoding="utf-8") as csvfile:
-                reader = csv.DictReader(csvfile)
-
-                for row in reader:
-                    iso_code = row.get("code")
-
-                    # Skip italy, we'll add it manually later
-                    if iso_code == "ITA":
-                        continue
-
-                    country_name = row.get("country")
-                    province = row.get("province")
-                    city_name = row.get("name_en")
-
-                    country, _ = Country.objects.get_or_create(
-                        iso_code=iso_code,
-                        name=country_name,
-                    )
-                    
-                    region = None
-                    if province:
-                        region, _ = Region.objects.get_or_create(
-                            name=province,
-                            country=country,
-                        )
-
-                        City.objects.get_or_create(
-                            name=city_name,
-                            region=region,
-                            country=country
-                        )
-
-                    else:
-                        City.objects.get_or_create(
-                            name=city_name,
-                            country=country
-                        )
-                    
-                country, _ = Country.objects.get_or_create(
-                    iso_code="ITA",
-                    name="Italy",
-                )
-
-            with (base_path / "zipcodes.it.csv").open("r") as csvfile:
-                reader = csv.DictReader(csvfile)
-
-                for row in reader:
-                    province_code = row.get("province_code")
-                    province_name = row.get("province")
-
-                    city_name = row.get("place")
-                    postcode = row.get("zipcode")
-
-                    region, _ = Region.objects.get_or_create(
-                        name=province_name,
-                        country=country,
-                        code=province_code,
-                    )
-
-                    City.objects.get_or_create(
-                        name=city_name,
-                        region=region,
-                        postcode=postcode,
-                        country=country,
-                    )
-                    
+            start = time.perf_counter()
+            country_ids = save_countries(dataset.countries, batch_size)
+            self.log_phase("countries", len(country_ids), start)
+
+            start = time.perf_counter()
+            created, region_map = save_regions(dataset.regions, country_ids, batch_size)
+            self.log_phase("regions", created, start)
+
+            start = time.perf_counter()
+            created = save_cities(dataset.cities, country_ids, region_map, batch_size)
+            self.log_phase("cities", created, start)
+
+    def parse(self, readers, workers):
+        """
+        Returns the deduplicated GeoDataSet of each file, in the same order as the files
+        """
+        tasks = [reader for _, reader in readers]
+        if workers <= 1 or len(tasks) <= 1:
+            return map(load_dataset, tasks)
+
+        # workers only parse, the database is written by this process only
+        with ProcessPoolExecutor(max_workers=workers, initializer=django.setup) as executor:
+            return list(executor.map(load_dataset, tasks))
+
+    def sync(self, name, path, reader, batch_size):
+        start = time.perf_counter()
+        result = sync_source(name, path, reader(), batch_size)
+        elapsed = time.perf_counter() - start
+
+        if result.skipped:
+            self.stdout.write(f"{name}: unchanged, skipped")
+            return
+        self.stdout.write(
+            f"{name}: {result.inserted} inserted, {result.updated} updated, "
+            f"{result.deleted} deleted, {result.kept} kept (still in use) in {elapsed:.2f}s"
+        )
+
+    def stream(self, name, path, reader, chunk_size, batch_size):
+        start = time.perf_counter()
+        imported = created = 0
+        for chunk in stream_source(name, path, reader(), chunk_size, batch_size):
+            if not imported and chunk.offset > chunk.rows:
+                self.stdout.write(f"{name}: resuming after row {chunk.offset - chunk.rows}")
+            imported += chunk.rows
+            created += chunk.created
+            elapsed = time.perf_counter() - start
+            self.stdout.write(
+                f"{name}: {chunk.offset} rows committed, {imported / elapsed:.0f} rows/s"
+            )
+
+        elapsed = time.perf_counter() - start
+        self.stdout.write(f"{name}: {imported} rows, {created} cities created in {elapsed:.2f}s")
+
+    def log_phase(self, phase, count, start):
+        elapsed = time.perf_counter() - start
+        self.stdout.write(f"{phase:<10} {count:>8} rows in {elapsed:.2f}s")
@@ -0,0 +1,165 @@
+import asyncio
+import json
+import time
+from itertools import cycle
+from pathlib import Path
+from urllib.parse import urlencode
+
+from django.core.handlers.asgi import ASGIHandler
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client, override_settings
+from django.utils import timezone
+
+from contactsApp.benchmarks import allowed_host, endpoints, page, scenarios
+from contactsApp.management.commands.benchmark_api import commit, percentile
+
+# scenarios of the lookups, typeahead searches and the selected row
+LOOKUP_SCENARIOS = ("search", "by key")
+# endpoints of the lookup dropdowns, loaded by default
+LOOKUP_ENDPOINTS = ("cities", "regions", "countries", "branches", "clients", "suppliers", "signes", "deposits")
+NO_CACHE = {"default": {"BACKEND": "django.core.cache.backends.dummy.DummyCache"}}
+
+
+def lookup_requests(prefixes):
+    """
+    [(path, params)] of the lookups of the endpoints, for each row of their first page
+    """
+    client = Client(HTTP_HOST=allowed_host())
+    requests = []
+    for prefix, viewset, path in endpoints():
+        if prefix not in (prefixes or LOOKUP_ENDPOINTS):
+            continue
+        response = client.get(path, page())
+        if response.status_code != 200:
+            raise CommandError(f"{path} returned {response.status_code}")
+        for sample in response.json()["results"]:
+            for name, scenario in scenarios(viewset, sample).items():
+                if name in LOOKUP_SCENARIOS:
+                    # these scenarios don't look at the responses
+                    requests += [request for request in scenario(path, sample) if request not in requests]
+    return requests
+
+
+async def asgi_get(handler, path, params):
+    """
+    Sends a GET through the ASGI handler as a server would, returns the status code
+    """
+    host = allowed_host()
+    query = urlencode(params)
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "GET",
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "query_string": query.encode(),
+        "root_path": "",
+        "headers": [(b"host", host.encode()), (b"accept", b"application/json")],
+        "client": ("127.0.0.1", 0),
+        "server": (host, 80),
+    }
+    sent = asyncio.Event()
+    finished = asyncio.Event()
+    status = None
+
+    async def receive():
+        if not sent.is_set():
+            sent.set()
+            return {"type": "http.request", "body": b"", "more_body": False}
+        # the client stays connected until the response is sent
+        await finished.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        nonlocal status
+        if message["type"] == "http.response.start":
+            status = message["status"]
+        elif not message.get("more_body"):
+            finished.set()
+
+    await handler(scope, receive, send)
+    return status
+
+
+class Command(BaseCommand):
+    help = (
+        "Sends concurrent typeahead requests to the lookup endpoints through the ASGI handler, "
+        "and reports the throughput and latency"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--concurrency", type=int, default=20, help="Requests in flight at the same time")
+        parser.add_argument("--requests", type=int, default=1000, help="Requests to send")
+        parser.add_argument(
+            "--endpoint",
+            action="append",
+            help="Router prefix to load, can be repeated (default: the lookup endpoints)",
+        )
+        parser.add_argument(
+            "--warm-cache",
+            action="store_true",
+            help="Use the API caches, by default they are replaced with a dummy cache so every request reads the database",
+        )
+        parser.add_argument("--output", type=Path, help="Write the results to this JSON file")
+
+    def handle(self, *args, **options):
+        if options["concurrency"] < 1 or options["requests"] < 1:
+            raise CommandError("--concurrency and --requests must be positive")
+        requests = lookup_requests(options["endpoint"])
+        if not requests:
+            raise CommandError("No lookup requests, the endpoints have no rows")
+        self.stdout.write(f"{len(requests)} distinct requests, {options['concurrency']} concurrent")
+
+        caches = {} if options["warm_cache"] else {"CACHES": NO_CACHE}
+        with override_settings(**caches):
+            # first run not measured
+            asyncio.run(self.load(requests, options["concurrency"], options["concurrency"]))
+            result = asyncio.run(self.load(requests, options["requests"], options["concurrency"]))
+        self.stdout.write(
+            f"{result['requests_per_second']:.0f} requests/s, p50 {result['p50_ms']:.1f}ms "
+            f"p95 {result['p95_ms']:.1f}ms"
+        )
+        if result["errors"]:
+            self.stdout.write(self.style.ERROR(f"{result['errors']} requests failed"))
+
+        if options["output"]:
+            report = {
+                "commit": commit(),
+                "date": timezone.now().isoformat(),
+                "concurrency": options["concurrency"],
+                "warm_cache": options["warm_cache"],
+                "requests": requests,
+                "result": result,
+            }
+            options["output"].write_text(json.dumps(report, indent=2))
+            self.stdout.write(f"Results written to {options['output']}")
+
+    async def load(self, requests, total, concurrency):
+        handler = ASGIHandler()
+        queue = cycle(requests)
+        measures = []
+        sent = 0
+
+        async def worker():
+            nonlocal sent
+            while sent < total:
+                sent += 1
+                path, params = next(queue)
+                start = time.perf_counter()
+                status = await asgi_get(handler, path, params)
+                measures.append(((time.perf_counter() - start) * 1000, status))
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+
+        times = [elapsed_ms for elapsed_ms, _ in measures]
+        return {
+            "requests": len(measures),
+            "errors": sum(1 for _, status in measures if status != 200),
+            "requests_per_second": round(len(measures) / elapsed, 1),
+            "p50_ms": round(percentile(times, 50), 3),
+            "p95_ms": round(percentile(times, 95), 3),
+        }
@@ -0,0 +1,24 @@
+import time
+
+from django.apps import apps
+from django.core.management.base import BaseCommand
+
+from contactsApp.models import DisplayColumnsModel, Register
+
+
+class Command(BaseCommand):
+    help = "Recomputes the stored *_display columns and the register role flags from the related rows"
+
+    def handle(self, *args, **options):
+        for model in apps.get_app_config("contactsApp").get_models():
+            if not issubclass(model, DisplayColumnsModel):
+                continue
+            start = time.perf_counter()
+            updated = model.refresh_display_columns()
+            elapsed = time.perf_counter() - start
+            self.stdout.write(f"{model._meta.verbose_name_plural}: {updated} rows in {elapsed:.2f}s")
+
+        start = time.perf_counter()
+        updated = Register.refresh_role_columns()
+        elapsed = time.perf_counter() - start
+        self.stdout.write(f"register roles: {updated} rows in {elapsed:.2f}s")
@@ -0,0 +1,65 @@
+import sqlite3
+import time
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from contactsApp.routing import read_databases
+
+
+def replicate(connection, path):
+    """
+    Copies the database of the connection to the SQLite file at path, readers of the file see
+    either the old or the new copy
+    """
+    connection.ensure_connection()
+    target = sqlite3.connect(path)
+    try:
+        connection.connection.backup(target)
+    finally:
+        target.close()
+
+
+class Command(BaseCommand):
+    help = (
+        "Copies the default SQLite database to the files of the READ_DATABASES aliases, a stand-in "
+        "for replication to try the replica routing locally (see backend/settings_replicas.py)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--database",
+            action="append",
+            help="Alias to copy the database to, can be repeated (default: READ_DATABASES)",
+        )
+        parser.add_argument(
+            "--interval",
+            type=float,
+            help="Copy again every INTERVAL seconds until interrupted, the lag of the replicas",
+        )
+
+    def handle(self, *args, **options):
+        source = connections["default"]
+        if source.vendor != "sqlite":
+            raise CommandError("Only SQLite databases can be copied")
+        targets = {}
+        for alias in options["database"] or read_databases():
+            if alias not in connections:
+                raise CommandError(f"Unknown database {alias}")
+            path = Path(connections[alias].settings_dict["NAME"])
+            if path == Path(source.settings_dict["NAME"]):
+                # the same file, nothing to copy
+                continue
+            targets[alias] = path
+        if not targets:
+            raise CommandError("No database stored in another file than default")
+
+        while True:
+            for alias, path in targets.items():
+                start = time.perf_counter()
+                replicate(source, path)
+                self.stdout.write(f"{alias}: copied to {path} in {time.perf_counter() - start:.2f}s")
+            if options["interval"] is None:
+                return
+            time.sleep(options["interval"])
@@ -0,0 +1,266 @@
+"""
+Parsing, validation and bulk loading of registers and their contacts from CSV files.
+
+Each row is a register, optionally with one of its contacts (the contact_* and address columns).
+Rows with the email of a register already read from the file add their contact to that register.
+The register email checks of the API go through registered_emails as well.
+"""
+import csv
+from collections import defaultdict, namedtuple
+from itertools import islice
+
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.db.models.functions import Lower
+
+from .caching import bump_model_version
+from .models import Branch, City, Contact, Country, Region, Register, RegistryType
+
+REGISTER_COLUMNS = ["registry_type", "last_name", "first_name", "email", "phone", "phone_ext", "mobile", "vat_number"]
+# csv column -> Contact field
+CONTACT_COLUMNS = {
+    "contact_name": "name",
+    "contact_email": "email",
+    "contact_phone": "phone",
+    "contact_phone_ext": "phone_ext",
+    "address": "address",
+}
+LOOKUP_COLUMNS = ["branch", "country", "region", "city", "postcode"]
+COLUMNS = REGISTER_COLUMNS + list(CONTACT_COLUMNS) + LOOKUP_COLUMNS
+
+ImportResult = namedtuple("ImportResult", ["rows", "registers", "contacts", "rejected"])
+# line of the source file, the row as read and {column: [messages]}
+Reject = namedtuple("Reject", ["line", "row", "errors"])
+
+
+def key(value):
+    return (value or "").strip().casefold()
+
+
+def email_key(value):
+    # lower() as the LOWER(email) of the database, casefold() would differ on some letters
+    return (value or "").strip().lower()
+
+
+def registered_emails(emails, exclude_id=None, batch_size=500):
+    """
+    Returns the lowercase emails among the given ones which are used by a register (other than
+    exclude_id), looked up through the lower(email) index with batch_size emails per query
+    """
+    keys = sorted({email_key(email) for email in emails if email})
+    queryset = Register.objects.annotate(email_lower=Lower("email")).order_by()
+    if exclude_id is not None:
+        queryset = queryset.exclude(id=exclude_id)
+
+    found = set()
+    for start in range(0, len(keys), batch_size):
+        batch = keys[start:start + batch_size]
+        found.update(queryset.filter(email_lower__in=batch).values_list("email_lower", flat=True))
+    return found
+
+
+def by_name_and_code(queryset):
+    rows = {}
+    for row in queryset:
+        for value in (row.code, row.name):
+            if value:
+                rows.setdefault(key(value), row)
+    return rows
+
+
+class Lookups:
+    """
+    Maps from the natural keys used in the files (names, codes, ISO codes) to the reference rows,
+    loaded once per import
+    """
+
+    def __init__(self):
+        self.registry_types = by_name_and_code(RegistryType.objects.all())
+        self.branches = by_name_and_code(Branch.objects.all())
+
+        self.countries = {}
+        for country in Country.objects.all():
+            self.countries.setdefault(key(country.iso_code), country)
+            self.countries.setdefault(key(country.name), country)
+
+        self.regions = {}
+        for region in Region.objects.all():
+            for value in (region.code, region.name):
+                if value:
+                    self.regions.setdefault((region.country_id, key(value)), region)
+
+        self.cities = defaultdict(list)
+        for city in City.objects.only("id", "name", "postcode", "region_id", "country_id"):
+            self.cities[(city.country_id, key(city.name))].append(city)
+
+    def city(self, country, region, name, postcode):
+        """
+        Returns (city, error message)
+        """
+        candidates = self.cities.get((country.pk, key(name)), [])
+        if region is not None:
+            candidates = [city for city in candidates if city.region_id == region.pk]
+        if postcode:
+            candidates = [city for city in candidates if city.postcode == postcode]
+        if not candidates:
+            return None, f'City "{name}" not found.'
+        if len(candidates) > 1:
+            return None, f'City "{name}" matches {len(candidates)} cities, set the region or the postcode.'
+        return candidates[0], None
+
+
+def nullable(model, field, value):
+    # empty cells are stored as NULL where the column allows it, as the API does
+    value = (value or "").strip()
+    if not value and model._meta.get_field(field).null:
+        return None
+    return value
+
+
+def validation_errors(instance, columns, exclude):
+    """
+    Field errors of the instance keyed by csv column
+    """
+    try:
+        instance.clean_fields(exclude=exclude)
+    except ValidationError as e:
+        return {columns.get(field, field): messages for field, messages in e.message_dict.items()}
+    return {}
+
+
+def parse_row(row, lookups):
+    """
+    Returns (Register, Contact or None, errors) for a csv row, related rows resolved but nothing saved
+    """
+    errors = {}
+
+    register = Register(**{column: nullable(Register, column, row.get(column)) for column in REGISTER_COLUMNS[1:]})
+    registry_type = lookups.registry_types.get(key(row.get("registry_type")))
+    if registry_type is None:
+        errors["registry_type"] = [f'Registry type "{row.get("registry_type") or ""}" not found.']
+    else:
+        register.registry_type = registry_type
+        # bulk_create doesn't call save()
+        register.refresh_roles()
+    errors.update(validation_errors(register, {}, exclude=["registry_type"]))
+
+    if not any((row.get(column) or "").strip() for column in [*CONTACT_COLUMNS, *LOOKUP_COLUMNS]):
+        return register, None, errors
+
+    contact = Contact(
+        **{field: nullable(Contact, field, row.get(column)) for column, field in CONTACT_COLUMNS.items()}
+    )
+    branch = lookups.branches.get(key(row.get("branch")))
+    if branch is None:
+        errors["branch"] = [f'Branch "{row.get("branch") or ""}" not found.']
+    else:
+        contact.branch = branch
+
+    country = lookups.countries.get(key(row.get("country")))
+    if country is None:
+        errors["country"] = [f'Country "{row.get("country") or ""}" not found.']
+    else:
+        contact.country = country
+        region = None
+        if key(row.get("region")):
+            region = lookups.regions.get((country.pk, key(row.get("region"))))
+            if region is None:
+                errors["region"] = [f'Region "{row["region"]}" not found in {country.name}.']
+        contact.region = region
+        if "region" not in errors:
+            city, error = lookups.city(country, region, row.get("city"), (row.get("postcode") or "").strip())
+            if error:
+                errors["city"] = [error]
+            else:
+                contact.city = city
+
+    contact_columns = {field: column for column, field in CONTACT_COLUMNS.items()}
+    errors.update(
+        validation_errors(contact, contact_columns, exclude=["register", "branch", "country", "region", "city"])
+    )
+    return register, contact, errors
+
+
+def import_rows(rows, lookups=None, batch_size=1000, on_reject=None):
+    """
+    Validates and inserts the rows (dicts keyed by column) in batches of batch_size, each batch in
+    its own transaction. Invalid rows are passed to on_reject(Reject) and skipped.
+    """
+    lookups = lookups or Lookups()
+    # ids of the registers created by this import, by email
+    registers = {}
+    total = created_registers = created_contacts = rejected = 0
+
+    rows = enumerate(rows, start=2)  # line 1 is the header
+    while True:
+        batch = list(islice(rows, batch_size))
+        if not batch:
+            break
+        total += len(batch)
+
+        parsed = []
+        for line, row in batch:
+            register, contact, errors = parse_row(row, lookups)
+            parsed.append((line, row, register, contact, errors))
+
+        # emails already used by registers not created by this import
+        emails = {email_key(register.email) for _, _, register, _, _ in parsed} - set(registers)
+        existing = registered_emails(emails)
+
+        new_registers = {}
+        contacts = []
+        for line, row, register, contact, errors in parsed:
+            email = email_key(register.email)
+            if email in existing and email not in registers:
+                errors.setdefault("email", []).append("A register with this email already exists.")
+            if errors:
+                rejected += 1
+                if on_reject is not None:
+                    on_reject(Reject(line, row, errors))
+                continue
+
+            # rows of a register already read only add their contact
+            if email in registers:
+                register = None
+            else:
+                register = new_registers.setdefault(email, register)
+            if contact is not None:
+                if register is None:
+                    contact.register_id = registers[email]
+                else:
+                    contact.register = register
+                contact.refresh_display()
+                contacts.append(contact)
+
+        with transaction.atomic():
+            Register.objects.bulk_create(new_registers.values(), batch_size=batch_size)
+            # bulk_create takes the register ids assigned by the insert above
+            Contact.objects.bulk_create(contacts, batch_size=batch_size)
+
+        registers.update((email, register.pk) for email, register in new_registers.items())
+        created_registers += len(new_registers)
+        created_contacts += len(contacts)
+
+    # bulk_create sends no signals
+    if created_registers:
+        bump_model_version(Register)
+    if created_contacts:
+        bump_model_version(Contact)
+    return ImportResult(total, created_registers, created_contacts, rejected)
+
+
+def read_csv(file, delimiter=","):
+    """
+    Rows of a csv file opened in text mode, checking the header has the required columns
+    """
+    reader = csv.DictReader(file, delimiter=delimiter)
+    fields = [key(field) for field in reader.fieldnames or []]
+    missing = [column for column in ("registry_type", "last_name", "email") if column not in fields]
+    if missing:
+        raise ValueError(f"Missing columns: {', '.join(missing)}")
+    reader.fieldnames = fields
+    return reader
+
+
+def format_errors(errors):
+    return "; ".join(f"{column}: {' '.join(messages)}" for column, messages in errors.items())
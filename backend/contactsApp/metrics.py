@@ -0,0 +1,281 @@
+"""
+Per request cost of the API: time, database queries, serialisation and response size, recorded
+per ViewSet action in fixed bucket histograms and served by /api/_metrics.
+
+Enabled with API_METRICS = True. The histograms take constant memory and are kept per process,
+each worker reports its own requests. With API_METRICS_SLOW_QUERY set (milliseconds), the SQL of
+the slowest query of a request taking longer than that is logged to the contactsApp.metrics logger.
+Its parameters hold user data (emails, names, searches) and are only logged with
+API_METRICS_LOG_PARAMS set, which API_METRICS_EXPLAIN also needs to add the plan, as the plans show
+the parameter values. DELETE /api/_metrics is limited to admin users.
+"""
+import bisect
+import logging
+import threading
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import DatabaseError, connections
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.exceptions import NotFound
+from rest_framework.permissions import IsAdminUser
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+logger = logging.getLogger(__name__)
+
+
+def geometric(start, stop, factor):
+    bounds = []
+    bound = start
+    while bound < stop:
+        bounds.append(round(bound, 3))
+        bound *= factor
+    return bounds
+
+
+# upper bounds of the buckets, values above the last one go in an overflow bucket
+TIME_BUCKETS = geometric(0.1, 60000, 1.25)  # milliseconds
+QUERY_BUCKETS = [0, 1, 2, 3, 4, 5, 6, 8, 10, 12, 15, 20, 30, 50, 100, 200, 500, 1000]
+SIZE_BUCKETS = geometric(256, 64 * 1024 * 1024, 2)  # bytes
+PERCENTILES = [50, 95, 99]
+
+
+class Histogram:
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.total = 0
+        self.max = 0
+
+    def add(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+
+    def percentile(self, percent):
+        """
+        Upper bound of the bucket holding the given percentile, capped to the largest value
+        """
+        rank = self.count * percent / 100
+        seen = 0
+        for position, count in enumerate(self.counts):
+            seen += count
+            if count and seen >= rank:
+                if position < len(self.bounds):
+                    return min(self.bounds[position], self.max)
+                break
+        return self.max
+
+    def summary(self):
+        result = {"count": self.count, "mean": round(self.total / self.count, 3) if self.count else 0}
+        for percent in PERCENTILES:
+            result[f"p{percent}"] = round(self.percentile(percent), 3)
+        result["max"] = round(self.max, 3)
+        return result
+
+
+class ViewMetrics:
+    def __init__(self):
+        self.requests = 0
+        self.errors = 0
+        self.time = Histogram(TIME_BUCKETS)
+        self.db_time = Histogram(TIME_BUCKETS)
+        self.queries = Histogram(QUERY_BUCKETS)
+        self.serialization_time = Histogram(TIME_BUCKETS)
+        self.size = Histogram(SIZE_BUCKETS)
+
+    def summary(self):
+        return {
+            "requests": self.requests,
+            "errors": self.errors,
+            "time": self.time.summary(),
+            "db_time": self.db_time.summary(),
+            "queries": self.queries.summary(),
+            "serialization_time": self.serialization_time.summary(),
+            "size": self.size.summary(),
+        }
+
+
+class Registry:
+    """
+    Metrics of the process by view name
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.views = {}
+        self.since = timezone.now()
+
+    def record(self, name, measure, status_code):
+        with self.lock:
+            metrics = self.views.get(name)
+            if metrics is None:
+                metrics = self.views[name] = ViewMetrics()
+            metrics.requests += 1
+            if status_code >= 500:
+                metrics.errors += 1
+            metrics.time.add(measure.time)
+            metrics.db_time.add(measure.db_time)
+            metrics.queries.add(measure.queries)
+            metrics.serialization_time.add(measure.serialization_time)
+            if measure.size is not None:
+                metrics.size.add(measure.size)
+
+    def summary(self):
+        with self.lock:
+            return {
+                "since": self.since,
+                "views": {name: metrics.summary() for name, metrics in sorted(self.views.items())},
+            }
+
+
+registry = Registry()
+
+
+def view_name(request):
+    """
+    "<ViewSet>.<action>" of the DRF view which handled the request, None for other views
+    """
+    match = getattr(request, "resolver_match", None)
+    view_class = getattr(match.func, "cls", None) if match else None
+    if view_class is None or view_class is MetricsView:
+        return None
+    actions = getattr(match.func, "actions", None) or {}
+    return f"{view_class.__name__}.{actions.get(request.method.lower(), request.method.lower())}"
+
+
+class Measure:
+    """
+    Costs of one request, times in milliseconds
+    """
+
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0
+        self.slowest = None  # (milliseconds, alias, sql, params)
+        self.view_start = self.view_end = None
+        self.view_db_time = 0
+        self.time = 0
+        self.serialization_time = 0
+        self.size = None
+
+    def execute_wrapper(self, alias):
+        def wrapper(execute, sql, params, many, context):
+            start = time.perf_counter()
+            try:
+                return execute(sql, params, many, context)
+            finally:
+                elapsed = (time.perf_counter() - start) * 1000
+                self.queries += 1
+                self.db_time += elapsed
+                if self.slowest is None or elapsed > self.slowest[0]:
+                    self.slowest = (elapsed, alias, sql, params)
+        return wrapper
+
+
+def explain(alias, sql, params):
+    connection = connections[alias]
+    prefix = connection.ops.explain_query_prefix()
+    with connection.cursor() as cursor:
+        cursor.execute(f"{prefix} {sql}", params)
+        return "\n".join(" ".join(str(column) for column in row) for row in cursor.fetchall())
+
+
+class MetricsMiddleware:
+    """
+    Measures the requests handled by the API views. Serialisation time is the time spent in the
+    view outside the database (mostly serializer fields for the lists) plus the rendering of the
+    response. Streamed responses are timed until the stream starts and their size isn't recorded.
+    """
+
+    def __init__(self, get_response):
+        if not getattr(settings, "API_METRICS", False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.slow_query = getattr(settings, "API_METRICS_SLOW_QUERY", None)
+        self.log_params = getattr(settings, "API_METRICS_LOG_PARAMS", False)
+        self.explain = self.log_params and getattr(settings, "API_METRICS_EXPLAIN", False)
+
+    def __call__(self, request):
+        measure = request._metrics = Measure()
+        start = time.perf_counter()
+        with ExitStack() as stack:
+            for alias in connections:
+                stack.enter_context(connections[alias].execute_wrapper(measure.execute_wrapper(alias)))
+            response = self.get_response(request)
+        end = time.perf_counter()
+
+        name = view_name(request)
+        if name is None or measure.view_start is None:
+            return response
+
+        measure.time = (end - start) * 1000
+        view_end = measure.view_end or end
+        measure.serialization_time = (view_end - measure.view_start) * 1000 - measure.view_db_time
+        if measure.view_end is not None:
+            # rendering, after the view returned
+            measure.serialization_time += (end - view_end) * 1000 - (measure.db_time - measure.view_db_time)
+        measure.serialization_time = max(measure.serialization_time, 0)
+        if not response.streaming:
+            measure.size = len(response.content)
+        registry.record(name, measure, response.status_code)
+
+        if self.slow_query is not None and measure.slowest and measure.slowest[0] >= self.slow_query:
+            self.log_slow_query(name, measure.slowest)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request._metrics.view_start = time.perf_counter()
+
+    def process_template_response(self, request, response):
+        # DRF responses are rendered after this
+        measure = request._metrics
+        measure.view_end = time.perf_counter()
+        measure.view_db_time = measure.db_time
+        return response
+
+    def log_slow_query(self, name, slowest):
+        elapsed, alias, sql, params = slowest
+        message = f"{name}: slowest query took {elapsed:.1f}ms\n{sql}"
+        if self.log_params:
+            message += f"\nparams: {params!r}"
+        # only plain reads are explained again, the plan is computed without running the query
+        if self.explain and sql.lstrip()[:6].upper() == "SELECT":
+            try:
+                message += "\n" + explain(alias, sql, params)
+            except DatabaseError as e:
+                message += f"\nEXPLAIN failed: {e}"
+        logger.warning(message)
+
+
+class MetricsView(APIView):
+    """
+    GET returns the metrics of this process by ViewSet action, DELETE (admin users only) starts them over
+    """
+
+    def get_permissions(self):
+        if self.request.method == "DELETE":
+            return [IsAdminUser()]
+        return super().get_permissions()
+
+    def initial(self, request, *args, **kwargs):
+        if not getattr(settings, "API_METRICS", False):
+            raise NotFound("API_METRICS is disabled")
+        super().initial(request, *args, **kwargs)
+
+    def get(self, request):
+        return Response(registry.summary())
+
+    def delete(self, request):
+        with registry.lock:
+            registry.reset()
+        return Response(status=status.HTTP_204_NO_CONTENT)
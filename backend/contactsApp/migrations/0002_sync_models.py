@@ -0,0 +1,180 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:36
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contactsApp', '0001_initial'),
+    ]
+
+    operations = [
+        # the foreign keys added below reference the new primary key of country
+        migrations.AddField(
+            model_name='country',
+            name='code',
+            field=models.CharField(blank=True, max_length=20, null=True),
+        ),
+        migrations.AddField(
+            model_name='country',
+            name='id',
+            field=models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID'),
+        ),
+        migrations.AlterField(
+            model_name='country',
+            name='iso_code',
+            field=models.CharField(max_length=3, unique=True),
+        ),
+        migrations.CreateModel(
+            name='Branch',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50)),
+                ('code', models.CharField(blank=True, max_length=20, null=True)),
+            ],
+            options={
+                'ordering': ['name'],
+                'abstract': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='RegistryType',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50)),
+                ('code', models.CharField(blank=True, max_length=20, null=True)),
+            ],
+            options={
+                'ordering': ['name'],
+                'abstract': False,
+            },
+        ),
+        migrations.RemoveField(
+            model_name='contact',
+            name='sede',
+        ),
+        migrations.AlterModelOptions(
+            name='city',
+            options={'ordering': ['name', 'postcode', 'region', 'country']},
+        ),
+        migrations.AddField(
+            model_name='city',
+            name='country',
+            field=models.ForeignKey(default=None, on_delete=django.db.models.deletion.CASCADE, to='contactsApp.country'),
+            preserve_default=False,
+        ),
+        migrations.AlterField(
+            model_name='city',
+            name='region',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='contactsApp.region'),
+        ),
+        migrations.AlterField(
+            model_name='contact',
+            name='phone_ext',
+            field=models.CharField(blank=True, max_length=20, null=True),
+        ),
+        migrations.AlterField(
+            model_name='contact',
+            name='region',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, to='contactsApp.region'),
+        ),
+        migrations.AlterField(
+            model_name='region',
+            name='code',
+            field=models.CharField(blank=True, max_length=20, null=True),
+        ),
+        migrations.AlterField(
+            model_name='register',
+            name='first_name',
+            field=models.CharField(blank=True, max_length=50, null=True),
+        ),
+        migrations.AlterField(
+            model_name='register',
+            name='mobile',
+            field=models.CharField(blank=True, max_length=20, null=True),
+        ),
+        migrations.AlterField(
+            model_name='register',
+            name='phone',
+            field=models.CharField(blank=True, max_length=20, null=True),
+        ),
+        migrations.AlterField(
+            model_name='register',
+            name='phone_ext',
+            field=models.CharField(blank=True, max_length=20, null=True),
+        ),
+        migrations.AlterField(
+            model_name='register',
+            name='vat_number',
+            field=models.CharField(blank=True, max_length=20, null=True),
+        ),
+        migrations.AddField(
+            model_name='contact',
+            name='branch',
+            field=models.ForeignKey(default=None, on_delete=django.db.models.deletion.CASCADE, to='contactsApp.branch'),
+            preserve_default=False,
+        ),
+        migrations.CreateModel(
+            name='Deposit',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50)),
+                ('code', models.CharField(blank=True, max_length=20, null=True)),
+                ('supplier', models.ForeignKey(limit_choices_to={'registry_type__name__in': ['Fornitore', 'Cliente/Fornitore']}, on_delete=django.db.models.deletion.CASCADE, related_name='supplier_deposits', to='contactsApp.register')),
+            ],
+            options={
+                'ordering': ['name'],
+                'abstract': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='Division',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50)),
+                ('code', models.CharField(blank=True, max_length=20, null=True)),
+                ('client', models.ForeignKey(limit_choices_to={'registry_type__name__in': ['Cliente', 'Cliente/Fornitore']}, on_delete=django.db.models.deletion.CASCADE, related_name='client_division', to='contactsApp.register')),
+                ('supplier', models.ForeignKey(limit_choices_to={'registry_type__name__in': ['Fornitore', 'Cliente/Fornitore']}, on_delete=django.db.models.deletion.CASCADE, related_name='supplier_division', to='contactsApp.register')),
+            ],
+            options={
+                'ordering': ['name'],
+                'abstract': False,
+            },
+        ),
+        migrations.AddField(
+            model_name='register',
+            name='registry_type',
+            field=models.ForeignKey(default=None, on_delete=django.db.models.deletion.CASCADE, to='contactsApp.registrytype'),
+            preserve_default=False,
+        ),
+        migrations.CreateModel(
+            name='Sign',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50)),
+                ('code', models.CharField(blank=True, max_length=20, null=True)),
+                ('supplier', models.ForeignKey(limit_choices_to={'registry_type__name__in': ['Fornitore', 'Cliente/Fornitore']}, on_delete=django.db.models.deletion.CASCADE, related_name='supplier_signes', to='contactsApp.register')),
+            ],
+            options={
+                'ordering': ['name'],
+                'abstract': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='ProfilesAndSubagencies',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('corresponding_code', models.CharField(max_length=50)),
+                ('client', models.ForeignKey(limit_choices_to={'registry_type__name__in': ['Cliente', 'Cliente/Fornitore']}, on_delete=django.db.models.deletion.CASCADE, related_name='client_profiles', to='contactsApp.register')),
+                ('deposit', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='contactsApp.deposit')),
+                ('division', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='contactsApp.division')),
+                ('supplier', models.ForeignKey(limit_choices_to={'registry_type__name__in': ['Fornitore', 'Cliente/Fornitore']}, on_delete=django.db.models.deletion.CASCADE, related_name='supplier_profiles', to='contactsApp.register')),
+                ('sign', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='contactsApp.sign')),
+            ],
+        ),
+        migrations.DeleteModel(
+            name='Sede',
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:36
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contactsApp', '0002_sync_models'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GeoImportManifest',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source', models.CharField(max_length=255, unique=True)),
+                ('checksum', models.CharField(max_length=64)),
+                ('imported_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='GeoImportRow',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=100)),
+                ('fingerprint', models.CharField(max_length=40)),
+                ('city', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='contactsApp.city')),
+                ('manifest', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='rows', to='contactsApp.geoimportmanifest')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('manifest', 'key'), name='unique_geo_import_row')],
+            },
+        ),
+    ]
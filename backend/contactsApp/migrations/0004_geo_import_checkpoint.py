@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contactsApp', '0003_geo_import_manifest'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GeoImportCheckpoint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source', models.CharField(max_length=255, unique=True)),
+                ('checksum', models.CharField(max_length=64)),
+                ('offset', models.PositiveBigIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,107 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:36
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce, Concat
+
+# display columns of each model as (foreign key, first field, second field), see DisplayColumnsModel
+DISPLAY_FIELDS = {
+    "contact": {
+        "branch_display": ("branch", "code", "name"),
+        "country_display": ("country", "iso_code", "name"),
+        "region_display": ("region", "code", "name"),
+        "city_display": ("city", "postcode", "name"),
+    },
+    "division": {
+        "supplier_display": ("supplier", "last_name", "first_name"),
+    },
+    "profilesandsubagencies": {
+        "client_display": ("client", "last_name", "first_name"),
+        "supplier_display": ("supplier", "last_name", "first_name"),
+        "division_display": ("division", "code", "name"),
+        "sign_display": ("sign", "code", "name"),
+        "deposit_display": ("deposit", "code", "name"),
+    },
+}
+
+
+def refresh_display_columns(apps, schema_editor):
+    """
+    Fills the display columns of the existing rows, as DisplayColumnsModel.refresh_display_columns
+    """
+    for model_name, display_fields in DISPLAY_FIELDS.items():
+        model = apps.get_model("contactsApp", model_name)
+        columns = {}
+        for column, (foreign_key, first, second) in display_fields.items():
+            related = model._meta.get_field(foreign_key).related_model
+            value = related.objects.filter(pk=OuterRef(foreign_key)).values(
+                value=Concat(
+                    Coalesce(first, Value("")),
+                    Value(" - "),
+                    Coalesce(second, Value("")),
+                    output_field=models.CharField(),
+                )
+            )
+            columns[column] = Coalesce(Subquery(value), Value(" - "))
+        model.objects.using(schema_editor.connection.alias).update(**columns)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contactsApp', '0004_geo_import_checkpoint'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='contact',
+            name='branch_display',
+            field=models.CharField(db_index=True, default='', editable=False, max_length=255),
+        ),
+        migrations.AddField(
+            model_name='contact',
+            name='city_display',
+            field=models.CharField(db_index=True, default='', editable=False, max_length=255),
+        ),
+        migrations.AddField(
+            model_name='contact',
+            name='country_display',
+            field=models.CharField(db_index=True, default='', editable=False, max_length=255),
+        ),
+        migrations.AddField(
+            model_name='contact',
+            name='region_display',
+            field=models.CharField(db_index=True, default='', editable=False, max_length=255),
+        ),
+        migrations.AddField(
+            model_name='division',
+            name='supplier_display',
+            field=models.CharField(db_index=True, default='', editable=False, max_length=255),
+        ),
+        migrations.AddField(
+            model_name='profilesandsubagencies',
+            name='client_display',
+            field=models.CharField(db_index=True, default='', editable=False, max_length=255),
+        ),
+        migrations.AddField(
+            model_name='profilesandsubagencies',
+            name='deposit_display',
+            field=models.CharField(db_index=True, default='', editable=False, max_length=255),
+        ),
+        migrations.AddField(
+            model_name='profilesandsubagencies',
+            name='division_display',
+            field=models.CharField(db_index=True, default='', editable=False, max_length=255),
+        ),
+        migrations.AddField(
+            model_name='profilesandsubagencies',
+            name='sign_display',
+            field=models.CharField(db_index=True, default='', editable=False, max_length=255),
+        ),
+        migrations.AddField(
+            model_name='profilesandsubagencies',
+            name='supplier_display',
+            field=models.CharField(db_index=True, default='', editable=False, max_length=255),
+        ),
+        migrations.RunPython(refresh_display_columns, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,102 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:36
+
+import django.db.models.functions.text
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contactsApp', '0005_display_columns'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='city',
+            options={'ordering': ['name', 'postcode', 'region_id', 'country_id']},
+        ),
+        migrations.AddIndex(
+            model_name='branch',
+            index=models.Index(fields=['name'], name='branch_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='city',
+            index=models.Index(fields=['name', 'postcode', 'region', 'country'], name='city_ordering_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='city',
+            index=models.Index(fields=['country', 'name', 'postcode', 'region'], name='city_country_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='city',
+            index=models.Index(fields=['region', 'name', 'postcode', 'country'], name='city_region_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='contact',
+            index=models.Index(fields=['name'], name='contact_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='contact',
+            index=models.Index(fields=['register', 'name'], name='contact_register_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='country',
+            index=models.Index(fields=['name'], name='country_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='deposit',
+            index=models.Index(fields=['name'], name='deposit_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='deposit',
+            index=models.Index(fields=['supplier', 'name'], name='deposit_supplier_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='division',
+            index=models.Index(fields=['name'], name='division_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='division',
+            index=models.Index(fields=['client', 'name'], name='division_client_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='division',
+            index=models.Index(fields=['supplier', 'name'], name='division_supplier_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='profilesandsubagencies',
+            index=models.Index(fields=['corresponding_code'], name='profile_corresponding_code_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='region',
+            index=models.Index(fields=['name'], name='region_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='region',
+            index=models.Index(fields=['country', 'name'], name='region_country_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='register',
+            index=models.Index(fields=['last_name', 'first_name'], name='register_ordering_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='register',
+            index=models.Index(fields=['registry_type', 'last_name', 'first_name'], name='register_type_ordering_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='register',
+            index=models.Index(django.db.models.functions.text.Lower('email'), name='register_email_lower_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='registrytype',
+            index=models.Index(fields=['name'], name='registrytype_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='sign',
+            index=models.Index(fields=['name'], name='sign_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='sign',
+            index=models.Index(fields=['supplier', 'name'], name='sign_supplier_name_idx'),
+        ),
+    ]
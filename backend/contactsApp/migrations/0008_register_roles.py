@@ -0,0 +1,81 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:36
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Exists, OuterRef
+
+# registry types of the registers which are clients / suppliers, as in models.py
+CLIENT_TYPES = ["Cliente", "Cliente/Fornitore"]
+SUPPLIER_TYPES = ["Fornitore", "Cliente/Fornitore"]
+
+
+def refresh_role_columns(apps, schema_editor):
+    """
+    Fills the role columns of the existing registers, as Register.refresh_role_columns
+    """
+    Register = apps.get_model("contactsApp", "Register")
+    RegistryType = apps.get_model("contactsApp", "RegistryType")
+    registry_type = RegistryType.objects.filter(pk=OuterRef("registry_type"))
+    Register.objects.using(schema_editor.connection.alias).update(
+        is_client=Exists(registry_type.filter(name__in=CLIENT_TYPES)),
+        is_supplier=Exists(registry_type.filter(name__in=SUPPLIER_TYPES)),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contactsApp', '0007_updated_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='register',
+            name='is_client',
+            field=models.BooleanField(default=False, editable=False),
+        ),
+        migrations.AddField(
+            model_name='register',
+            name='is_supplier',
+            field=models.BooleanField(default=False, editable=False),
+        ),
+        migrations.AlterField(
+            model_name='deposit',
+            name='supplier',
+            field=models.ForeignKey(limit_choices_to={'is_supplier': True}, on_delete=django.db.models.deletion.CASCADE, related_name='supplier_deposits', to='contactsApp.register'),
+        ),
+        migrations.AlterField(
+            model_name='division',
+            name='client',
+            field=models.ForeignKey(limit_choices_to={'is_client': True}, on_delete=django.db.models.deletion.CASCADE, related_name='client_division', to='contactsApp.register'),
+        ),
+        migrations.AlterField(
+            model_name='division',
+            name='supplier',
+            field=models.ForeignKey(limit_choices_to={'is_supplier': True}, on_delete=django.db.models.deletion.CASCADE, related_name='supplier_division', to='contactsApp.register'),
+        ),
+        migrations.AlterField(
+            model_name='profilesandsubagencies',
+            name='client',
+            field=models.ForeignKey(limit_choices_to={'is_client': True}, on_delete=django.db.models.deletion.CASCADE, related_name='client_profiles', to='contactsApp.register'),
+        ),
+        migrations.AlterField(
+            model_name='profilesandsubagencies',
+            name='supplier',
+            field=models.ForeignKey(limit_choices_to={'is_supplier': True}, on_delete=django.db.models.deletion.CASCADE, related_name='supplier_profiles', to='contactsApp.register'),
+        ),
+        migrations.AlterField(
+            model_name='sign',
+            name='supplier',
+            field=models.ForeignKey(limit_choices_to={'is_supplier': True}, on_delete=django.db.models.deletion.CASCADE, related_name='supplier_signes', to='contactsApp.register'),
+        ),
+        migrations.AddIndex(
+            model_name='register',
+            index=models.Index(fields=['is_client', 'last_name', 'first_name'], name='register_client_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='register',
+            index=models.Index(fields=['is_supplier', 'last_name', 'first_name'], name='register_supplier_idx'),
+        ),
+        migrations.RunPython(refresh_role_columns, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contactsApp', '0008_register_roles'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='geoimportrow',
+            name='created',
+            field=models.BooleanField(default=False),
+        ),
+    ]
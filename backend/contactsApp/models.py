@@ -1,7 +1,25 @@
 from django.db import models
+from django.db.models import Exists, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce, Concat, Lower, Now
 
 
-class NameCodeEntity(models.Model):
+class TimestampedModel(models.Model):
+    """
+    Abstract model with the time of the last write, used to build the ETags of the API responses.
+    Set on save() and bulk_create(), writes through update() and bulk_update() must set it themselves
+    """
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        abstract = True
+
+    def save(self, *args, **kwargs):
+        if kwargs.get("update_fields") is not None:
+            kwargs["update_fields"] = {*kwargs["update_fields"], "updated_at"}
+        super().save(*args, **kwargs)
+
+
+class NameCodeEntity(TimestampedModel):
     """
     Abstract model for entities with a name and optional code
     """
@@ -11,10 +29,71 @@ class NameCodeEntity(models.Model):
     class Meta:
         abstract = True
         ordering = ["name"]
+        indexes = [models.Index(fields=["name"], name="%(class)s_name_idx")]
 
     def __str__(self):
         return self.name
 
+
+def display(first, second):
+    """
+    Display string of a related row, e.g. "AQ - L'Aquila", empty parts are kept as empty strings
+    """
+    return f"{first or ''} - {second or ''}"
+
+
+class DisplayColumnsModel(TimestampedModel):
+    """
+    Abstract model storing the display strings of related rows in indexed columns,
+    so they can be filtered and ordered on without joins.
+    display_fields maps each display column to (foreign key, first field, second field),
+    the columns are refreshed on save and when the related row changes (see signals.py)
+    """
+    display_fields = {}
+
+    class Meta:
+        abstract = True
+
+    def refresh_display(self):
+        for column, (foreign_key, first, second) in self.display_fields.items():
+            related = getattr(self, foreign_key)
+            if related is None:
+                setattr(self, column, display(None, None))
+            else:
+                setattr(self, column, display(getattr(related, first), getattr(related, second)))
+
+    def save(self, *args, **kwargs):
+        self.refresh_display()
+        if kwargs.get("update_fields") is not None:
+            kwargs["update_fields"] = {*kwargs["update_fields"], *self.display_fields}
+        super().save(*args, **kwargs)
+
+    @classmethod
+    def refresh_display_columns(cls, queryset=None):
+        """
+        Recomputes the display columns of the queryset rows (all rows by default) in the database,
+        for rows written without save() such as bulk_create
+        """
+        queryset = cls.objects.all() if queryset is None else queryset
+        columns = {}
+        for column, (foreign_key, first, second) in cls.display_fields.items():
+            related = cls._meta.get_field(foreign_key).related_model
+            value = related.objects.filter(pk=OuterRef(foreign_key)).values(
+                value=Concat(
+                    Coalesce(first, Value("")),
+                    Value(" - "),
+                    Coalesce(second, Value("")),
+                    output_field=models.CharField(),
+                )
+            )
+            columns[column] = Coalesce(Subquery(value), Value(display(None, None)))
+        return queryset.update(updated_at=Now(), **columns)
+
+
+def display_column():
+    return models.CharField(max_length=255, default="", editable=False, db_index=True)
+
+
 class Country(NameCodeEntity):
     """
     Models to represent Nations
@@ -36,11 +115,16 @@ class Region(NameCodeEntity):
 
     country = models.ForeignKey(Country, on_delete=models.CASCADE)
 
+    class Meta(NameCodeEntity.Meta):
+        indexes = NameCodeEntity.Meta.indexes + [
+            models.Index(fields=["country", "name"], name="region_country_name_idx"),
+        ]
+
     def __str__(self):
         return f"{self.name} ({self.country.iso_code})"
 
 
-class City(models.Model):
+class City(TimestampedModel):
     """
     Model to represent Cities within a Region
     """
@@ -51,7 +135,14 @@ class City(models.Model):
     country = models.ForeignKey(Country, on_delete=models.CASCADE)
 
     class Meta: 
-        ordering = ["name", "postcode", "region", "country"]
+        # order on the ids, ordering on the foreign keys would join and sort on the related names
+        ordering = ["name", "postcode", "region_id", "country_id"]
+        indexes = [
+            models.Index(fields=["name", "postcode", "region", "country"], name="city_ordering_idx"),
+            # filtered lists, ordered by the rest of the ordering
+            models.Index(fields=["country", "name", "postcode", "region"], name="city_country_name_idx"),
+            models.Index(fields=["region", "name", "postcode", "country"], name="city_region_name_idx"),
+        ]
 
     def __str__(self):
         return f"{self.name} ({self.postcode})"
@@ -77,7 +168,12 @@ class RegistryType(NameCodeEntity):
         return f"{self.name}"
 
 
-class Register(models.Model):
+# registry types of the registers which are clients / suppliers
+CLIENT_TYPES = ["Cliente", "Cliente/Fornitore"]
+SUPPLIER_TYPES = ["Fornitore", "Cliente/Fornitore"]
+
+
+class Register(TimestampedModel):
     # Fields for Registry
     last_name = models.CharField(max_length=50)
     first_name = models.CharField(max_length=50, null=True, blank=True)
@@ -88,14 +184,52 @@ class Register(models.Model):
     vat_number = models.CharField(max_length=20, null=True, blank=True)
     registry_type = models.ForeignKey(RegistryType, on_delete=models.CASCADE )
 
+    # roles given by registry_type, stored to filter clients and suppliers without joining it.
+    # Refreshed on save and when the registry type changes (see signals.py)
+    is_client = models.BooleanField(default=False, editable=False)
+    is_supplier = models.BooleanField(default=False, editable=False)
+
     class Meta:
         ordering = ["last_name", "first_name"]
+        indexes = [
+            models.Index(fields=["last_name", "first_name"], name="register_ordering_idx"),
+            models.Index(fields=["registry_type", "last_name", "first_name"], name="register_type_ordering_idx"),
+            models.Index(fields=["is_client", "last_name", "first_name"], name="register_client_idx"),
+            models.Index(fields=["is_supplier", "last_name", "first_name"], name="register_supplier_idx"),
+            # case insensitive email lookups (check-email)
+            models.Index(Lower("email"), name="register_email_lower_idx"),
+        ]
 
     def __str__(self):
         return f"{self.first_name} {self.last_name}"
 
-
-class Contact(models.Model):
+    def refresh_roles(self):
+        name = self.registry_type.name if self.registry_type_id is not None else None
+        self.is_client = name in CLIENT_TYPES
+        self.is_supplier = name in SUPPLIER_TYPES
+
+    def save(self, *args, **kwargs):
+        self.refresh_roles()
+        if kwargs.get("update_fields") is not None:
+            kwargs["update_fields"] = {*kwargs["update_fields"], "is_client", "is_supplier"}
+        super().save(*args, **kwargs)
+
+    @classmethod
+    def refresh_role_columns(cls, queryset=None):
+        """
+        Recomputes the role columns of the queryset rows (all rows by default) in the database,
+        for rows written without save() such as bulk_create
+        """
+        queryset = cls.objects.all() if queryset is None else queryset
+        registry_type = RegistryType.objects.filter(pk=OuterRef("registry_type"))
+        return queryset.update(
+            is_client=Exists(registry_type.filter(name__in=CLIENT_TYPES)),
+            is_supplier=Exists(registry_type.filter(name__in=SUPPLIER_TYPES)),
+            updated_at=Now(),
+        )
+
+
+class Contact(DisplayColumnsModel):
     register = models.ForeignKey(
         Register, on_delete=models.CASCADE, related_name="contacts"
     )
@@ -109,9 +243,25 @@ class Contact(models.Model):
     city = models.ForeignKey(City, on_delete=models.CASCADE)
     address = models.CharField(max_length=50)
 
+    branch_display = display_column()
+    country_display = display_column()
+    region_display = display_column()
+    city_display = display_column()
+
+    display_fields = {
+        "branch_display": ("branch", "code", "name"),
+        "country_display": ("country", "iso_code", "name"),
+        "region_display": ("region", "code", "name"),
+        "city_display": ("city", "postcode", "name"),
+    }
+
     class Meta:
         verbose_name_plural = "Contacts"
         ordering = ["name"]
+        indexes = [
+            models.Index(fields=["name"], name="contact_name_idx"),
+            models.Index(fields=["register", "name"], name="contact_register_name_idx"),
+        ]
 
     def __str__(self):
         return f"{self.name}"
@@ -120,23 +270,32 @@ class Contact(models.Model):
 # Models for Tabs
 # ===========================
 
-class Division(NameCodeEntity):
+class Division(NameCodeEntity, DisplayColumnsModel):
     client = models.ForeignKey(
         Register, 
         on_delete=models.CASCADE, 
         related_name="client_division",
-            limit_choices_to={
-            "registry_type__name__in": ["Cliente", "Cliente/Fornitore"]
-        }
+        limit_choices_to={"is_client": True}
     )
     supplier = models.ForeignKey(
         Register, 
         on_delete=models.CASCADE, 
         related_name="supplier_division",
-        limit_choices_to={
-            "registry_type__name__in": ["Fornitore", "Cliente/Fornitore"]
-        }
+        limit_choices_to={"is_supplier": True}
       )
+
+    supplier_display = display_column()
+
+    display_fields = {
+        "supplier_display": ("supplier", "last_name", "first_name"),
+    }
+
+    class Meta(NameCodeEntity.Meta):
+        indexes = NameCodeEntity.Meta.indexes + [
+            models.Index(fields=["client", "name"], name="division_client_name_idx"),
+            models.Index(fields=["supplier", "name"], name="division_supplier_name_idx"),
+        ]
+
     def __str__(self):
         return f"{self.code} - {self.name}"
 
@@ -145,10 +304,13 @@ class Sign(NameCodeEntity):
         Register, 
         on_delete=models.CASCADE, 
         related_name="supplier_signes",
-        limit_choices_to={
-            "registry_type__name__in": ["Fornitore", "Cliente/Fornitore"]
-        }
+        limit_choices_to={"is_supplier": True}
       )    
+
+    class Meta(NameCodeEntity.Meta):
+        indexes = NameCodeEntity.Meta.indexes + [
+            models.Index(fields=["supplier", "name"], name="sign_supplier_name_idx"),
+        ]
     
     def __str__(self):
         return f"{self.name} {self.code}"
@@ -158,32 +320,102 @@ class Deposit(NameCodeEntity):
         Register, 
         on_delete=models.CASCADE, 
         related_name="supplier_deposits",
-        limit_choices_to={
-            "registry_type__name__in": ["Fornitore", "Cliente/Fornitore"]
-        }
+        limit_choices_to={"is_supplier": True}
     )    
+
+    class Meta(NameCodeEntity.Meta):
+        indexes = NameCodeEntity.Meta.indexes + [
+            models.Index(fields=["supplier", "name"], name="deposit_supplier_name_idx"),
+        ]
     
     def __str__(self):
         return f"{self.name} {self.code}"
 
-class ProfilesAndSubagencies(models.Model):
+class ProfilesAndSubagencies(DisplayColumnsModel):
     client = models.ForeignKey(
         Register, 
         on_delete=models.CASCADE, 
         related_name="client_profiles",
-        limit_choices_to={ 
-            "registry_type__name__in": ["Cliente", "Cliente/Fornitore"]
-        }
+        limit_choices_to={"is_client": True}
     )
     supplier = models.ForeignKey(
         Register, 
         on_delete=models.CASCADE, 
         related_name="supplier_profiles",
-        limit_choices_to={
-            "registry_type__name__in": ["Fornitore", "Cliente/Fornitore"]
-        }
+        limit_choices_to={"is_supplier": True}
     )
     division = models.ForeignKey(Division, on_delete=models.CASCADE, null=True, blank=True)
     sign = models.ForeignKey(Sign, on_delete=models.CASCADE)
     corresponding_code = models.CharField(max_length=50)
-    deposit = models.ForeignKey(Deposit, on_delete=models.CASCADE, null=True, blank=True)
\ No newline at end of file
+    deposit = models.ForeignKey(Deposit, on_delete=models.CASCADE, null=True, blank=True)
+
+    client_display = display_column()
+    supplier_display = display_column()
+    division_display = display_column()
+    sign_display = display_column()
+    deposit_display = display_column()
+
+    display_fields = {
+        "client_display": ("client", "last_name", "first_name"),
+        "supplier_display": ("supplier", "last_name", "first_name"),
+        "division_display": ("division", "code", "name"),
+        "sign_display": ("sign", "code", "name"),
+        "deposit_display": ("deposit", "code", "name"),
+    }
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["corresponding_code"], name="profile_corresponding_code_idx"),
+        ]
+
+# Models for Data Imports
+# ===========================
+
+class GeoImportManifest(models.Model):
+    """
+    Model to remember the last imported version of a geo data source file
+    """
+
+    source = models.CharField(max_length=255, unique=True)
+    checksum = models.CharField(max_length=64)
+    imported_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.source} ({self.checksum[:12]})"
+
+
+class GeoImportRow(models.Model):
+    """
+    Model to represent the fingerprint of a source row and the City it was imported as
+    """
+
+    manifest = models.ForeignKey(
+        GeoImportManifest, on_delete=models.CASCADE, related_name="rows"
+    )
+    key = models.CharField(max_length=100)
+    fingerprint = models.CharField(max_length=40)
+    city = models.ForeignKey(City, on_delete=models.CASCADE, related_name="+")
+    # whether importing the row created the City, a sync only changes the cities it created
+    created = models.BooleanField(default=False)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["manifest", "key"], name="unique_geo_import_row")
+        ]
+
+    def __str__(self):
+        return f"{self.manifest.source}: {self.key}"
+
+
+class GeoImportCheckpoint(models.Model):
+    """
+    Model to remember how many rows of a source file a chunked import already committed
+    """
+
+    source = models.CharField(max_length=255, unique=True)
+    checksum = models.CharField(max_length=64)
+    offset = models.PositiveBigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.source} @ {self.offset}"
@@ -0,0 +1,235 @@
+import base64
+import binascii
+import json
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+from django.core.exceptions import FieldDoesNotExist
+from django.db import connections
+from django.db.models import F, Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import LimitOffsetPagination
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+from .caching import model_versions, params_hash, query_models
+from .routing import read_source, replica_timeout
+
+
+def keyset_ordering(queryset):
+    """
+    Returns the queryset ordering as a list of (field, descending) ending with the primary key,
+    or None if it can't be used for keyset pagination (e.g. ordering on an expression)
+    """
+    query = queryset.query
+    ordering = query.order_by or (query.default_ordering and queryset.model._meta.ordering) or []
+
+    result = []
+    for field in ordering:
+        if not isinstance(field, str) or field == "?":
+            return None
+        descending = field.startswith("-")
+        name = field.lstrip("-")
+        if name in ("pk", queryset.model._meta.pk.name):
+            result.append(("pk", descending))
+            return result
+        try:
+            model_field = queryset.model._meta.get_field(name)
+        except FieldDoesNotExist:
+            pass
+        else:
+            # ordering on a foreign key follows the related model ordering, compare the ids instead
+            if model_field.is_relation:
+                name = model_field.attname
+        result.append((name, descending))
+
+    result.append(("pk", False))
+    return result
+
+
+def order_by(ordering):
+    # NULLs are the lowest value whatever the database, so the cursor filter can rely on it
+    return [
+        F(name).desc(nulls_last=True) if descending else F(name).asc(nulls_first=True)
+        for name, descending in ordering
+    ]
+
+
+def after_cursor(ordering, values):
+    """
+    Q matching the rows that come after the given values in the given ordering
+    """
+    after = Q()
+    equal = Q()
+    for (name, descending), value in zip(ordering, values):
+        if value is None:
+            if not descending:
+                after |= equal & Q(**{f"{name}__isnull": False})
+            equal &= Q(**{f"{name}__isnull": True})
+        else:
+            if descending:
+                after |= equal & (Q(**{f"{name}__lt": value}) | Q(**{f"{name}__isnull": True}))
+            else:
+                after |= equal & Q(**{f"{name}__gt": value})
+            equal &= Q(**{name: value})
+    return after
+
+
+def estimated_count(queryset):
+    """
+    Row count estimated by the query planner, None if the database doesn't provide one
+    """
+    connection = connections[queryset.db]
+    if connection.vendor != "postgresql":
+        return None
+    sql, params = queryset.query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(f"EXPLAIN (FORMAT JSON) {sql}", params)
+        plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]["Plan"]["Plan Rows"])
+
+
+class CachedCountMixin:
+    """
+    Caches the total count of a list per endpoint and filter params for COUNT_CACHE_TIMEOUT seconds
+    (default 30), so paging and sorting a grid don't count again. Cached counts are dropped when the
+    listed model, or a model the filters join (e.g. city__name), is written. If
+    COUNT_ESTIMATE_THRESHOLD is set, lists the planner estimates bigger than that get the estimate
+    instead of an exact count.
+    """
+
+    # params that change the page but not the number of rows
+    count_ignored_params = ("limit", "offset", "cursor", "ordering")
+
+    def count_key(self, queryset, versions):
+        return "contactsApp:count:{}:{}:{}:{}:{}".format(
+            queryset.model._meta.label_lower,
+            ".".join(str(version) for version in versions),
+            read_source(),
+            self.request.path,
+            params_hash(self.request.query_params, exclude=self.count_ignored_params),
+        )
+
+    def get_count(self, queryset):
+        key = self.count_key(queryset, model_versions(query_models(queryset.query)))
+        count = cache.get(key)
+        if count is None:
+            count = self.count_rows(queryset)
+            cache.set(key, count, replica_timeout(getattr(settings, "COUNT_CACHE_TIMEOUT", 30)))
+        return count
+
+    def count_rows(self, queryset):
+        threshold = getattr(settings, "COUNT_ESTIMATE_THRESHOLD", None)
+        if threshold is not None:
+            estimate = estimated_count(queryset.order_by())
+            if estimate is not None and estimate > threshold:
+                return estimate
+        return super().get_count(queryset)
+
+
+class KeysetPagination(CachedCountMixin, LimitOffsetPagination):
+    """
+    LimitOffsetPagination with an opt-in keyset mode and cached counts.
+
+    When the request has a cursor parameter the page starts right after the row the cursor
+    points to (or at offset, if the cursor is empty), filtering on the ordering fields instead of
+    skipping rows, and the next link carries the cursor of the last row. Page cost doesn't depend
+    on the depth. Querysets ordered by an expression (e.g. the _search ranking) are paginated
+    with limit/offset as usual.
+    """
+
+    cursor_query_param = "cursor"
+    invalid_cursor_message = "Invalid cursor"
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.keyset = False
+        ordering = keyset_ordering(queryset)
+        if self.cursor_query_param not in request.query_params or ordering is None:
+            return super().paginate_queryset(queryset, request, view)
+
+        self.limit = self.get_limit(request)
+        if self.limit is None:
+            return None
+
+        self.request = request
+        self.count = self.get_count(queryset)
+        queryset = self.keyset_page(queryset, request, ordering)
+        results = list(queryset[self.offset:self.offset + self.limit + 1])
+        self.next_cursor = None
+        if len(results) > self.limit:
+            results = results[:self.limit]
+            values = self.row_cursor_values(queryset, results[-1])
+            if values is None:
+                pk = self.row_pk(queryset, results[-1])
+                values = list(queryset.filter(pk=pk).values_list(*self.cursor_names())[0])
+            self.next_cursor = self.encode_cursor(values)
+        return results
+
+    def keyset_page(self, queryset, request, ordering):
+        """
+        Queryset of the rows from the start of the page on, setting the keyset state and offset
+        """
+        self.keyset = True
+        self.request = request
+        self.ordering = ordering
+        queryset = queryset.order_by(*order_by(ordering))
+
+        encoded = request.query_params[self.cursor_query_param]
+        if encoded:
+            self.offset = 0
+            return queryset.filter(after_cursor(ordering, self.decode_cursor(encoded)))
+        self.offset = self.get_offset(request)
+        return queryset
+
+    def cursor_names(self):
+        return [name for name, _ in self.ordering]
+
+    def row_pk(self, queryset, obj):
+        # rows of a values() queryset have the primary key under its column name
+        return obj[queryset.model._meta.pk.attname] if isinstance(obj, dict) else obj.pk
+
+    def row_cursor_values(self, queryset, obj):
+        """
+        Cursor values read from the row, None if they have to be queried (e.g. ordering on a related field)
+        """
+        names = self.cursor_names()
+        if isinstance(obj, dict):
+            keys = [queryset.model._meta.pk.attname if name == "pk" else name for name in names]
+            if all(key in obj for key in keys):
+                return [obj[key] for key in keys]
+        elif all("__" not in name for name in names):
+            return [getattr(obj, name) for name in names]
+        return None
+
+    def encode_cursor(self, values):
+        # the ordering is part of the cursor, so a cursor can't be reused with a different sort
+        data = {"o": [[name, descending] for name, descending in self.ordering], "v": values}
+        payload = json.dumps(data, cls=DjangoJSONEncoder).encode("utf-8")
+        return base64.urlsafe_b64encode(payload).decode("ascii")
+
+    def decode_cursor(self, encoded):
+        try:
+            data = json.loads(base64.urlsafe_b64decode(encoded.encode("ascii")))
+            ordering = [(name, descending) for name, descending in data["o"]]
+            values = data["v"]
+        except (TypeError, ValueError, KeyError, binascii.Error):
+            raise NotFound(self.invalid_cursor_message)
+        if ordering != self.ordering or len(values) != len(ordering):
+            raise NotFound(self.invalid_cursor_message)
+        return values
+
+    def get_next_link(self):
+        if not self.keyset:
+            return super().get_next_link()
+        if self.next_cursor is None:
+            return None
+        url = remove_query_param(self.request.build_absolute_uri(), self.offset_query_param)
+        return replace_query_param(url, self.cursor_query_param, self.next_cursor)
+
+    def get_previous_link(self):
+        # keyset pages are forward only, going back uses limit/offset
+        if not self.keyset:
+            return super().get_previous_link()
+        return None
@@ -0,0 +1,157 @@
+"""
+Reads of the API GET requests on replica database aliases.
+
+READ_DATABASES lists the aliases (empty by default, then everything uses default). The GET, HEAD
+and OPTIONS requests handled by a ViewSet with ReadDatabaseMixin read through one of them, picked
+at random for each request, every other request, and every write, uses default.
+
+Replicas lag behind default, so a client that just changed something reads its changes from
+default: a successful write through a ViewSet with ReadDatabaseMixin returns the time until which
+the client reads from default, READ_YOUR_WRITES_SECONDS (default 10) later, in a cookie and in the
+X-Read-Primary-Until header. The frontend calls the API from another origin without credentials, so
+it doesn't send the cookie back, djangoStore echoes the header instead (see django-adapter.js).
+Responses and counts read from a replica are cached for no longer than that. 0 means the read
+databases don't lag.
+"""
+import random
+import time
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from rest_framework.permissions import SAFE_METHODS
+
+# alias the reads of the current request go to
+read_alias = ContextVar("read_alias", default=None)
+# hold the time until which the client reads from default
+PRIMARY_COOKIE = "read_primary_until"
+PRIMARY_HEADER = "X-Read-Primary-Until"
+
+
+def is_test_mirror(alias):
+    """
+    Whether the alias is a TEST MIRROR while the tests run. The mirror is another connection to the
+    test database, which doesn't see the rows of the test transactions, so the reads stay on default
+    """
+    if alias not in connections.settings:
+        return False
+    mirror = connections.settings[alias].get("TEST", {}).get("MIRROR")
+    if mirror is None:
+        return False
+    primary = connections[mirror]
+    return primary.settings_dict["NAME"] == primary.creation._get_test_db_name()
+
+
+def read_databases():
+    return [alias for alias in getattr(settings, "READ_DATABASES", []) if not is_test_mirror(alias)]
+
+
+def read_your_writes_seconds():
+    return getattr(settings, "READ_YOUR_WRITES_SECONDS", 10)
+
+
+def read_lags():
+    # 0 when the read databases can't miss a write, e.g. other connections to the same file
+    return read_alias.get() is not None and read_your_writes_seconds() > 0
+
+
+def read_source():
+    # values computed from a replica are cached apart from the ones read from default
+    return "replica" if read_lags() else "primary"
+
+
+def replica_timeout(timeout):
+    """
+    Cache timeout of a value read from the current database: a replica may miss a write for as
+    long as the writer reads from default, so may a value read from it
+    """
+    if not read_lags():
+        return timeout
+    return min(timeout, read_your_writes_seconds())
+
+
+def reads_primary(request):
+    """
+    Whether a write of the client is recent enough to be missing from the replicas
+    """
+    for value in (request.COOKIES.get(PRIMARY_COOKIE), request.headers.get(PRIMARY_HEADER)):
+        try:
+            if value and time.time() < float(value):
+                return True
+        except ValueError:
+            pass
+    return False
+
+
+class ReadDatabaseMixin:
+    """
+    ViewSet mixin sending the reads of the safe method requests to READ_DATABASES
+    """
+
+
+class ReadDatabaseRouter:
+    def db_for_read(self, model, **hints):
+        return read_alias.get()
+
+    def db_for_write(self, model, **hints):
+        return None
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # the aliases hold the same data
+        return True
+
+    def allow_migrate(self, db, app_label, **hints):
+        # replicas are copies of default
+        if db in read_databases():
+            return False
+        return None
+
+
+class ReadDatabaseMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not read_databases():
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        reset = read_alias.set(None)
+        try:
+            response = self.get_response(request)
+        finally:
+            read_alias.reset(reset)
+        return self.mark_write(request, response)
+
+    async def __acall__(self, request):
+        reset = read_alias.set(None)
+        try:
+            response = await self.get_response(request)
+        finally:
+            read_alias.reset(reset)
+        return self.mark_write(request, response)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        view_class = getattr(view_func, "cls", None)
+        if view_class is None or not issubclass(view_class, ReadDatabaseMixin):
+            return
+        if request.method not in SAFE_METHODS:
+            request._database_write = True
+        elif not reads_primary(request):
+            # one replica for the whole request, so its queries see the same data
+            read_alias.set(random.choice(read_databases()))
+
+    def mark_write(self, request, response):
+        seconds = read_your_writes_seconds()
+        if seconds and getattr(request, "_database_write", False) and response.status_code < 400:
+            until = str(time.time() + seconds)
+            response.set_cookie(PRIMARY_COOKIE, until, max_age=seconds, httponly=True, samesite="Lax")
+            response[PRIMARY_HEADER] = until
+        return response
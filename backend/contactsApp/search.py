@@ -0,0 +1,229 @@
+"""
+Indexed substring search used by the _search filters of the dropdown endpoints.
+
+On SQLite every searchable model gets an FTS5 table with the trigram tokenizer, kept in sync
+with the model table by triggers (so bulk_create and raw SQL writes are indexed too).
+On PostgreSQL the searchable columns get a pg_trgm GIN index serving the icontains lookups.
+Matches are ranked (prefix matches first on SQLite, trigram similarity on PostgreSQL), other
+databases and values too short to have a trigram fall back to plain icontains.
+"""
+from django.db import connections
+from django.db.models import Case, Q, Value, When
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import Greatest
+
+from .models import (
+    Branch,
+    City,
+    Contact,
+    Country,
+    Deposit,
+    Division,
+    ProfilesAndSubagencies,
+    Region,
+    Register,
+    Sign,
+)
+
+# searchable columns of each model, the _search and *_display filters can use any subset of them
+SEARCH_FIELDS = {
+    Country: ["name", "iso_code"],
+    Region: ["name", "code"],
+    City: ["name", "postcode"],
+    Branch: ["name", "code"],
+    Register: ["last_name", "first_name"],
+    Division: ["name", "code", "supplier_display"],
+    Sign: ["name", "code"],
+    Deposit: ["name", "code"],
+    Contact: ["branch_display", "country_display", "region_display", "city_display"],
+    ProfilesAndSubagencies: [
+        "client_display",
+        "supplier_display",
+        "division_display",
+        "sign_display",
+        "deposit_display",
+    ],
+}
+
+# trigram tokenizer is available from SQLite 3.34
+MIN_SQLITE_VERSION = (3, 34, 0)
+MIN_LENGTH = 3
+
+
+def search_table(model):
+    return f"{model._meta.db_table}_search"
+
+
+def columns(model, fields):
+    return [model._meta.get_field(field).column for field in fields]
+
+
+def is_indexed(model, fields):
+    return model in SEARCH_FIELDS and set(fields) <= set(SEARCH_FIELDS[model])
+
+
+def sqlite_supported(connection):
+    return connection.vendor == "sqlite" and connection.Database.sqlite_version_info >= MIN_SQLITE_VERSION
+
+
+def search(queryset, value, fields, ordering_field="name", ranked=True):
+    """
+    Filters the queryset on the rows where any of the fields contains value (case insensitive),
+    ordered by ordering_field (a field name or a tuple of them), best matches first if ranked
+    """
+    ordering = [ordering_field] if isinstance(ordering_field, str) else list(ordering_field)
+    connection = connections[queryset.db]
+    if len(value) >= MIN_LENGTH and is_indexed(queryset.model, fields):
+        if sqlite_supported(connection):
+            return sqlite_search(queryset, value, fields, ordering, ranked)
+        if connection.vendor == "postgresql":
+            return postgresql_search(queryset, value, fields, ordering, ranked)
+
+    return queryset.filter(contains(fields, value)).order_by(*ordering)
+
+
+def contains(fields, value):
+    q_objects = Q()
+    for field in fields:
+        q_objects |= Q(**{f"{field}__icontains": value})
+    return q_objects
+
+
+def sqlite_search(queryset, value, fields, ordering, ranked):
+    model = queryset.model
+    table = search_table(model)
+    # match the value as a single phrase, restricted to the requested columns
+    phrase = '"{}"'.format(value.replace('"', '""'))
+    match = "{%s} : %s" % (" ".join(columns(model, fields)), phrase)
+
+    matches = RawSQL(f'SELECT rowid FROM "{table}" WHERE "{table}" MATCH %s', (match,))
+    queryset = queryset.filter(pk__in=matches)
+    if not ranked:
+        return queryset.order_by(*ordering)
+
+    # bm25 would need a correlated MATCH per row, ranking the rows starting with the value
+    # first is almost free on the few matched rows and is what typeahead users expect
+    prefix = Q()
+    for field in fields:
+        prefix |= Q(**{f"{field}__istartswith": value})
+    rank = Case(When(prefix, then=Value(0)), default=Value(1))
+    return queryset.order_by(rank, *ordering)
+
+
+def postgresql_search(queryset, value, fields, ordering, ranked):
+    from django.contrib.postgres.search import TrigramSimilarity
+
+    queryset = queryset.filter(contains(fields, value))
+    if not ranked:
+        return queryset.order_by(*ordering)
+
+    similarities = [TrigramSimilarity(field, value) for field in fields]
+    rank = Greatest(*similarities) if len(similarities) > 1 else similarities[0]
+    return queryset.order_by(rank.desc(), *ordering)
+
+
+# Index creation
+# ===========================
+
+def migrated_columns(connection, model, fields):
+    """
+    Whether the table has all the columns, it lags behind the model when migrating backwards or
+    to an earlier migration
+    """
+    with connection.cursor() as cursor:
+        table = connection.introspection.get_table_description(cursor, model._meta.db_table)
+    return set(fields) <= {column.name for column in table}
+
+
+def create_search_indexes(using="default", rebuild=False, **kwargs):
+    """
+    Creates the missing search indexes, connected to post_migrate
+    """
+    connection = connections[using]
+    if sqlite_supported(connection):
+        for model, fields in SEARCH_FIELDS.items():
+            fields = columns(model, fields)
+            if migrated_columns(connection, model, fields):
+                create_sqlite_index(connection, model, fields, rebuild)
+    elif connection.vendor == "postgresql":
+        with connection.cursor() as cursor:
+            cursor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+            for model, fields in SEARCH_FIELDS.items():
+                table = model._meta.db_table
+                for column in columns(model, fields):
+                    cursor.execute(
+                        f'CREATE INDEX IF NOT EXISTS "{table}_{column}_trgm" '
+                        f'ON "{table}" USING gin (UPPER("{column}") gin_trgm_ops)'
+                    )
+
+
+def create_sqlite_index(connection, model, fields, rebuild=False):
+    table = model._meta.db_table
+    pk = model._meta.pk.column
+    fts = search_table(model)
+    names = ", ".join(f'"{field}"' for field in fields)
+    new_values = ", ".join(f'new."{field}"' for field in fields)
+    old_values = ", ".join(f'old."{field}"' for field in fields)
+
+    statements = {
+        fts: (
+            f'CREATE VIRTUAL TABLE "{fts}" USING fts5({names}, '
+            f"content='{table}', content_rowid='{pk}', tokenize='trigram')"
+        ),
+        f"{fts}_insert": (
+            f'CREATE TRIGGER "{fts}_insert" AFTER INSERT ON "{table}" BEGIN '
+            f'INSERT INTO "{fts}"(rowid, {names}) VALUES (new."{pk}", {new_values}); END'
+        ),
+        f"{fts}_delete": (
+            f'CREATE TRIGGER "{fts}_delete" AFTER DELETE ON "{table}" BEGIN '
+            f'INSERT INTO "{fts}"("{fts}", rowid, {names}) VALUES (\'delete\', old."{pk}", {old_values}); END'
+        ),
+        f"{fts}_update": (
+            f'CREATE TRIGGER "{fts}_update" AFTER UPDATE OF {names} ON "{table}" BEGIN '
+            f'INSERT INTO "{fts}"("{fts}", rowid, {names}) VALUES (\'delete\', old."{pk}", {old_values}); '
+            f'INSERT INTO "{fts}"(rowid, {names}) VALUES (new."{pk}", {new_values}); END'
+        ),
+    }
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT name FROM sqlite_master WHERE name IN (%s)" % ", ".join(["%s"] * len(statements)),
+            list(statements),
+        )
+        existing = {row[0] for row in cursor.fetchall()}
+
+        # the searchable columns changed, start over
+        if fts in existing:
+            cursor.execute(f'PRAGMA table_info("{fts}")')
+            if [row[1] for row in cursor.fetchall()] != list(fields):
+                for name in existing:
+                    kind = "TABLE" if name == fts else "TRIGGER"
+                    cursor.execute(f'DROP {kind} "{name}"')
+                existing = set()
+        for name, statement in statements.items():
+            if name not in existing:
+                cursor.execute(statement)
+
+        # Django recreates the table (dropping its triggers) on some schema changes,
+        # so anything missing means the index may be stale
+        if rebuild or len(existing) < len(statements):
+            cursor.execute(f'INSERT INTO "{fts}"("{fts}") VALUES (\'rebuild\')')
+
+
+def drop_search_triggers(using="default", plan=None, **kwargs):
+    """
+    Drops the triggers of the SQLite search indexes before migrations of the app run, connected to
+    pre_migrate. SQLite checks every trigger when a migration renames a table, and the triggers name
+    the columns the migration may be changing. create_search_indexes recreates them and rebuilds the
+    indexes afterwards
+    """
+    connection = connections[using]
+    if not sqlite_supported(connection):
+        return
+    if not any(migration.app_label == "contactsApp" for migration, backwards in plan or []):
+        return
+    with connection.cursor() as cursor:
+        for model in SEARCH_FIELDS:
+            fts = search_table(model)
+            for trigger in ("insert", "delete", "update"):
+                cursor.execute(f'DROP TRIGGER IF EXISTS "{fts}_{trigger}"')
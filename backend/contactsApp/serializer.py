@@ -1,8 +1,32 @@
+from django.core.exceptions import ValidationError
 from rest_framework import serializers
 
 from .models import City, Contact, Country, Region, Register, Branch, RegistryType, Division, Sign, ProfilesAndSubagencies, Deposit
 
 
+class PrefetchedPrimaryKeyRelatedField(serializers.PrimaryKeyRelatedField):
+    """
+    PrimaryKeyRelatedField taking the related row from context["related"][field name], the rows
+    loaded at once by the bulk endpoints, instead of querying it for every item
+    """
+
+    def to_internal_value(self, data):
+        related = self.context.get("related", {}).get(self.field_name)
+        if related is None:
+            return super().to_internal_value(data)
+        if self.pk_field is not None:
+            data = self.pk_field.to_internal_value(data)
+        if isinstance(data, bool):
+            self.fail("incorrect_type", data_type=type(data).__name__)
+        try:
+            pk = self.get_queryset().model._meta.pk.to_python(data)
+        except ValidationError:
+            self.fail("incorrect_type", data_type=type(data).__name__)
+        if pk not in related:
+            self.fail("does_not_exist", pk_value=data)
+        return related[pk]
+
+
 class CountrySerializer(serializers.ModelSerializer):
     class Meta:
         fields = ["id", "iso_code", "name"]
@@ -77,11 +101,11 @@ class ContactListSerializer(serializers.ModelSerializer):
 
 # add
 class ContactSerializer(serializers.ModelSerializer):
-    register = serializers.PrimaryKeyRelatedField(queryset=Register.objects.all())
-    branch = serializers.PrimaryKeyRelatedField(queryset=Branch.objects.all())
-    country = serializers.PrimaryKeyRelatedField(queryset=Country.objects.all())
-    region = serializers.PrimaryKeyRelatedField(queryset=Region.objects.all(), allow_null=True)
-    city = serializers.PrimaryKeyRelatedField(queryset=City.objects.all())
+    register = PrefetchedPrimaryKeyRelatedField(queryset=Register.objects.all())
+    branch = PrefetchedPrimaryKeyRelatedField(queryset=Branch.objects.all())
+    country = PrefetchedPrimaryKeyRelatedField(queryset=Country.objects.all())
+    region = PrefetchedPrimaryKeyRelatedField(queryset=Region.objects.all(), allow_null=True)
+    city = PrefetchedPrimaryKeyRelatedField(queryset=City.objects.all())
 
     class Meta:
         model = Contact
@@ -105,7 +129,7 @@ class RegisterSerializer(serializers.ModelSerializer):
     registry_type__name = serializers.CharField(read_only=True)
 
     class Meta:
-        fields = ["id", "first_name", "last_name", "phone", "phone_ext", "mobile", "email", "vat_number", "registry_type", "registry_type_display", "registry_type__name"]
+        fields = ["id", "first_name", "last_name", "phone", "phone_ext", "mobile", "email", "vat_number", "registry_type", "registry_type_display", "registry_type__name", "is_client", "is_supplier"]
         model = Register
 
   
@@ -149,10 +173,11 @@ class DepositSerializer(serializers.ModelSerializer):
  
 #view
 class ProfilesAndSubagenciensSerializer(serializers.ModelSerializer):
-    client = serializers.PrimaryKeyRelatedField(queryset=Register.objects.all())
-    supplier = serializers.PrimaryKeyRelatedField(queryset=Register.objects.all())
-    deposit = serializers.PrimaryKeyRelatedField(queryset=Deposit.objects.all(), allow_null=True)
-    division = serializers.PrimaryKeyRelatedField(queryset=Division.objects.all(), allow_null=True)
+    serializer_related_field = PrefetchedPrimaryKeyRelatedField
+    client = PrefetchedPrimaryKeyRelatedField(queryset=Register.objects.all())
+    supplier = PrefetchedPrimaryKeyRelatedField(queryset=Register.objects.all())
+    deposit = PrefetchedPrimaryKeyRelatedField(queryset=Deposit.objects.all(), allow_null=True)
+    division = PrefetchedPrimaryKeyRelatedField(queryset=Division.objects.all(), allow_null=True)
 
     class Meta:
         fields = ["id", 
@@ -0,0 +1,61 @@
+from functools import lru_cache
+
+from django.apps import apps
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .caching import bump_model_version
+from .models import CLIENT_TYPES, SUPPLIER_TYPES, DisplayColumnsModel, Register, RegistryType, display
+
+
+@receiver([post_save, post_delete])
+def bump_version(sender, **kwargs):
+    if sender._meta.app_label == "contactsApp":
+        bump_model_version(sender)
+
+
+@lru_cache(maxsize=None)
+def display_dependents(sender):
+    """
+    Display columns showing rows of the sender model, as (model, column, foreign key, first, second)
+    """
+    dependents = []
+    for model in apps.get_app_config("contactsApp").get_models():
+        if not issubclass(model, DisplayColumnsModel):
+            continue
+        for column, (foreign_key, first, second) in model.display_fields.items():
+            if model._meta.get_field(foreign_key).related_model is sender:
+                dependents.append((model, column, foreign_key, first, second))
+    return dependents
+
+
+@receiver(post_save)
+def refresh_display_columns(sender, instance, created, **kwargs):
+    # nothing references a new row yet
+    if created or kwargs.get("raw"):
+        return
+    for model, column, foreign_key, first, second in display_dependents(sender):
+        value = display(getattr(instance, first), getattr(instance, second))
+        updated = (
+            model.objects.filter(**{foreign_key: instance})
+            .exclude(**{column: value})
+            .update(**{column: value}, updated_at=timezone.now())
+        )
+        # update() sends no signals
+        if updated:
+            bump_model_version(model)
+
+
+@receiver(post_save, sender=RegistryType)
+def refresh_register_roles(sender, instance, created, **kwargs):
+    if created or kwargs.get("raw"):
+        return
+    roles = {"is_client": instance.name in CLIENT_TYPES, "is_supplier": instance.name in SUPPLIER_TYPES}
+    updated = (
+        Register.objects.filter(registry_type=instance)
+        .exclude(**roles)
+        .update(**roles, updated_at=timezone.now())
+    )
+    if updated:
+        bump_model_version(Register)
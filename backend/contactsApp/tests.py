@@ -1,3 +1,1545 @@
-from django.test import TestCase
+import csv
+import json
+import tempfile
+import threading
+import time
+from decimal import Decimal
+from io import StringIO
+from pathlib import Path
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.http import HttpResponse, QueryDict
+from django.db import DatabaseError, connection
+from django.db.migrations.loader import MigrationLoader
+from django.db.models import DecimalField, Value
+from django.db.models.functions import Lower, TruncDate
+from django.db.utils import ConnectionDoesNotExist, ConnectionHandler
+from django.test import Client, RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils.http import http_date
+from rest_framework import serializers
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+from . import geodata
+from .bulk import prefetch_related
+from .caching import ConditionalResponseMixin, bump_model_version, params_hash, query_models
+from .management.commands.explain_queries import list_queryset, problems
+from .management.commands.replicate_database import replicate
+from .fastlist import FastListMixin, field_columns, list_values, serialize_rows
+from .geodata import SyncResult, read_zipcodes, sync_source
+from .masterdata import import_rows, read_csv
+from .metrics import Histogram
+from .pagination import after_cursor, keyset_ordering, order_by
+from .routing import PRIMARY_COOKIE, PRIMARY_HEADER, ReadDatabaseMiddleware, ReadDatabaseRouter, read_alias, read_source, replica_timeout
+from .models import Branch, City, Contact, Country, Deposit, GeoImportCheckpoint, Division, ProfilesAndSubagencies, Region, Register, RegistryType, Sign
+from .search import contains, create_search_indexes, drop_search_triggers, search, sqlite_supported
+from .serializer import ContactSerializer, PrefetchedPrimaryKeyRelatedField
+from .typeahead import CHECK_INTERVAL, Superseded, current_lookup, lookups, shared_response
+from .urls import router
+from .views import RegisterViewSet, SuppliersViewSet
+
+# list endpoints filtered by role or by an excluded_* param
+EXCLUDED_FILTERS = {
+    "divisions": "excluded_supplier",
+    "signes": "excluded_supplier",
+    "deposits": "excluded_supplier",
+    "suppliers": "excluded_id",
+    "clients": "excluded_id",
+}
+# conditional response aggregate, page count and page
+LIST_QUERIES = 3
+
+
+class ExcludedFiltersTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        client = RegistryType.objects.create(name="Cliente")
+        supplier = RegistryType.objects.create(name="Fornitore")
+        both = RegistryType.objects.create(name="Cliente/Fornitore")
+
+        cls.client_only = Register.objects.create(last_name="Bianchi", email="b@example.com", registry_type=client)
+        cls.supplier = Register.objects.create(last_name="Rossi", email="r@example.com", registry_type=supplier)
+        cls.other_supplier = Register.objects.create(last_name="Verdi", email="v@example.com", registry_type=both)
+
+        for supplier in (cls.supplier, cls.other_supplier):
+            for name in ("A", "B"):
+                Division.objects.create(name=name, client=cls.other_supplier, supplier=supplier)
+                Sign.objects.create(name=name, supplier=supplier)
+                Deposit.objects.create(name=name, supplier=supplier)
+
+    def setUp(self):
+        # counts and responses are cached across requests
+        cache.clear()
+
+    def ids(self, prefix, params):
+        response = self.client.get(f"/api/contacts/{prefix}/", params)
+        self.assertEqual(response.status_code, 200)
+        return {row["id"] for row in response.json()["results"]}
+
+    def test_roles(self):
+        self.assertEqual(self.ids("suppliers", {}), {self.supplier.id, self.other_supplier.id})
+        self.assertEqual(self.ids("clients", {}), {self.client_only.id, self.other_supplier.id})
+
+    def test_excluded_id(self):
+        params = {"excluded_id": self.other_supplier.id}
+        self.assertEqual(self.ids("suppliers", params), {self.supplier.id})
+        self.assertEqual(self.ids("clients", params), {self.client_only.id})
+
+    def test_excluded_supplier(self):
+        params = {"excluded_supplier": self.supplier.id}
+        for prefix, model in [("divisions", Division), ("signes", Sign), ("deposits", Deposit)]:
+            expected = set(model.objects.filter(supplier=self.other_supplier).values_list("id", flat=True))
+            self.assertEqual(self.ids(prefix, params), expected)
+
+    def test_invalid_excluded_value(self):
+        for prefix, param in EXCLUDED_FILTERS.items():
+            response = self.client.get(f"/api/contacts/{prefix}/", {param: "x"})
+            self.assertEqual(response.status_code, 400)
+
+    def test_query_count(self):
+        for prefix, param in EXCLUDED_FILTERS.items():
+            for params in ({}, {param: self.supplier.id}):
+                cache.clear()
+                with self.subTest(prefix=prefix, params=params), self.assertNumQueries(LIST_QUERIES):
+                    self.client.get(f"/api/contacts/{prefix}/", params)
+
+    def test_no_distinct(self):
+        for prefix, param in EXCLUDED_FILTERS.items():
+            for params in ({}, {param: self.supplier.id}):
+                cache.clear()
+                with self.subTest(prefix=prefix, params=params), CaptureQueriesContext(connection) as queries:
+                    self.client.get(f"/api/contacts/{prefix}/", params)
+                for query in queries.captured_queries:
+                    self.assertNotIn("DISTINCT", query["sql"])
+
+    def test_plans(self):
+        viewsets = {prefix: (viewset, basename) for prefix, viewset, basename in router.registry}
+        for prefix, param in EXCLUDED_FILTERS.items():
+            viewset, basename = viewsets[prefix]
+            for params in ({}, {param: self.supplier.id}):
+                with self.subTest(prefix=prefix, params=params):
+                    plan = list_queryset(viewset, basename, params).explain()
+                    # the page is read in index order, without sorting or deduplicating the rows
+                    self.assertEqual(problems(plan), [])
+
+
+class MetricsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        supplier = RegistryType.objects.create(name="Fornitore")
+        Register.objects.create(last_name="Rossi", email="r@example.com", registry_type=supplier)
+        cls.admin = get_user_model().objects.create_user("admin", is_staff=True)
+
+    def test_disabled(self):
+        self.assertEqual(self.client.get("/api/_metrics").status_code, 404)
+        self.client.force_login(self.admin)
+        self.assertEqual(self.client.delete("/api/_metrics").status_code, 404)
+
+    @override_settings(API_METRICS=True)
+    def test_reset_by_admin(self):
+        self.client.get("/api/contacts/suppliers/")
+        self.assertEqual(self.client.delete("/api/_metrics").status_code, 403)
+        self.client.force_login(get_user_model().objects.create_user("user"))
+        self.assertEqual(self.client.delete("/api/_metrics").status_code, 403)
+        self.assertEqual(list(self.client.get("/api/_metrics").json()["views"]), ["SuppliersViewSet.list"])
+
+        self.client.force_login(self.admin)
+        self.assertEqual(self.client.delete("/api/_metrics").status_code, 204)
+        self.assertEqual(self.client.get("/api/_metrics").json()["views"], {})
+
+    def slow_query_log(self, **options):
+        with override_settings(API_METRICS=True, API_METRICS_SLOW_QUERY=0, **options), self.assertLogs("contactsApp.metrics") as logs:
+            # the middleware reads the settings when the client loads it
+            Client().get("/api/contacts/suppliers/", {"_search": "Rossi"})
+        return "\n".join(logs.output)
+
+    def test_slow_query_log(self):
+        # the SQL, without the searched value
+        log = self.slow_query_log(API_METRICS_EXPLAIN=True)
+        self.assertIn("SuppliersViewSet.list: slowest query took", log)
+        self.assertIn("SELECT", log)
+        self.assertNotIn("Rossi", log)
+        self.assertNotIn("params:", log)
+
+        self.assertIn("params: ", self.slow_query_log(API_METRICS_LOG_PARAMS=True))
+        self.assertIn("Rossi", self.slow_query_log(API_METRICS_LOG_PARAMS=True))
+        with mock.patch("contactsApp.metrics.explain", return_value="PLAN") as explain:
+            self.assertIn("PLAN", self.slow_query_log(API_METRICS_LOG_PARAMS=True, API_METRICS_EXPLAIN=True))
+        explain.assert_called_once()
+
+    @override_settings(API_METRICS=True)
+    def test_recorded_per_action(self):
+        self.client.force_login(self.admin)
+        self.assertEqual(self.client.delete("/api/_metrics").status_code, 204)
+        self.client.logout()
+        for _ in range(3):
+            cache.clear()
+            self.client.get("/api/contacts/suppliers/")
+        views = self.client.get("/api/_metrics").json()["views"]
+
+        self.assertEqual(list(views), ["SuppliersViewSet.list"])
+        metrics = views["SuppliersViewSet.list"]
+        self.assertEqual(metrics["requests"], 3)
+        self.assertEqual(metrics["queries"]["max"], LIST_QUERIES)
+        self.assertGreater(metrics["size"]["p50"], 0)
+
+    def test_percentiles(self):
+        histogram = Histogram([1, 2, 5, 10])
+        for value in [1] * 90 + [4] * 9 + [20]:
+            histogram.add(value)
+        self.assertEqual(histogram.percentile(50), 1)
+        self.assertEqual(histogram.percentile(95), 5)
+        # above the last bucket
+        self.assertEqual(histogram.percentile(100), 20)
+
+
+class BenchmarkTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        country = Country.objects.create(name="Italy", iso_code="ITA")
+        region = Region.objects.create(name="Milano", code="MI", country=country)
+        for postcode in ("20121", "20122", "20123"):
+            City.objects.create(name="Milano", postcode=postcode, region=region, country=country)
+        call_command("generate_data", registers=200, batch_size=50, stdout=StringIO())
+
+    def test_generated_data(self):
+        self.assertEqual(Register.objects.count(), 200)
+        self.assertEqual(Contact.objects.count(), 400)
+        self.assertEqual(ProfilesAndSubagencies.objects.count(), 200)
+        # derived columns as save() would set them
+        for register in Register.objects.select_related("registry_type")[:20]:
+            client, supplier = register.is_client, register.is_supplier
+            register.refresh_roles()
+            self.assertEqual((register.is_client, register.is_supplier), (client, supplier))
+        profile = ProfilesAndSubagencies.objects.select_related("client").first()
+        self.assertEqual(profile.client_display, f"{profile.client.last_name} - {profile.client.first_name or ''}")
+        self.assertFalse(ProfilesAndSubagencies.objects.filter(client__is_client=False).exists())
+
+    def test_scenarios_succeed(self):
+        cache.set("contactsApp:test", "kept")
+        with tempfile.TemporaryDirectory() as directory:
+            output = Path(directory) / "results.json"
+            call_command("benchmark_api", repeat=1, output=output, stdout=StringIO())
+            results = json.loads(output.read_text())
+        # the cold runs clear a private cache, not the one of the servers
+        self.assertEqual(cache.get("contactsApp:test"), "kept")
+
+        self.assertEqual(results["rows"]["contactsApp.register"], 200)
+        self.assertIn("profiles-subagencies detail client", results["scenarios"])
+        for name, result in results["scenarios"].items():
+            self.assertEqual(result["errors"], 0, name)
+
+
+class LoadTestTests(TransactionTestCase):
+    # the ASGI handler reads the database from another thread, which doesn't see the rows of a test transaction
+
+    def setUp(self):
+        country = Country.objects.create(name="Italy", iso_code="ITA")
+        region = Region.objects.create(name="Milano", code="MI", country=country)
+        City.objects.create(name="Milano", postcode="20121", region=region, country=country)
+        call_command("generate_data", registers=40, stdout=StringIO())
+
+    def test_loadtest(self):
+        with tempfile.TemporaryDirectory() as directory:
+            output = Path(directory) / "results.json"
+            call_command("loadtest_lookups", requests=20, concurrency=4, output=output, stdout=StringIO())
+            results = json.loads(output.read_text())
+
+        self.assertEqual(results["result"]["requests"], 20)
+        self.assertEqual(results["result"]["errors"], 0)
+
+
+class TypeaheadTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        supplier = RegistryType.objects.create(name="Fornitore")
+        for last_name in ("Rossi", "Rosa", "Verdi"):
+            Register.objects.create(last_name=last_name, email=f"{last_name}@example.com", registry_type=supplier)
+
+    def setUp(self):
+        cache.clear()
+
+    def search(self, value):
+        return self.client.get("/api/contacts/suppliers/", {"_search": value}, headers={"X-Lookup-Key": "lookup"})
+
+    def test_sequential_searches(self):
+        for value in ("R", "Ro", "Ros"):
+            self.assertEqual(self.search(value).status_code, 200)
+
+    def test_superseded(self):
+        key = lookups.lookup_key(RequestFactory().get("/", HTTP_X_LOOKUP_KEY="lookup"))
+
+        def newer_search(execute, sql, params, many, context):
+            # the next keystroke arrives while the first query runs
+            lookups.start(key)
+            return execute(sql, params, many, context)
+
+        with connection.execute_wrapper(newer_search):
+            response = self.search("Ro")
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json()["detail"], Superseded.default_detail)
+
+    def test_superseded_checks(self):
+        key = "contactsApp:lookup:test"
+        lookup = lookups.start(key)
+        context = {"connection": connection}
+
+        def query():
+            return lookups.execute(lookup, lambda *args: None, "SELECT 1", None, False, context)
+
+        with mock.patch.object(cache, "get", wraps=cache.get) as get:
+            for _ in range(3):
+                query()
+            # the token stored by the request is not read back before every query
+            get.assert_not_called()
+
+            # a newer request of another process, seen once the interval is over
+            cache.set(key, "newer")
+            query()
+            lookup.checked -= CHECK_INTERVAL
+            with self.assertRaises(Superseded):
+                query()
+            get.assert_called_once_with(key)
+        lookups.finish(lookup)
+
+        # a newer request of this process, seen at once
+        lookup = lookups.start(key)
+        newer = lookups.start(key)
+        with self.assertRaises(Superseded):
+            query()
+        lookups.finish(lookup)
+        lookups.finish(newer)
+        self.assertNotIn(key, lookups.latest)
+
+    @skipUnless(connection.vendor == "sqlite", "interrupts SQLite queries")
+    def test_running_query_interrupted(self):
+        key = "contactsApp:lookup:test"
+        older = lookups.start(key)
+        errors = []
+
+        def run():
+            reset = current_lookup.set(older)
+            try:
+                with connection.cursor() as cursor:
+                    cursor.execute(
+                        "WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n LIMIT 100000000) "
+                        "SELECT count(*) FROM n"
+                    )
+            except Superseded as e:
+                errors.append(e)
+            finally:
+                current_lookup.reset(reset)
+                connection.close()
+
+        thread = threading.Thread(target=run)
+        thread.start()
+        deadline = time.monotonic() + 5
+        while key not in lookups.running and time.monotonic() < deadline:
+            time.sleep(0.01)
+        lookups.start(key)
+        thread.join(10)
+        self.assertFalse(thread.is_alive())
+        self.assertEqual(len(errors), 1)
+        # raised by the interrupted query, not before it
+        self.assertIsNotNone(errors[0].__cause__)
+
+    def test_identical_requests_shared(self):
+        calls = []
+        started = threading.Event()
+        release = threading.Event()
+
+        def handler():
+            calls.append(1)
+            started.set()
+            release.wait(10)
+            return Response({"results": [1]})
+
+        responses = []
+        leader = threading.Thread(target=lambda: responses.append(shared_response("key", handler)))
+        leader.start()
+        started.wait(10)
+        # the first request runs the handler, the others wait for it
+        followers = [threading.Thread(target=lambda: responses.append(shared_response("key", handler))) for _ in range(2)]
+        for thread in followers:
+            thread.start()
+        time.sleep(0.05)
+        release.set()
+        for thread in (leader, *followers):
+            thread.join(10)
+        self.assertEqual(len(calls), 1)
+        self.assertEqual([response.data for response in responses], [{"results": [1]}] * 3)
+
+
+class ReadDatabaseTests(TestCase):
+    # the routed aliases are not in DATABASES, the test mirrors of settings_replicas are read through default
+    viewset = RegisterViewSet.as_view({"get": "list", "post": "create"})
+
+    def route(self, method, view=viewset, status=200, cookies=None):
+        """
+        (alias the router picks for the reads of the request, response)
+        """
+        aliases = []
+
+        def get_response(request):
+            middleware.process_view(request, view, (), {})
+            aliases.append(ReadDatabaseRouter().db_for_read(Register))
+            return HttpResponse(status=status)
+
+        middleware = ReadDatabaseMiddleware(get_response)
+        factory = RequestFactory()
+        for name, value in (cookies or {}).items():
+            factory.cookies[name] = value
+        response = middleware(getattr(factory, method)("/"))
+        return aliases[0], response
+
+    @override_settings(READ_DATABASES=["replica_a", "replica_b"])
+    def test_routed_requests(self):
+        self.assertIn(self.route("get")[0], ["replica_a", "replica_b"])
+        self.assertIsNone(self.route("post")[0])
+        self.assertIsNone(self.route("get", view=lambda request: None)[0])
+        # not kept after the request
+        self.assertIsNone(ReadDatabaseRouter().db_for_read(Register))
+
+    @override_settings(READ_DATABASES=["replica_a"], READ_YOUR_WRITES_SECONDS=10)
+    def test_read_your_writes(self):
+        self.assertNotIn(PRIMARY_COOKIE, self.route("post", status=400)[1].cookies)
+        cookie = self.route("post")[1].cookies[PRIMARY_COOKIE]
+        self.assertEqual(cookie["max-age"], 10)
+
+        # the writer reads from default until the cookie expires
+        self.assertIsNone(self.route("get", cookies={PRIMARY_COOKIE: cookie.value})[0])
+        self.assertEqual(self.route("get", cookies={PRIMARY_COOKIE: str(time.time() - 1)})[0], "replica_a")
+        self.assertEqual(self.route("get", cookies={PRIMARY_COOKIE: "x"})[0], "replica_a")
+
+    @override_settings(READ_DATABASES=["replica_a"], READ_YOUR_WRITES_SECONDS=10)
+    def test_read_your_writes_cross_origin(self):
+        # as djangoStore sends them: from the dev server origin, without cookies, echoing the header
+        origin = {"Origin": "http://localhost:8080"}
+        registry_type = RegistryType.objects.create(name="Cliente")
+        response = self.client.post(
+            "/api/contacts/register/",
+            {"last_name": "Rossi", "email": "r@example.com", "registry_type": registry_type.id},
+            content_type="application/json",
+            headers=origin,
+        )
+        self.assertEqual(response.status_code, 201)
+        until = response[PRIMARY_HEADER]
+        self.assertIn(PRIMARY_HEADER.lower(), response["Access-Control-Expose-Headers"].lower())
+        self.client.cookies.clear()
+
+        preflight = self.client.options("/api/contacts/register/", headers={
+            **origin,
+            "Access-Control-Request-Method": "GET",
+            "Access-Control-Request-Headers": PRIMARY_HEADER.lower(),
+        })
+        self.assertIn(PRIMARY_HEADER.lower(), preflight["Access-Control-Allow-Headers"])
+
+        # read from default, which has the new row
+        response = self.client.get("/api/contacts/register/", headers={**origin, PRIMARY_HEADER: until})
+        self.assertEqual(response.json()["count"], 1)
+        # without the header the read goes to the replica
+        with self.assertRaises(ConnectionDoesNotExist):
+            self.client.get("/api/contacts/register/", headers=origin)
+
+    @override_settings(READ_YOUR_WRITES_SECONDS=10)
+    def test_replica_cache_timeout(self):
+        self.assertEqual(replica_timeout(300), 300)
+        reset = read_alias.set("replica1")
+        try:
+            self.assertEqual(replica_timeout(300), 10)
+            self.assertEqual(read_source(), "replica")
+        finally:
+            read_alias.reset(reset)
+
+    def test_production_profile(self):
+        from backend.settings_production import sqlite_database
+
+        with tempfile.TemporaryDirectory() as directory:
+            name = Path(directory) / "db.sqlite3"
+            databases = ConnectionHandler({
+                "default": sqlite_database(name=name, transaction_mode="IMMEDIATE"),
+                "query_only": sqlite_database("PRAGMA query_only=ON", name=name),
+            })
+            default, readonly = databases["default"], databases["query_only"]
+            try:
+                with default.cursor() as cursor:
+                    self.assertEqual(cursor.execute("PRAGMA journal_mode").fetchone()[0], "wal")
+                    # NORMAL
+                    self.assertEqual(cursor.execute("PRAGMA synchronous").fetchone()[0], 1)
+                    cursor.execute("CREATE TABLE t (id integer)")
+                with readonly.cursor() as cursor:
+                    cursor.execute("SELECT count(*) FROM t")
+                    with self.assertRaises(DatabaseError):
+                        cursor.execute("INSERT INTO t VALUES (1)")
+            finally:
+                default.close()
+                readonly.close()
+
+    def test_replicate(self):
+        from backend.settings_production import sqlite_database
+
+        with tempfile.TemporaryDirectory() as directory:
+            replica_name = Path(directory) / "replica.sqlite3"
+            databases = ConnectionHandler({
+                "default": sqlite_database(name=Path(directory) / "db.sqlite3"),
+                "replica": sqlite_database("PRAGMA query_only=ON", name=replica_name),
+            })
+            source, replica = databases["default"], databases["replica"]
+            try:
+                with source.cursor() as cursor:
+                    cursor.execute("CREATE TABLE t (id integer)")
+                replicate(source, replica_name)
+                with source.cursor() as cursor:
+                    cursor.execute("INSERT INTO t VALUES (1)")
+                # the replica lags until the next copy, which its open connection then sees
+                with replica.cursor() as cursor:
+                    self.assertEqual(cursor.execute("SELECT count(*) FROM t").fetchone()[0], 0)
+                replicate(source, replica_name)
+                with replica.cursor() as cursor:
+                    self.assertEqual(cursor.execute("SELECT count(*) FROM t").fetchone()[0], 1)
+            finally:
+                source.close()
+                replica.close()
+
+
+class MigrationTests(TransactionTestCase):
+    def migrate(self, target=None):
+        """
+        Migrates the app to target (default the latest migration), returns the models of target
+        """
+        call_command("migrate", "contactsApp", *([target] if target else []), verbosity=0)
+        return MigrationLoader(connection).project_state(("contactsApp", target)).apps if target else None
+
+    def test_backfills(self):
+        apps = self.migrate("0004_geo_import_checkpoint")
+        try:
+            model = lambda name: apps.get_model("contactsApp", name)  # noqa: E731
+            country = model("Country").objects.create(iso_code="ITA", name="Italia")
+            city = model("City").objects.create(name="Avezzano", postcode="67051", country=country)
+            branch = model("Branch").objects.create(name="Sede", code="S1")
+            client = model("RegistryType").objects.create(name="Cliente")
+            supplier = model("RegistryType").objects.create(name="Fornitore")
+            rossi = model("Register").objects.create(last_name="Rossi", email="r@example.com", registry_type=client)
+            bianchi = model("Register").objects.create(last_name="Bianchi", email="b@example.com", registry_type=supplier)
+            contact = model("Contact").objects.create(
+                register=rossi, branch=branch, name="Rossi srl", phone="1", email="r@example.com",
+                country=country, city=city, address="Via Roma",
+            )
+        finally:
+            self.migrate()
+
+        contact = Contact.objects.get(pk=contact.pk)
+        self.assertEqual(
+            [contact.branch_display, contact.country_display, contact.region_display, contact.city_display],
+            ["S1 - Sede", "ITA - Italia", " - ", "67051 - Avezzano"],
+        )
+        self.assertIsNotNone(contact.updated_at)
+        self.assertEqual(
+            list(Register.objects.order_by("pk").values_list("pk", "is_client", "is_supplier")),
+            [(rossi.pk, True, False), (bianchi.pk, False, True)],
+        )
+        # the search index was rebuilt over the migrated rows
+        self.assertEqual([row.name for row in search(City.objects.all(), "avez", ["name"])], ["Avezzano"])
+
+
+class AutocompleteTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.italy = Country.objects.create(iso_code="ITA", name="Italy")
+        cls.france = Country.objects.create(iso_code="FRA", name="France")
+        cls.milano = Region.objects.create(country=cls.italy, name="Milano", code="MI")
+        cls.messina = Region.objects.create(country=cls.italy, name="Messina", code="ME")
+        forli = Region.objects.create(country=cls.italy, name="Forlì-Cesena", code="FC")
+        City.objects.create(country=cls.italy, region=cls.milano, name="Milano", postcode="20121")
+        City.objects.create(country=cls.italy, region=cls.messina, name="Milazzo", postcode="98057")
+        City.objects.create(country=cls.italy, region=forli, name="Forlì", postcode="47121")
+        City.objects.create(country=cls.france, name="Millau", postcode="12100")
+
+    def setUp(self):
+        # the index is rebuilt on the new City version
+        cache.clear()
+
+    def names(self, query, **params):
+        response = self.client.get("/api/contacts/cities/autocomplete/", {"q": query, **params})
+        self.assertEqual(response.status_code, 200)
+        return [city["name"] for city in response.json()]
+
+    def test_prefix(self):
+        self.assertEqual(self.names("mil"), ["Milano", "Milazzo", "Millau"])
+        self.assertEqual(self.names("MILA"), ["Milano", "Milazzo"])
+        self.assertEqual(self.names("forli"), ["Forlì"])
+        self.assertEqual(self.names("mil", limit=2), ["Milano", "Milazzo"])
+        self.assertEqual(self.names("lano"), [])
+
+    def test_postcode(self):
+        response = self.client.get("/api/contacts/cities/autocomplete/", {"q": "201"})
+        city = City.objects.get(name="Milano")
+        self.assertEqual(response.json(), [
+            {"id": city.pk, "name": "Milano", "region": self.milano.pk, "postcode": "20121", "country": self.italy.pk},
+        ])
+        # a city matched by name and postcode is returned once
+        City.objects.create(country=self.italy, name="20100")
+        self.assertEqual(self.names("20"), ["20100", "Milano"])
+
+    def test_filters(self):
+        self.assertEqual(self.names("mil", country=self.italy.pk), ["Milano", "Milazzo"])
+        self.assertEqual(self.names("mil", country=self.france.pk), ["Millau"])
+        self.assertEqual(self.names("mil", region=self.messina.pk), ["Milazzo"])
+        self.assertEqual(self.names("mil", country=self.italy.pk, region=self.milano.pk), ["Milano"])
+        self.assertEqual(self.names("mil", country=self.france.pk, region=self.milano.pk), [])
+        self.assertEqual(self.names("mil", region=0), [])
+        for params in ({"country": "x"}, {"region": "-1"}, {"limit": "ten"}):
+            response = self.client.get("/api/contacts/cities/autocomplete/", {"q": "mil", **params})
+            self.assertEqual(response.status_code, 400)
+
+    def test_invalidation(self):
+        self.assertEqual(self.names("mil"), ["Milano", "Milazzo", "Millau"])
+        # served from the index
+        with self.assertNumQueries(0):
+            self.assertEqual(self.names("mil"), ["Milano", "Milazzo", "Millau"])
+
+        city = City.objects.create(country=self.italy, region=self.milano, name="Milanino", postcode="20092")
+        self.assertEqual(self.names("milan", region=self.milano.pk), ["Milanino", "Milano"])
+        city.name = "Cusano Milanino"
+        city.save()
+        self.assertEqual(self.names("milan"), ["Milano"])
+        self.assertEqual(self.names("cus"), ["Cusano Milanino"])
+        city.delete()
+        self.assertEqual(self.names("cus"), [])
+
+        # writes without signals are seen once another process bumps the shared version
+        City.objects.filter(name="Millau").update(name="Rodez")
+        self.assertEqual(self.names("rod"), [])
+        bump_model_version(City)
+        self.assertEqual(self.names("rod"), ["Rodez"])
+
+
+@skipUnless(sqlite_supported(connection), "FTS5 trigram index of SQLite")
+class SearchTests(TestCase):
+    names = ["Abbadia", "Barete", "Castelbarco", "Barumini", "Sbarra", "Roma"]
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.country = Country.objects.create(iso_code="ITA", name="Italy")
+        for name in cls.names:
+            City.objects.create(country=cls.country, name=name)
+
+    def schema(self, table):
+        """
+        The search table of table and its triggers, without the FTS5 shadow tables
+        """
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT type, name FROM sqlite_master WHERE (type = 'trigger' AND tbl_name = %s) OR name = %s",
+                [table, f"{table}_search"],
+            )
+            return set(cursor.fetchall())
+
+    def assertMatchesIcontains(self, value):
+        indexed = list(search(City.objects.all(), value, ["name", "postcode"], ranked=False))
+        self.assertEqual(indexed, list(City.objects.filter(contains(["name", "postcode"], value)).order_by("name")))
+        return [city.name for city in indexed]
+
+    def test_index(self):
+        table = City._meta.db_table
+        self.assertEqual(self.schema(table), {
+            ("table", f"{table}_search"),
+            ("trigger", f"{table}_search_insert"),
+            ("trigger", f"{table}_search_update"),
+            ("trigger", f"{table}_search_delete"),
+        })
+        with connection.cursor() as cursor:
+            cursor.execute(f'SELECT sql FROM sqlite_master WHERE name = "{table}_search"')
+            self.assertIn("tokenize='trigram'", cursor.fetchone()[0])
+
+    def test_ranking(self):
+        with CaptureQueriesContext(connection) as queries:
+            cities = [city.name for city in search(City.objects.all(), "BAR", ["name"])]
+        self.assertIn("MATCH", queries.captured_queries[0]["sql"])
+        # prefix matches first, then the others, each by name
+        self.assertEqual(cities, ["Barete", "Barumini", "Castelbarco", "Sbarra"])
+
+    def test_short_value(self):
+        with CaptureQueriesContext(connection) as queries:
+            cities = [city.name for city in search(City.objects.all(), "ba", ["name"])]
+        self.assertNotIn("MATCH", queries.captured_queries[0]["sql"])
+        self.assertEqual(cities, ["Abbadia", "Barete", "Barumini", "Castelbarco", "Sbarra"])
+        # columns without an index fall back too
+        self.assertEqual([city.name for city in search(City.objects.all(), "ita", ["country__name"])], sorted(self.names))
+
+    def test_writes(self):
+        self.assertEqual(self.assertMatchesIcontains("bar"), ["Barete", "Barumini", "Castelbarco", "Sbarra"])
+        city = City.objects.create(country=self.country, name="Ribera", postcode="92016")
+        self.assertEqual(self.assertMatchesIcontains("ber"), ["Ribera"])
+        self.assertEqual(self.assertMatchesIcontains("920"), ["Ribera"])
+
+        city.name = "Ribarossa"
+        city.save()
+        self.assertEqual(self.assertMatchesIcontains("ber"), [])
+        self.assertEqual(self.assertMatchesIcontains("bar"), ["Barete", "Barumini", "Castelbarco", "Ribarossa", "Sbarra"])
+
+        City.objects.filter(name="Barete").delete()
+        City.objects.bulk_create([City(country=self.country, name="Albarella")])
+        self.assertEqual(self.assertMatchesIcontains("bar"), ["Albarella", "Barumini", "Castelbarco", "Ribarossa", "Sbarra"])
+
+    def test_migrate_triggers(self):
+        table = City._meta.db_table
+        plan = [(MigrationLoader(connection).get_migration("contactsApp", "0001_initial"), False)]
+        drop_search_triggers(plan=[])
+        self.assertEqual(len(self.schema(table)), 4)
+
+        drop_search_triggers(plan=plan)
+        self.assertEqual(self.schema(table), {("table", f"{table}_search")})
+        # written while the triggers are missing, indexed by the rebuild
+        City.objects.create(country=self.country, name="Bardonecchia")
+        create_search_indexes()
+        self.assertEqual(len(self.schema(table)), 4)
+        self.assertEqual(
+            self.assertMatchesIcontains("bar"), ["Bardonecchia", "Barete", "Barumini", "Castelbarco", "Sbarra"]
+        )
+
+
+class GeoSyncTests(TestCase):
+    header = "country_code,zipcode,place,state,state_code,province,province_code,community,community_code,latitude,longitude\n"
+    rows = [("67010", "Barete", "L'Aquila", "AQ"), ("67012", "San Giovanni", "L'Aquila", "AQ"), ("67013", "Campotosto", "L'Aquila", "AQ")]
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = Path(directory.name)
+
+    def sync(self, rows, source="zipcodes.it.csv"):
+        path = self.directory / source
+        path.write_text(self.header + "".join(
+            f'IT,{zipcode},{place},Abruzzi,01,{province},{code},"","",0,0\n' for zipcode, place, province, code in rows
+        ))
+        return sync_source(source, path, read_zipcodes(path))
+
+    def city(self, place):
+        return City.objects.select_related("region").get(name=place)
+
+    def test_sync(self):
+        self.assertEqual(self.sync(self.rows), SyncResult(False, 3, 0, 0, 0))
+        self.assertEqual(self.sync(self.rows), SyncResult(True, 0, 0, 0, 0))
+
+        barete = self.city("Barete")
+        giovanni = self.city("San Giovanni")
+        # one row changed, one vanished
+        rows = [self.rows[0], ("67012", "San Giovanni", "Teramo", "TE")]
+        self.assertEqual(self.sync(rows), SyncResult(False, 0, 1, 1, 0))
+        self.assertEqual(self.city("Barete").updated_at, barete.updated_at)
+        self.assertEqual(self.city("San Giovanni").pk, giovanni.pk)
+        self.assertEqual(self.city("San Giovanni").region.code, "TE")
+        self.assertFalse(City.objects.filter(name="Campotosto").exists())
+
+    def test_vanished_city_in_use(self):
+        self.sync(self.rows)
+        city = self.city("Campotosto")
+        Contact.objects.create(
+            register=Register.objects.create(
+                last_name="Rossi", email="r@example.com", registry_type=RegistryType.objects.create(name="Cliente")
+            ),
+            branch=Branch.objects.create(name="Sede"),
+            name="Rossi srl", phone="1", email="r@example.com", country=city.country, city=city, address="Via Roma",
+        )
+        self.assertEqual(self.sync(self.rows[:2]), SyncResult(False, 0, 0, 0, 1))
+        self.assertTrue(City.objects.filter(pk=city.pk).exists())
+
+    def test_shared_cities_not_rewritten(self):
+        # adopted from an earlier full import
+        country = Country.objects.create(iso_code="ITA", name="Italy")
+        region = Region.objects.create(country=country, name="L'Aquila", code="AQ")
+        adopted = City.objects.create(country=country, region=region, name="Barete", postcode="67010")
+        self.sync(self.rows)
+        # imported by another source too
+        self.sync(self.rows[1:2], source="zipcodes.sm.csv")
+        shared = self.city("San Giovanni")
+
+        moved = [(zipcode, place, "Teramo", "TE") for zipcode, place, _, _ in self.rows]
+        self.assertEqual(self.sync(moved), SyncResult(False, 2, 1, 0, 0))
+        self.assertEqual(City.objects.get(pk=adopted.pk).region_id, region.pk)
+        self.assertEqual(City.objects.get(pk=shared.pk).region_id, region.pk)
+        self.assertEqual(City.objects.filter(region__code="TE").count(), 3)
+
+
+class GeoImportTests(TestCase):
+    header = "country_code,zipcode,place,state,state_code,province,province_code,community,community_code,latitude,longitude\n"
+    rows = [
+        ("67010", "Barete", "L'Aquila", "AQ"), ("67012", "San Giovanni", "L'Aquila", "AQ"),
+        ("67013", "Campotosto", "L'Aquila", "AQ"), ("64100", "Teramo", "Teramo", "TE"), ("64020", "Bellante", "Teramo", "TE"),
+    ]
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = Path(directory.name)
+
+    def zipcodes(self, rows, source="zipcodes.it.csv"):
+        path = self.directory / source
+        path.write_text(self.header + "".join(
+            f'IT,{zipcode},{place},Abruzzi,01,{province},{code},"","",0,0\n' for zipcode, place, province, code in rows
+        ))
+        return path
+
+    def import_worldcities(self, *paths, **options):
+        stdout = StringIO()
+        call_command("import_worldcities", *paths, stdout=stdout, **options)
+        return stdout.getvalue()
+
+    def cities(self):
+        return sorted(City.objects.values_list("country__iso_code", "region__name", "region__code", "name", "postcode"))
+
+    def test_import(self):
+        path = self.zipcodes(self.rows)
+        output = self.import_worldcities(path)
+        self.assertRegex(output, r"cities\s+5 rows")
+        self.assertEqual(Country.objects.get().iso_code, "ITA")
+        self.assertEqual(sorted(Region.objects.values_list("name", "code")), [("L'Aquila", "AQ"), ("Teramo", "TE")])
+        self.assertIn(("ITA", "Teramo", "TE", "Bellante", "64020"), self.cities())
+        self.assertEqual(len(self.cities()), 5)
+
+        # a rerun of the same file inserts nothing
+        cities = self.cities()
+        output = self.import_worldcities(path)
+        self.assertRegex(output, r"regions\s+0 rows")
+        self.assertRegex(output, r"cities\s+0 rows")
+        self.assertEqual(self.cities(), cities)
+        self.assertEqual(Region.objects.count(), 2)
+
+    def test_chunk_resume(self):
+        path = self.zipcodes(self.rows)
+        save_cities = geodata.save_cities
+        calls = []
+
+        def interrupted(*args, **kwargs):
+            calls.append(args[0])
+            if len(calls) == 2:
+                raise DatabaseError("interrupted")
+            return save_cities(*args, **kwargs)
+
+        with mock.patch.object(geodata, "save_cities", interrupted), self.assertRaises(DatabaseError):
+            self.import_worldcities(path, chunk_size=2)
+        # the first chunk is committed, the failed one rolled back
+        checkpoint = GeoImportCheckpoint.objects.get(source="zipcodes.it.csv")
+        self.assertEqual(checkpoint.offset, 2)
+        self.assertEqual([name for *_, name, _ in self.cities()], ["Barete", "San Giovanni"])
+
+        output = self.import_worldcities(path, chunk_size=2)
+        self.assertIn("zipcodes.it.csv: resuming after row 2", output)
+        self.assertIn("zipcodes.it.csv: 3 rows, 3 cities created", output)
+        self.assertFalse(GeoImportCheckpoint.objects.exists())
+        self.assertEqual(len(self.cities()), 5)
+
+        # a finished import starts over, finding every city already stored
+        output = self.import_worldcities(path, chunk_size=2)
+        self.assertIn("zipcodes.it.csv: 5 rows, 0 cities created", output)
+
+        # a changed file doesn't resume from the checkpoint of the old version
+        GeoImportCheckpoint.objects.create(source="zipcodes.it.csv", checksum="old", offset=4)
+        output = self.import_worldcities(self.zipcodes(self.rows + [("64010", "Ancarano", "Teramo", "TE")]), chunk_size=2)
+        self.assertNotIn("resuming", output)
+        self.assertIn("zipcodes.it.csv: 6 rows, 1 cities created", output)
+
+    def test_workers(self):
+        worldcities = self.directory / "worldcities.csv"
+        worldcities.write_text(
+            "popularity,geoname_id,name_en,country_code,population,latitude,longitude,country,region,continent,code2,code,province\n"
+            '1346,2988507,Paris,FR,2138551,48.85,2.34,France,"Western Europe",Europe,FR,FRA,Île-de-France\n'
+            '177,2990440,Nice,FR,338620,43.70,7.26,France,"Western Europe",Europe,FR,FRA,"Provence-Alpes-Côte d\'Azur"\n'
+            '1437,3169070,Rome,IT,2563241,41.89,12.48,Italy,"Southern Europe",Europe,IT,ITA,Latium\n',
+            encoding="utf-8",
+        )
+        paths = [worldcities, self.zipcodes(self.rows)]
+
+        self.import_worldcities(*paths, workers=2)
+        cities = self.cities()
+        City.objects.all().delete()
+        Region.objects.all().delete()
+        Country.objects.all().delete()
+        self.import_worldcities(*paths, workers=1)
+
+        self.assertEqual(self.cities(), cities)
+        # Italy comes from its zipcodes file only
+        self.assertEqual(len(cities), 7)
+        self.assertNotIn("Rome", [name for *_, name, _ in cities])
+        self.assertIn(("FRA", "Île-de-France", None, "Paris", None), cities)
+
+
+class KeysetPaginationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        client = RegistryType.objects.create(name="Cliente")
+        supplier = RegistryType.objects.create(name="Fornitore")
+        names = [("Rossi", "Mario"), ("Rossi", None), ("Bianchi", "Anna"), ("Rossi", "Mario"), ("Verdi", None),
+                 ("Bianchi", "Luca"), ("Neri", "Anna"), ("Rossi", "Carla"), ("Verdi", "Paolo")]
+        registers = [
+            Register.objects.create(
+                last_name=last_name, first_name=first_name, email=f"{i}@example.com",
+                registry_type=supplier if i % 3 else client,
+            )
+            for i, (last_name, first_name) in enumerate(names)
+        ]
+        for i, register in enumerate(registers[:6]):
+            Division.objects.create(name=f"D{i % 2}", client=registers[0], supplier=register)
+
+    def setUp(self):
+        cache.clear()
+
+    def rows(self, prefix, params):
+        response = self.client.get(f"/api/contacts/{prefix}/", {**params, "limit": 100})
+        self.assertEqual(response.status_code, 200)
+        return response.json()["results"]
+
+    def cursor_rows(self, prefix, params):
+        """
+        Rows of every page, following the next links from an empty cursor
+        """
+        url, params = f"/api/contacts/{prefix}/", {**params, "cursor": "", "limit": 2}
+        rows = []
+        while url:
+            response = self.client.get(url, params)
+            self.assertEqual(response.status_code, 200)
+            data = response.json()
+            rows += data["results"]
+            url, params = data["next"], {}
+            self.assertLess(len(rows), 100, "the cursor doesn't move forward")
+        return rows
+
+    def test_pages_match_offset(self):
+        for prefix, params, fields in [
+            ("register", {}, ["last_name", "first_name"]),
+            ("register", {"ordering": "-first_name"}, ["first_name"]),
+            # annotation
+            ("register", {"ordering": "registry_type_display"}, ["registry_type_display"]),
+            ("register", {"ordering": "-registry_type_display"}, ["registry_type_display"]),
+            # display column
+            ("divisions", {"ordering": "supplier_display"}, ["supplier_display"]),
+            # conditional response
+            ("suppliers", {}, ["last_name", "first_name"]),
+        ]:
+            with self.subTest(prefix=prefix, **params):
+                expected = self.rows(prefix, params)
+                rows = self.cursor_rows(prefix, params)
+                # the same rows in the same order, rows with equal values are ordered on the
+                # primary key by the cursor only
+                values = lambda rows: [[row[field] for field in fields] for row in rows]  # noqa: E731
+                self.assertEqual(values(rows), values(expected))
+                self.assertEqual(sorted(row["id"] for row in rows), sorted(row["id"] for row in expected))
+                self.assertEqual(len(rows), len({row["id"] for row in rows}))
+
+    def test_after_cursor(self):
+        for ordering in [
+            [("first_name", False), ("pk", False)],
+            [("first_name", True), ("pk", False)],
+            [("last_name", True), ("first_name", False), ("pk", False)],
+            [("first_name", True), ("last_name", False), ("pk", True)],
+        ]:
+            with self.subTest(ordering=ordering):
+                names = [name for name, _ in ordering]
+                queryset = Register.objects.order_by(*order_by(ordering))
+                rows = list(queryset.values_list(*names))
+                for i, values in enumerate(rows):
+                    after = queryset.filter(after_cursor(ordering, values)).values_list(*names)
+                    self.assertEqual(list(after), rows[i + 1:])
+
+    def test_keyset_ordering(self):
+        # foreign keys are compared on their ids, not on the related ordering
+        self.assertEqual(
+            keyset_ordering(Division.objects.order_by("supplier", "-name")),
+            [("supplier_id", False), ("name", True), ("pk", False)],
+        )
+        self.assertEqual(keyset_ordering(Register.objects.order_by("-pk")), [("pk", True)])
+        self.assertEqual(
+            keyset_ordering(City.objects.all()),
+            [("name", False), ("postcode", False), ("region_id", False), ("country_id", False), ("pk", False)],
+        )
+        self.assertIsNone(keyset_ordering(Register.objects.order_by(Lower("last_name"))))
+
+    def test_invalid_cursor(self):
+        url = "/api/contacts/register/"
+        self.assertEqual(self.client.get(url, {"cursor": "not a cursor"}).status_code, 404)
+        self.assertEqual(self.client.get(url, {"cursor": "e30="}).status_code, 404)
+        # a cursor of another ordering
+        next_link = self.client.get(url, {"cursor": "", "limit": 2}).json()["next"]
+        self.assertEqual(self.client.get(next_link).status_code, 200)
+        self.assertEqual(self.client.get(replace_query_param(next_link, "ordering", "-last_name")).status_code, 404)
+
+
+class CountCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def count(self, params):
+        response = self.client.get("/api/contacts/register/", params)
+        self.assertEqual(response.status_code, 200)
+        return response.json()["count"]
+
+    def test_related_write(self):
+        other = RegistryType.objects.create(name="Altro")
+        private = RegistryType.objects.create(name="Privato")
+        Register.objects.create(last_name="Rossi", email="r@example.com", registry_type=other)
+        Register.objects.create(last_name="Bianchi", email="b@example.com", registry_type=private)
+        params = {"registry_type_display__icontains": "priv"}
+        self.assertEqual(self.count(params), 1)
+
+        # the registers don't change, the rows the filter matches do
+        other.name = "Privato (estero)"
+        other.save()
+        self.assertEqual(self.count(params), 2)
+
+    def test_query_models(self):
+        self.assertEqual(query_models(Contact.objects.all().query), [Contact])
+        self.assertEqual(
+            query_models(Contact.objects.filter(city__name="Avezzano", region__name="L'Aquila").query),
+            [City, Contact, Region],
+        )
+        subquery = Contact.objects.filter(city__name="Avezzano").values("register")
+        self.assertEqual(query_models(Register.objects.filter(pk__in=subquery).query), [City, Contact, Register])
+
+
+class ConditionalResponseTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.supplier_type = RegistryType.objects.create(name="Fornitore")
+        cls.rossi = Register.objects.create(last_name="Rossi", email="r@example.com", registry_type=cls.supplier_type)
+        Register.objects.create(last_name="Bianchi", email="b@example.com", registry_type=cls.supplier_type)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_headers(self):
+        response = self.client.get("/api/contacts/suppliers/")
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response["ETag"].startswith('"'))
+        last_write = Register.objects.latest("updated_at").updated_at
+        self.assertEqual(response["Last-Modified"], http_date(int(last_write.timestamp())))
+        self.assertIn("no-cache", response["Cache-Control"])
+
+        detail = self.client.get(f"/api/contacts/suppliers/{self.rossi.pk}/")
+        self.assertNotEqual(detail["ETag"], response["ETag"])
+        self.assertEqual(detail["Last-Modified"], http_date(int(self.rossi.updated_at.timestamp())))
+        self.assertEqual(self.client.get("/api/contacts/suppliers/0/").status_code, 404)
+
+    def test_not_modified(self):
+        response = self.client.get("/api/contacts/suppliers/", {"limit": 1})
+        # the stamp is cached, the 304 doesn't query the database
+        with self.assertNumQueries(0):
+            revalidated = self.client.get("/api/contacts/suppliers/", {"limit": 1}, headers={"If-None-Match": response["ETag"]})
+        self.assertEqual(revalidated.status_code, 304)
+        self.assertEqual(revalidated["ETag"], response["ETag"])
+        modified = self.client.get("/api/contacts/suppliers/", {"limit": 1}, headers={"If-Modified-Since": response["Last-Modified"]})
+        self.assertEqual(modified.status_code, 304)
+        # another page has another representation, the stamp is shared
+        with CaptureQueriesContext(connection) as queries:
+            other_page = self.client.get("/api/contacts/suppliers/", {"limit": 1, "offset": 1}, headers={"If-None-Match": response["ETag"]})
+        self.assertEqual(other_page.status_code, 200)
+        self.assertFalse(any("MAX(" in query["sql"] for query in queries.captured_queries))
+
+    def test_shared_evaluation(self):
+        release = threading.Event()
+        aggregate_stamp = ConditionalResponseMixin.aggregate_stamp
+        calls = []
+
+        def slow_aggregate(view, key, queryset):
+            calls.append(key)
+            release.wait(10)
+            return aggregate_stamp(view, key, queryset)
+
+        # a request missing the stamp runs the aggregate, an identical one waits for its result
+        key = "contactsApp:stamp:test"
+        results = []
+        with mock.patch.object(ConditionalResponseMixin, "aggregate_stamp", slow_aggregate):
+            view = SuppliersViewSet()
+            leader = threading.Thread(target=lambda: results.append(view.response_stamp(key, Register.objects.none())))
+            leader.start()
+            while not calls:
+                time.sleep(0.01)
+            follower = threading.Thread(target=lambda: results.append(view.response_stamp(key, Register.objects.none())))
+            follower.start()
+            time.sleep(0.05)
+            release.set()
+            leader.join(10)
+            follower.join(10)
+        self.assertEqual(calls, [key])
+        self.assertEqual(results, [{"count": 0, "updated_at": None}] * 2)
+
+        with mock.patch("contactsApp.caching.shared_response", wraps=shared_response) as shared:
+            self.client.get("/api/contacts/suppliers/", {"_search": "ro"})
+        # the view is shared on the endpoint, the params and the model versions
+        flight = shared.call_args.args[0]
+        params = params_hash(QueryDict("_search=ro"))
+        self.assertTrue(flight.startswith("contactsApp:stamp:contactsApp.register:"))
+        self.assertTrue(flight.endswith(f":/api/contacts/suppliers/:{params}:json:http://testserver/api/contacts/suppliers/:{params}"))
+
+    def test_write(self):
+        etag = self.client.get("/api/contacts/suppliers/")["ETag"]
+        self.rossi.phone = "123"
+        self.rossi.save()
+        response = self.client.get("/api/contacts/suppliers/", headers={"If-None-Match": etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+
+        # rows shown through etag_related
+        etag = self.client.get("/api/contacts/register/")["ETag"]
+        self.supplier_type.name = "Fornitore estero"
+        self.supplier_type.save()
+        response = self.client.get("/api/contacts/register/", headers={"If-None-Match": etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["results"][0]["registry_type_display"], "Fornitore estero")
+
+
+class FastListTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        client = RegistryType.objects.create(name="Cliente")
+        supplier_type = RegistryType.objects.create(name="Fornitore")
+        cls.client_register = Register.objects.create(last_name="Bianchi", email="b@example.com", registry_type=client)
+        supplier = Register.objects.create(last_name="Rossi", first_name="Anna", email="r@example.com", registry_type=supplier_type)
+        branch = Branch.objects.create(name="Sede", code="S")
+        country = Country.objects.create(name="Italy", iso_code="ITA")
+        region = Region.objects.create(name="Milano", code="MI", country=country)
+        city = City.objects.create(name="Milano", postcode="20121", region=region, country=country)
+        contact = dict(register=cls.client_register, branch=branch, phone="1", email="b@example.com", country=country, city=city)
+        Contact.objects.create(name="Sede", region=region, phone_ext="12", address="Via Roma", **contact)
+        # null foreign key and columns
+        Contact.objects.create(name="Magazzino", region=None, phone_ext=None, address="Via Po", **contact)
+
+        division = Division.objects.create(name="Nord", code="N", client=cls.client_register, supplier=supplier)
+        deposit = Deposit.objects.create(name="Centrale", code="C", supplier=supplier)
+        sign = Sign.objects.create(name="Insegna", code="I", supplier=supplier)
+        profile = dict(client=cls.client_register, supplier=supplier, sign=sign)
+        ProfilesAndSubagencies.objects.create(division=division, deposit=deposit, corresponding_code="A1", **profile)
+        ProfilesAndSubagencies.objects.create(division=None, deposit=None, corresponding_code="A2", **profile)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_viewsets(self):
+        # the fast path sends the same JSON as the serializer of every ViewSet using it
+        viewsets = [(prefix, viewset) for prefix, viewset, _ in router.registry if issubclass(viewset, FastListMixin)]
+        self.assertEqual([prefix for prefix, _ in viewsets], ["contacts", "profiles-subagencies"])
+        for prefix, viewset in viewsets:
+            for params in ({}, {"ordering": "-name" if prefix == "contacts" else "-corresponding_code"}, {"limit": 1, "offset": 1}):
+                with self.subTest(prefix=prefix, params=params):
+                    columns = []
+
+                    def spy(*args):
+                        columns.append(field_columns(*args))
+                        return columns[-1]
+
+                    with mock.patch("contactsApp.fastlist.field_columns", side_effect=spy):
+                        fast = self.client.get(f"/api/contacts/{prefix}/", params)
+                    # not a fallback to the serializer
+                    self.assertIsNotNone(columns[0])
+                    cache.clear()
+                    with mock.patch("contactsApp.fastlist.field_columns", return_value=None):
+                        serialized = self.client.get(f"/api/contacts/{prefix}/", params)
+                    self.assertEqual(fast.status_code, 200)
+                    self.assertEqual(fast.content, serialized.content)
+                    cache.clear()
+
+    def test_conversions(self):
+        class ContactDates(serializers.ModelSerializer):
+            region = serializers.PrimaryKeyRelatedField(read_only=True)
+            day = serializers.DateField(read_only=True)
+            balance = serializers.DecimalField(max_digits=8, decimal_places=2, read_only=True)
+
+            class Meta:
+                model = Contact
+                fields = ["id", "region", "phone_ext", "updated_at", "day", "balance"]
+
+        queryset = Contact.objects.annotate(
+            day=TruncDate("updated_at"),
+            balance=Value(Decimal("12.5"), output_field=DecimalField(max_digits=8, decimal_places=2)),
+        ).order_by("name")
+        columns = field_columns(ContactDates(), queryset)
+        self.assertIsNotNone(columns)
+        rows = serialize_rows(columns, list_values(queryset, columns))
+        self.assertEqual(rows, ContactDates(queryset, many=True).data)
+        self.assertEqual(rows[0]["region"], None)
+        self.assertEqual(rows[0]["balance"], "12.50")
+        self.assertEqual(rows[0]["day"], Contact.objects.get(name="Magazzino").updated_at.date().isoformat())
+
+
+class ExportTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        client = RegistryType.objects.create(name="Cliente")
+        supplier = RegistryType.objects.create(name="Fornitore")
+        rossi = Register.objects.create(last_name="Rossi", first_name="Anna", email="r@example.com", registry_type=supplier)
+        Register.objects.create(last_name="Bianchi", email="b@example.com", registry_type=client)
+        Register.objects.create(last_name="Rossini", first_name="Luca", email="l@example.com", vat_number="IT1", registry_type=client)
+        country = Country.objects.create(name="Italy", iso_code="ITA")
+        city = City.objects.create(name="Milano", postcode="20121", country=country)
+        Contact.objects.create(
+            register=rossi, branch=Branch.objects.create(name="Sede", code="S"), name="Sede", phone="1",
+            email="r@example.com", country=country, city=city, address="Via Roma",
+        )
+
+    def export(self, prefix, params):
+        response = self.client.get(f"/api/contacts/{prefix}/export/", params)
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def content(self, response):
+        return b"".join(response.streaming_content).decode("utf-8")
+
+    def test_csv(self):
+        response = self.export("register", {"ordering": "last_name"})
+        self.assertTrue(response.streaming)
+        self.assertEqual(response["Content-Type"], "text/csv; charset=utf-8")
+        self.assertEqual(response["Content-Disposition"], 'attachment; filename="registers.csv"')
+        rows = list(csv.reader(StringIO(self.content(response))))
+        self.assertEqual(rows[0], [
+            "id", "first_name", "last_name", "phone", "phone_ext", "mobile", "email", "vat_number",
+            "registry_type", "registry_type_display", "is_client", "is_supplier",
+        ])
+        self.assertEqual([row[2] for row in rows[1:]], ["Bianchi", "Rossi", "Rossini"])
+        bianchi = dict(zip(rows[0], rows[1]))
+        # nulls are empty cells
+        self.assertEqual((bianchi["first_name"], bianchi["registry_type_display"], bianchi["is_client"]), ("", "Cliente", "True"))
+
+    def test_jsonl(self):
+        # the rows of the list, unpaginated, from the serializer and from the fast path
+        for prefix in ("register", "contacts"):
+            with self.subTest(prefix=prefix):
+                response = self.export(prefix, {"export_format": "jsonl"})
+                self.assertTrue(response.streaming)
+                self.assertEqual(response["Content-Type"], "application/x-ndjson")
+                items = [json.loads(line) for line in self.content(response).splitlines()]
+                self.assertEqual(items, self.client.get(f"/api/contacts/{prefix}/").json()["results"])
+
+    def test_filters(self):
+        for params, expected in [
+            ({"last_name__istartswith": "ross", "ordering": "-last_name"}, ["Rossini", "Rossi"]),
+            ({"_search": "ross"}, ["Rossi", "Rossini"]),
+            ({"registry_type_display__icontains": "client"}, ["Bianchi", "Rossini"]),
+            ({"vat_number": "IT2"}, []),
+        ]:
+            with self.subTest(params=params):
+                content = self.content(self.export("register", {"export_format": "jsonl", **params}))
+                self.assertEqual([json.loads(line)["last_name"] for line in content.splitlines()], expected)
+        # a header without rows
+        content = self.content(self.export("register", {"vat_number": "IT2"}))
+        self.assertEqual(len(content.splitlines()), 1)
+
+    def test_unknown_format(self):
+        response = self.client.get("/api/contacts/register/export/", {"export_format": "xml"})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {"error": "export_format must be one of csv, jsonl"})
+
+
+class EmailCheckTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        client = RegistryType.objects.create(name="Cliente")
+        cls.anna = Register.objects.create(last_name="Rossi", email="Anna.Rossi@Example.com", registry_type=client)
+        Register.objects.create(last_name="Bianchi", email="luca@example.com", registry_type=client)
+
+    def post(self, path, data):
+        return self.client.post(f"/api/contacts/register/{path}/", data, content_type="application/json")
+
+    def test_check_email(self):
+        for data, available in [
+            ({"email": " anna.rossi@EXAMPLE.COM "}, False),
+            ({"email": "anna.rossi@example.com", "id": self.anna.pk}, True),
+            ({"email": "anna@example.com"}, True),
+        ]:
+            with self.subTest(data=data):
+                response = self.post("check-email", data)
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(response.json(), {"available": available})
+
+    def test_invalid_email(self):
+        for data in ({}, {"email": ""}, {"email": "   "}, {"email": "anna.rossi"}, {"email": "anna@"}):
+            with self.subTest(data=data):
+                response = self.post("check-email", data)
+                self.assertEqual(response.status_code, 400)
+                self.assertEqual(response.json(), {"error": "email not valid"})
+
+    @skipUnless(connection.vendor == "sqlite", "SQLite query plan")
+    def test_lower_index(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.post("check-email", {"email": "Anna.Rossi@example.com"})
+            self.post("check-emails", {"emails": ["Anna.Rossi@example.com", "luca@example.com"]})
+        self.assertEqual(len(queries.captured_queries), 2)
+        for query in queries.captured_queries:
+            with connection.cursor() as cursor:
+                cursor.execute("EXPLAIN QUERY PLAN " + query["sql"])
+                plan = " ".join(str(row[-1]) for row in cursor.fetchall())
+            self.assertIn("register_email_lower_idx", plan)
+
+    def test_check_emails(self):
+        emails = ["LUCA@example.com", "new@example.com", "not an email", "new@EXAMPLE.com", "anna.rossi@example.com"]
+        response = self.post("check-emails", {"emails": emails, "id": self.anna.pk})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["results"], [
+            {"email": "LUCA@example.com", "valid": True, "available": False, "duplicate": False},
+            {"email": "new@example.com", "valid": True, "available": True, "duplicate": False},
+            {"email": "not an email", "valid": False, "available": False, "duplicate": False},
+            {"email": "new@EXAMPLE.com", "valid": True, "available": True, "duplicate": True},
+            # the register being edited
+            {"email": "anna.rossi@example.com", "valid": True, "available": True, "duplicate": False},
+        ])
+
+    def test_batches(self):
+        emails = [f"user{number}@example.com" for number in range(1200)] + ["Luca@Example.com"]
+        # 1201 distinct emails, 500 per query
+        with self.assertNumQueries(3):
+            response = self.post("check-emails", {"emails": emails})
+        results = response.json()["results"]
+        self.assertEqual(len(results), 1201)
+        self.assertEqual([result["email"] for result in results if not result["available"]], ["Luca@Example.com"])
+        with self.assertNumQueries(0):
+            self.assertEqual(self.post("check-emails", {"emails": []}).json(), {"results": []})
+
+    def test_invalid_emails(self):
+        for data in ({}, {"emails": "luca@example.com"}, {"emails": ["luca@example.com", 1]}, {"emails": None}):
+            with self.subTest(data=data):
+                response = self.post("check-emails", data)
+                self.assertEqual(response.status_code, 400)
+                self.assertEqual(response.json(), {"error": "emails must be a list of strings"})
+        with mock.patch("contactsApp.views.MAX_CHECKED_EMAILS", 2):
+            response = self.post("check-emails", {"emails": ["a@example.com"] * 3})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {"error": "at most 2 emails per request"})
+
+
+class BulkTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        client = RegistryType.objects.create(name="Cliente")
+        supplier = RegistryType.objects.create(name="Fornitore")
+        cls.register = Register.objects.create(last_name="Bianchi", email="b@example.com", registry_type=client)
+        cls.supplier = Register.objects.create(last_name="Rossi", email="r@example.com", registry_type=supplier)
+        cls.sign = Sign.objects.create(name="A", supplier=cls.supplier)
+        cls.branch = Branch.objects.create(name="Sede", code="S")
+        cls.country = Country.objects.create(name="Italy", iso_code="ITA")
+        cls.region = Region.objects.create(name="Milano", code="MI", country=cls.country)
+        cls.city = City.objects.create(name="Milano", postcode="20121", region=cls.region, country=cls.country)
+        cls.contacts = [cls.contact(f"Contatto {i}") for i in range(3)]
+
+    @classmethod
+    def contact(cls, name):
+        return Contact.objects.create(
+            register=cls.register, branch=cls.branch, name=name, phone="02", email="c@example.com",
+            country=cls.country, region=cls.region, city=cls.city, address="Via Roma 1",
+        )
+
+    def setUp(self):
+        cache.clear()
+
+    def data(self, name):
+        return {
+            "register": self.register.id, "branch": self.branch.id, "name": name, "phone": "02",
+            "email": "c@example.com", "country": self.country.id, "region": self.region.id,
+            "city": self.city.id, "address": "Via Roma 1",
+        }
+
+    def bulk(self, batch, prefix="contacts"):
+        return self.client.post(f"/api/contacts/{prefix}/bulk/", batch, content_type="application/json")
+
+    def test_batch(self):
+        first, second, third = self.contacts
+        response = self.bulk({
+            "create": [self.data("Nuovo")],
+            "update": [{"id": first.id, "name": "Rinominato"}],
+            "delete": [second.id],
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([row["name"] for row in response.json()["created"]], ["Nuovo"])
+        self.assertEqual(
+            set(Contact.objects.values_list("name", flat=True)), {"Nuovo", "Rinominato", third.name}
+        )
+        # the display columns are refreshed from the prefetched rows
+        self.assertEqual(Contact.objects.get(name="Nuovo").city_display, "20121 - Milano")
+
+    def test_item_errors(self):
+        first, second, _ = self.contacts
+        response = self.bulk({
+            "create": [self.data("Nuovo"), {**self.data("Senza città"), "city": 0}],
+            "update": [{"id": first.id, "name": "Rinominato"}, {"id": 0, "name": "Nessuno"}],
+            "delete": [second.id, "x"],
+        })
+        self.assertEqual(response.status_code, 400)
+        errors = response.json()["errors"]
+        self.assertEqual(errors["create"][0], {})
+        self.assertEqual(list(errors["create"][1]), ["city"])
+        self.assertEqual(errors["update"], [{}, {"id": ["Not found."]}])
+        self.assertEqual(errors["delete"], [{}, {"id": ["Not found."]}])
+        # the valid items are not saved either
+        self.assertEqual(Contact.objects.count(), 3)
+        self.assertFalse(Contact.objects.filter(name__in=["Nuovo", "Rinominato"]).exists())
+
+    def test_updated_and_deleted(self):
+        first, second, _ = self.contacts
+        response = self.bulk({
+            "update": [{"id": first.id, "name": "Rinominato"}, {"id": second.id, "name": "Altro"}],
+            "delete": [str(second.id)],
+        })
+        self.assertEqual(response.status_code, 400)
+        errors = response.json()["errors"]
+        self.assertEqual(errors["update"], [{}, {"id": ["Also deleted by this batch."]}])
+        self.assertEqual(errors["delete"], [{"id": ["Also updated by this batch."]}])
+        self.assertTrue(Contact.objects.filter(pk=second.id, name=second.name).exists())
+
+    def test_all_or_nothing(self):
+        first, second, _ = self.contacts
+        batch = {"create": [self.data("Nuovo")], "update": [{"id": first.id, "name": "Rinominato"}], "delete": [second.id]}
+        # the update fails after the create has been saved
+        with mock.patch.object(ContactSerializer, "update", side_effect=DatabaseError("locked")):
+            with self.assertRaises(DatabaseError):
+                self.bulk(batch)
+        self.assertEqual(set(Contact.objects.values_list("pk", flat=True)), {contact.pk for contact in self.contacts})
+        self.assertEqual(Contact.objects.get(pk=first.pk).name, first.name)
+
+    def test_limit_choices_to(self):
+        class ProfileSerializer(serializers.ModelSerializer):
+            serializer_related_field = PrefetchedPrimaryKeyRelatedField
+
+            class Meta:
+                model = ProfilesAndSubagencies
+                fields = ["client", "supplier", "sign"]
+
+        items = [{"client": self.register.id, "supplier": self.register.id, "sign": self.sign.id}]
+        related = prefetch_related(ProfileSerializer(), items)
+        self.assertEqual(related["client"], {self.register.id: self.register})
+        # a client is not a supplier
+        self.assertEqual(related["supplier"], {})
+        self.assertEqual(related["sign"], {self.sign.id: self.sign})
+
+        serializer = ProfileSerializer(data=items[0], context={"related": related})
+        self.assertFalse(serializer.is_valid())
+        self.assertEqual(list(serializer.errors), ["supplier"])
+
+    def test_query_count(self):
+        # register, branch, country, region and city, whatever the size of the batch
+        for size in (1, 10):
+            with self.subTest(size=size), self.assertNumQueries(5):
+                related = prefetch_related(ContactSerializer(), [self.data(str(i)) for i in range(size)])
+            self.assertEqual(related["city"], {self.city.id: self.city})
+
+        # the related rows, then the rows to update or delete, for an invalid batch of any size
+        for size in (1, 10):
+            batch = {
+                "create": [self.data(str(i)) for i in range(size)],
+                "update": [{"id": contact.id, "city": 0} for contact in self.contacts],
+            }
+            with self.subTest(size=size), self.assertNumQueries(6):
+                self.assertEqual(self.bulk(batch).status_code, 400)
+
+    def test_profiles(self):
+        response = self.bulk({
+            "create": [{"client": self.register.id, "supplier": self.supplier.id, "sign": self.sign.id, "deposit": None, "division": None, "corresponding_code": "X1"}],
+        }, prefix="profiles-subagencies")
+        self.assertEqual(response.status_code, 200)
+        profile = ProfilesAndSubagencies.objects.get()
+        self.assertEqual((profile.client, profile.supplier, profile.sign), (self.register, self.supplier, self.sign))
+
+
+IMPORT_CSV = """registry_type,last_name,first_name,email,contact_name,contact_email,contact_phone,address,branch,country,region,city,postcode
+Cliente,Bianchi,Anna,anna@example.com,Sede,sede@example.com,02,Via Roma 1,Sede,ITA,MI,Milano,20121
+Fornitore,Rossi,,rossi@example.com,,,,,,,,,
+Cliente,Bianchi,Anna,ANNA@example.com,Magazzino,magazzino@example.com,02,Via Po 2,S,Italy,,Milano,
+Altro,Verdi,,verdi@example.com,,,,,,,,,
+Cliente,Neri,,esistente@example.com,,,,,,,,,
+Cliente,Gialli,,gialli@example.com,Sede,sede@example.com,02,Via Roma 3,Sede,ITA,,Roma,
+Cliente,Blu,,not an email,,,,,,,,,
+"""
+
+
+class ImportTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        RegistryType.objects.create(name="Cliente")
+        RegistryType.objects.create(name="Fornitore")
+        Register.objects.create(last_name="Neri", email="Esistente@example.com", registry_type=RegistryType.objects.get(name="Cliente"))
+        Branch.objects.create(name="Sede", code="S")
+        country = Country.objects.create(name="Italy", iso_code="ITA")
+        region = Region.objects.create(name="Milano", code="MI", country=country)
+        City.objects.create(name="Milano", postcode="20121", region=region, country=country)
+
+    def setUp(self):
+        cache.clear()
+
+    def check_imported(self):
+        anna = Register.objects.get(email="anna@example.com")
+        self.assertTrue(anna.is_client)
+        # the second row of the same email adds its contact to the first register
+        contacts = Contact.objects.filter(register=anna)
+        self.assertEqual(sorted(contacts.values_list("name", flat=True)), ["Magazzino", "Sede"])
+        self.assertEqual(contacts.get(name="Sede").city_display, "20121 - Milano")
+        self.assertIsNone(Register.objects.get(email="rossi@example.com").first_name)
+        self.assertEqual(Register.objects.count(), 3)
+        self.assertEqual(Contact.objects.count(), 2)
+
+    def test_import_rows(self):
+        rejects = []
+        result = import_rows(read_csv(StringIO(IMPORT_CSV)), on_reject=rejects.append)
+        self.assertEqual(tuple(result), (7, 2, 2, 4))
+        self.check_imported()
+        self.assertEqual(
+            {reject.line: list(reject.errors) for reject in rejects},
+            {5: ["registry_type"], 6: ["email"], 7: ["city"], 8: ["email"]},
+        )
+        self.assertEqual(rejects[0].row["last_name"], "Verdi")
+
+    def test_batches(self):
+        # the registers of earlier batches are found by the later rows, each batch inserts at once
+        with CaptureQueriesContext(connection) as queries:
+            result = import_rows(read_csv(StringIO(IMPORT_CSV)), batch_size=2)
+        self.assertEqual(tuple(result), (7, 2, 2, 4))
+        self.check_imported()
+        inserts = [query["sql"] for query in queries.captured_queries if query["sql"].startswith("INSERT")]
+        self.assertEqual(len(inserts), 3)
+
+    def test_command(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = Path(directory) / "registers.csv"
+            path.write_text(IMPORT_CSV.replace(",", ";"), encoding="utf-8")
+            stdout = StringIO()
+            call_command("import_registers", path, delimiter=";", batch_size=3, stdout=stdout)
+            self.assertIn("7 rows: 2 registers and 2 contacts created, 4 rejected", stdout.getvalue())
+
+            with open(path.with_name("registers.rejects.csv"), newline="", encoding="utf-8") as rejects_file:
+                rejects = list(csv.DictReader(rejects_file))
+        self.check_imported()
+        self.assertEqual([row["line"] for row in rejects], ["5", "6", "7", "8"])
+        self.assertEqual(rejects[0]["last_name"], "Verdi")
+        self.assertEqual(rejects[0]["errors"], 'registry_type: Registry type "Altro" not found.')
+        self.assertEqual(rejects[1]["errors"], "email: A register with this email already exists.")
+
+    def test_command_without_rejects(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = Path(directory) / "registers.csv"
+            path.write_text("\n".join(IMPORT_CSV.splitlines()[:3]), encoding="utf-8")
+            call_command("import_registers", path, stdout=StringIO())
+            self.assertFalse(path.with_name("registers.rejects.csv").exists())
+        self.assertEqual(Register.objects.count(), 3)
+
+    def test_endpoint(self):
+        self.assertEqual(self.client.get("/api/contacts/register/").json()["count"], 1)
+        upload = SimpleUploadedFile("registers.csv", IMPORT_CSV.encode("utf-8-sig"), content_type="text/csv")
+        response = self.client.post("/api/contacts/register/import/", {"file": upload})
+        self.assertEqual(response.status_code, 200)
+        body = response.json()
+        self.assertEqual(
+            {name: body[name] for name in ("rows", "registers", "contacts", "rejected")},
+            {"rows": 7, "registers": 2, "contacts": 2, "rejected": 4},
+        )
+        self.assertEqual([reject["line"] for reject in body["rejects"]], [5, 6, 7, 8])
+        self.check_imported()
+        # bulk_create sends no signals, the cached count is dropped by the import
+        self.assertEqual(self.client.get("/api/contacts/register/").json()["count"], 3)
+
+    def test_endpoint_errors(self):
+        self.assertEqual(self.client.post("/api/contacts/register/import/", {}).status_code, 400)
+        upload = SimpleUploadedFile("registers.csv", b"last_name,email\nRossi,r@example.com\n")
+        response = self.client.post("/api/contacts/register/import/", {"file": upload})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {"error": "Missing columns: registry_type"})
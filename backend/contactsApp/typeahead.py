@@ -0,0 +1,260 @@
+"""
+Superseded and duplicate typeahead requests.
+
+A lookup sends the X-Lookup-Key header with its _search requests, a random key of its own. A request
+supersedes the earlier ones of the same client with the same key, which the lookup no longer waits
+for: they stop before their next query (a query they are running is interrupted on SQLite and
+PostgreSQL) and get a 409. Keys are tracked in the cache, a request only supersedes the ones served
+by other processes if the cache is shared between them (see settings_production), and queries are
+only interrupted within one process. The newer requests of the same process are seen before every
+query, the cache is read at most every CHECK_INTERVAL seconds of a request, so a request superseded
+by another process can run its queries for that long before it stops.
+
+Identical GET requests running at the same time (same response cache key, or same endpoint, params
+and model versions, see caching.py) share one evaluation: the first one runs the view, and the
+ETag aggregate before it, the others wait for its result.
+"""
+import hashlib
+import threading
+import time
+import uuid
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.core.cache import cache
+from django.db import DatabaseError
+from rest_framework import status
+from rest_framework.exceptions import APIException
+from rest_framework.response import Response
+
+LOOKUP_KEY_HEADER = "X-Lookup-Key"
+# seconds a superseded request can still notice it
+LOOKUP_TIMEOUT = 60
+# seconds between the reads of the latest request of a lookup from the cache
+CHECK_INTERVAL = 0.1
+# seconds a request waits for an identical one before running its own view
+SHARED_TIMEOUT = 30
+
+# lookup of the current request
+current_lookup = ContextVar("current_lookup", default=None)
+
+
+class Superseded(APIException):
+    status_code = status.HTTP_409_CONFLICT
+    default_detail = "Superseded by a newer request of the same lookup."
+    default_code = "superseded"
+
+
+def cancel_query(connection):
+    """
+    Interrupts the query running on the connection from another thread
+    """
+    if connection.connection is None:
+        return
+    if connection.vendor == "sqlite":
+        connection.connection.interrupt()
+    elif connection.vendor == "postgresql":
+        connection.connection.cancel()
+
+
+class Lookup:
+    """
+    A request of a lookup, superseded once a newer request sends the same key
+    """
+
+    def __init__(self, key):
+        self.key = key
+        self.token = uuid.uuid4().hex
+        # the token was stored when the request started
+        self.checked = time.monotonic()
+
+    def superseded(self, force=False):
+        """
+        Whether a newer request stored its token in the cache, read at most every CHECK_INTERVAL
+        seconds unless force
+        """
+        now = time.monotonic()
+        if not force and now - self.checked < CHECK_INTERVAL:
+            return False
+        self.checked = now
+        # outside the lookup, the cache may query the database too
+        reset = current_lookup.set(None)
+        try:
+            latest = cache.get(self.key)
+        finally:
+            current_lookup.reset(reset)
+        return latest is not None and latest != self.token
+
+
+
+class Lookups:
+    """
+    Latest request of each lookup key, and the queries running for them in this process
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latest = {}  # key: token
+        self.running = {}  # key: (token, connection)
+
+    def lookup_key(self, request):
+        value = request.headers.get(LOOKUP_KEY_HEADER)
+        if not value:
+            return None
+        client = request.META.get("REMOTE_ADDR", "")
+        return "contactsApp:lookup:{}".format(hashlib.md5(f"{client}:{value[:200]}".encode("utf-8")).hexdigest())
+
+    def start(self, key):
+        lookup = Lookup(key)
+        cache.set(key, lookup.token, LOOKUP_TIMEOUT)
+        self.cancel_older(lookup)
+        return lookup
+
+    async def astart(self, key):
+        lookup = Lookup(key)
+        await cache.aset(key, lookup.token, LOOKUP_TIMEOUT)
+        self.cancel_older(lookup)
+        return lookup
+
+    def cancel_older(self, lookup):
+        # under the lock the connection can't move on to another query
+        with self.lock:
+            self.latest[lookup.key] = lookup.token
+            running = self.running.get(lookup.key)
+            if running is not None and running[0] != lookup.token:
+                cancel_query(running[1])
+
+    def finish(self, lookup):
+        with self.lock:
+            if self.latest.get(lookup.key) == lookup.token:
+                del self.latest[lookup.key]
+
+    def superseded(self, lookup, force=False):
+        return self.latest.get(lookup.key, lookup.token) != lookup.token or lookup.superseded(force)
+
+    def execute(self, lookup, execute, sql, params, many, context):
+        if self.superseded(lookup):
+            raise Superseded()
+        with self.lock:
+            self.running[lookup.key] = (lookup.token, context["connection"])
+        try:
+            return execute(sql, params, many, context)
+        except DatabaseError as e:
+            # interrupted by a newer request
+            if self.superseded(lookup, force=True):
+                raise Superseded() from e
+            raise
+        finally:
+            with self.lock:
+                if self.running.get(lookup.key, (None,))[0] == lookup.token:
+                    del self.running[lookup.key]
+
+
+lookups = Lookups()
+
+
+def lookup_wrapper(execute, sql, params, many, context):
+    lookup = current_lookup.get()
+    if lookup is None:
+        return execute(sql, params, many, context)
+    return lookups.execute(lookup, execute, sql, params, many, context)
+
+
+def install_lookup_wrapper(sender, connection, **kwargs):
+    # connection_created receiver, the wrapper does nothing outside lookup requests
+    if lookup_wrapper not in connection.execute_wrappers:
+        connection.execute_wrappers.append(lookup_wrapper)
+
+
+class LookupMiddleware:
+    """
+    Makes the requests with an X-Lookup-Key header supersede the earlier ones with the same key
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        key = lookups.lookup_key(request)
+        if key is None:
+            return self.get_response(request)
+        lookup = lookups.start(key)
+        reset = current_lookup.set(lookup)
+        try:
+            return self.get_response(request)
+        finally:
+            current_lookup.reset(reset)
+            lookups.finish(lookup)
+
+    async def __acall__(self, request):
+        key = lookups.lookup_key(request)
+        if key is None:
+            return await self.get_response(request)
+        lookup = await lookups.astart(key)
+        reset = current_lookup.set(lookup)
+        try:
+            return await self.get_response(request)
+        finally:
+            current_lookup.reset(reset)
+            lookups.finish(lookup)
+
+
+class Flight:
+    def __init__(self):
+        self.thread = threading.get_ident()
+        self.done = threading.Event()
+        self.data = None
+
+
+# identical requests running in threads
+flights = {}
+flights_lock = threading.Lock()
+
+
+def shared_call(key, compute):
+    """
+    Result of compute(), or the result of an identical call which is already running it in another
+    thread. A None result is not shared, the waiting calls run compute() themselves.
+    """
+    with flights_lock:
+        flight = flights.get(key)
+        leader = flight is None or flight.thread == threading.get_ident()
+        if leader:
+            flight = flights[key] = Flight()
+    if not leader:
+        if flight.done.wait(SHARED_TIMEOUT) and flight.data is not None:
+            return flight.data
+        return compute()
+
+    try:
+        flight.data = compute()
+        return flight.data
+    finally:
+        with flights_lock:
+            if flights.get(key) is flight:
+                del flights[key]
+        flight.done.set()
+
+
+def shared_response(key, handler):
+    """
+    Response of handler(), or a response with the data of an identical request which is already
+    running it in another thread. Only 200 responses are shared, after an error every request
+    runs its own view.
+    """
+    response = None
+
+    def run():
+        nonlocal response
+        response = handler()
+        return response.data if response.status_code == 200 else None
+
+    data = shared_call(key, run)
+    return response if response is not None else Response(data)
@@ -1,12 +1,14 @@
+import io
+
 import django_filters   
 from rest_framework import viewsets, status
 from rest_framework.decorators import action
+from rest_framework.parsers import MultiPartParser
 from rest_framework.response import Response
 from django.core.validators import validate_email
 from django.core.exceptions import ValidationError
-from django.db.models import Q
-from django.db.models import F, Value, CharField
-from django.db.models.functions import Concat
+from django.db.models import F, Value
+from django.db.models.functions import Lower
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework.pagination import PageNumberPagination
 from .models import City, Contact, Country, Region, Branch, Register, RegistryType, Division, Sign, ProfilesAndSubagencies, Deposit
@@ -26,18 +28,27 @@ from .serializer import (
     ProfilesAndSubagenciensSerializer,
     ProfilesAndSubagenciensListSerializer,
 )
+from .bulk import BulkMixin
+from .caching import CachedResponseMixin, ConditionalResponseMixin
+from .export import ExportMixin
+from .fastlist import FastListMixin
+from .masterdata import email_key, import_rows, read_csv, registered_emails
+from .routing import ReadDatabaseMixin
+from .search import search
+from .autocomplete import city_index
 
 # dynamic search filter for _search used in dropboxes
 def dynamic_search_filter(*search_fields, ordering_field="name"):
     def filter_method(queryset, name, value):
         if not value:
             return queryset
-        q_objects = Q()
-        for field in search_fields:
-            q_objects |= Q(**{f"{field}__icontains": value})
-        return queryset.filter(q_objects).order_by(ordering_field)
+        return search(queryset, value, search_fields, ordering_field)
     return filter_method
 
+# excluded_<field>=<id> filters, e.g. the suppliers other than the register being edited
+def excluded_filter(field_name):
+    return django_filters.NumberFilter(field_name=field_name, exclude=True)
+
 class RegionFilter(django_filters.FilterSet):
     _search = django_filters.CharFilter(method=dynamic_search_filter("name", "code"))
 
@@ -45,7 +56,7 @@ class RegionFilter(django_filters.FilterSet):
         model = Region
         fields = ["country"]
 
-class RegionViewSet(viewsets.ModelViewSet):
+class RegionViewSet(ReadDatabaseMixin, CachedResponseMixin, viewsets.ModelViewSet):
     queryset = Region.objects.all()
     serializer_class = RegionSerializer
     filter_backends = [DjangoFilterBackend]
@@ -62,13 +73,32 @@ class CityFilter(django_filters.FilterSet):
         model = City
         fields = ["region", "region__country", "country"]
 
-class CityViewSet(viewsets.ModelViewSet):
+class CityViewSet(ReadDatabaseMixin, ConditionalResponseMixin, viewsets.ModelViewSet):
     queryset = City.objects.all()
     serializer_class = CitySerializer
     filter_backends = [DjangoFilterBackend]
     filterset_class = CityFilter
     ordering_fields = ["code", "name"]
 
+    @action(detail=False, methods=['get'], url_path='autocomplete')
+    def autocomplete(self, request):
+        # served from the in-process index, without querying the database
+        params = {}
+        for name in ("country", "region", "limit"):
+            value = request.query_params.get(name)
+            if value is None:
+                continue
+            if not value.isdigit():
+                return Response(
+                    {'error': f'{name} not valid'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            params[name] = int(value)
+
+        limit = min(params.pop("limit", 10), 100)
+        query = request.query_params.get("q", "").strip()
+        return Response(city_index.search(query, limit=limit, **params))
+
 
 class CountryFilter(django_filters.FilterSet):
     _search = django_filters.CharFilter(method=dynamic_search_filter("name", "iso_code"))
@@ -78,7 +108,7 @@ class CountryFilter(django_filters.FilterSet):
         fields = ["iso_code"]
 
 
-class CountryViewSet(viewsets.ModelViewSet):
+class CountryViewSet(ReadDatabaseMixin, CachedResponseMixin, viewsets.ModelViewSet):
     queryset = Country.objects.all()
     serializer_class = CountrySerializer
     filter_backends = [DjangoFilterBackend]
@@ -95,7 +125,7 @@ class BranchFilter(django_filters.FilterSet):
         fields = ["code"]
 
 
-class BranchViewSet(viewsets.ModelViewSet):
+class BranchViewSet(ReadDatabaseMixin, CachedResponseMixin, viewsets.ModelViewSet):
     
     queryset = Branch.objects.all()
     serializer_class = BranchSerializer
@@ -103,7 +133,7 @@ class BranchViewSet(viewsets.ModelViewSet):
     filterset_class = BranchFilter
     ordering_fields = ["code", "name"]
 
-class RegistryTypeViewSet(viewsets.ModelViewSet):
+class RegistryTypeViewSet(ReadDatabaseMixin, CachedResponseMixin, viewsets.ModelViewSet):
     
     queryset = RegistryType.objects.all()
     serializer_class = RegistryTypeSerializer
@@ -111,6 +141,11 @@ class RegistryTypeViewSet(viewsets.ModelViewSet):
     ordering_fields = ["name"]
     
 
+# rejected rows listed in the response of the register import
+MAX_IMPORT_REJECTS = 1000
+# emails checked by a single check-emails request
+MAX_CHECKED_EMAILS = 10000
+
 search_operations = ["exact", "contains", "icontains", "startswith", "istartswith", "endswith", "iendswith"]
 
 class ContactFilter(django_filters.FilterSet):
@@ -134,45 +169,20 @@ class ContactFilter(django_filters.FilterSet):
         }
 
     def filter_branch_display(self, queryset, name, value):
-        return queryset.filter(branch_display__icontains=value).order_by("branch_display")
+        return search(queryset, value, ["branch_display"], "branch_display", ranked=False)
 
     def filter_country_display(self, queryset, name, value):
-        return queryset.filter(country_display__icontains=value).order_by("country_display")
+        return search(queryset, value, ["country_display"], "country_display", ranked=False)
     
     def filter_city_display(self, queryset, name, value):
-        return queryset.filter(city_display__icontains=value).order_by("city_display")
+        return search(queryset, value, ["city_display"], "city_display", ranked=False)
 
     def filter_region_display(self, queryset, name, value):
-        return queryset.filter(region_display__icontains=value).order_by("region_display")
-
-
-class ContactViewSet(viewsets.ModelViewSet):
-    queryset = Contact.objects.all().annotate(
-                                        branch_display=Concat(      #annotations for display
-                                            F('branch__code'),
-                                            Value(' - '),
-                                            F('branch__name'),
-                                            output_field=CharField()
-                                        ),
-                                        country_display=Concat(
-                                            F('country__iso_code'),
-                                            Value(' - '),
-                                            F('country__name'),
-                                            output_field=CharField()
-                                        ),
-                                        city_display=Concat(
-                                            F('city__postcode'),
-                                            Value(' - '),
-                                            F('city__name'),
-                                            output_field=CharField()
-                                        ),
-                                        region_display=Concat(
-                                            F('region__code'),
-                                            Value(' - '),
-                                            F('region__name'),
-                                            output_field=CharField()
-                                        )
-                                    )
+        return search(queryset, value, ["region_display"], "region_display", ranked=False)
+
+
+class ContactViewSet(ReadDatabaseMixin, ConditionalResponseMixin, FastListMixin, ExportMixin, BulkMixin, viewsets.ModelViewSet):
+    queryset = Contact.objects.all()
     filterset_class = ContactFilter
     filterset_backend = [DjangoFilterBackend]
     # annotated filtered fields
@@ -180,7 +190,7 @@ class ContactViewSet(viewsets.ModelViewSet):
     ordering_fields = ["name", "email", "phone", "phone_ext", "branch_display", "country_display", "region_display", "city_display", "address"]
 
     def get_serializer_class(self):
-        if self.action in ["create", "update", "retrieve", "partial_update"]:
+        if self.action in ["create", "update", "retrieve", "partial_update", "bulk"]:
             return ContactSerializer
         return ContactListSerializer
     
@@ -205,12 +215,14 @@ class RegisterFilter(django_filters.FilterSet):
         return queryset.filter(registry_type_display__icontains=value).order_by("last_name")
     
 
-class RegisterViewSet(viewsets.ModelViewSet):
+class RegisterViewSet(ReadDatabaseMixin, ConditionalResponseMixin, ExportMixin, viewsets.ModelViewSet):
     queryset = Register.objects.all().annotate(
         registry_type_display = F('registry_type__name')  # annotation for display
     )   
     serializer_class = RegisterSerializer
     filterset_class = RegisterFilter
+    # registry_type_display
+    etag_related = ["registry_type"]
     ordering_fields = ["last_name", "first_name", "email", "phone", "phone_ext", "mobile", "vat_number", "registry_type_display"]
 
     @action(detail=False, methods=['post'], url_path='check-email')
@@ -224,11 +236,94 @@ class RegisterViewSet(viewsets.ModelViewSet):
                 {'error': 'email not valid'},
                 status=status.HTTP_400_BAD_REQUEST 
             )
-        exists = self.queryset.filter(email__iexact=email).exclude(id=id).exists()
+        # same as email__iexact, but served by the lower(email) index
+        exists = (
+            Register.objects.alias(email_lower=Lower("email"))
+            .filter(email_lower=Lower(Value(email)))
+            .exclude(id=id)
+            .exists()
+        )
         return Response({'available': not exists})
 
+    @action(detail=False, methods=['post'], url_path='check-emails')
+    def check_emails(self, request):
+        emails = request.data.get('emails')
+        id = request.data.get('id')
+        if not isinstance(emails, list) or not all(isinstance(email, str) for email in emails):
+            return Response(
+                {'error': 'emails must be a list of strings'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if len(emails) > MAX_CHECKED_EMAILS:
+            return Response(
+                {'error': f'at most {MAX_CHECKED_EMAILS} emails per request'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        valid = {}
+        for email in emails:
+            try:
+                validate_email(email.strip())
+                valid[email] = True
+            except ValidationError:
+                valid[email] = False
+        registered = registered_emails([email for email in emails if valid[email]], exclude_id=id)
+
+        # later copies of an email in the list would clash with the first one
+        seen = set()
+        results = []
+        for email in emails:
+            key = email_key(email)
+            results.append({
+                'email': email,
+                'valid': valid[email],
+                'available': valid[email] and key not in registered,
+                'duplicate': key in seen,
+            })
+            seen.add(key)
+        return Response({'results': results})
+
+    @action(detail=False, methods=['post'], url_path='import', parser_classes=[MultiPartParser])
+    def import_file(self, request):
+        upload = request.FILES.get('file')
+        if upload is None:
+            return Response(
+                {'error': 'file missing'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        source = io.TextIOWrapper(upload.file, encoding="utf-8-sig", newline="")
+        try:
+            rows = read_csv(source, request.data.get('delimiter', ','))
+        except (ValueError, UnicodeDecodeError) as e:
+            return Response(
+                {'error': str(e)},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        # only the first rejects are returned, the count covers all of them
+        rejects = []
+        def on_reject(reject):
+            if len(rejects) < MAX_IMPORT_REJECTS:
+                rejects.append({'line': reject.line, 'errors': reject.errors})
+
+        try:
+            result = import_rows(rows, on_reject=on_reject)
+        except UnicodeDecodeError:
+            return Response(
+                {'error': 'file not UTF-8 encoded, the rows before the error were imported'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        return Response({
+            'rows': result.rows,
+            'registers': result.registers,
+            'contacts': result.contacts,
+            'rejected': result.rejected,
+            'rejects': rejects,
+        })
+
 class DivisionFilter(django_filters.FilterSet):
     _search = django_filters.CharFilter(method=dynamic_search_filter("name", "code"))
+    excluded_supplier = excluded_filter("supplier")
     supplier_display__icontains = django_filters.CharFilter(method='filter_supplier_display')
    
     class Meta:
@@ -236,9 +331,10 @@ class DivisionFilter(django_filters.FilterSet):
         fields = {"client", "supplier"}
 
     def filter_supplier_display(self, queryset, name, value):
-        return queryset.filter(supplier_display__icontains=value).order_by("supplier_display", "name")
+        return search(queryset, value, ["supplier_display"], ("supplier_display", "name"), ranked=False)
 
-class DivisionViewSet(viewsets.ModelViewSet):
+class DivisionViewSet(ReadDatabaseMixin, ConditionalResponseMixin, viewsets.ModelViewSet):
+    queryset = Division.objects.all()
     filterset_class = DivisionFilter
     filter_backends = [DjangoFilterBackend]
     filter_fields = ["supplier_display"]
@@ -249,110 +345,62 @@ class DivisionViewSet(viewsets.ModelViewSet):
             return DivisionSerializer
         return DivisionListSerializer
 
-    def get_queryset(self):
-        queryset = Division.objects.all().annotate(
-            supplier_display = Concat(
-                F('supplier__last_name'),
-                Value(' - '),
-                F('supplier__first_name'),
-                output_field=CharField()  # annotation for display
-            )
-        )
-
-        excluded_supplier = self.request.query_params.get("excluded_supplier")
-        if excluded_supplier and excluded_supplier.isdigit():
-            queryset = queryset.exclude(supplier=int(excluded_supplier))
-
-        return queryset.distinct()
-
 class SuppliersFilter(django_filters.FilterSet):
     _search = django_filters.CharFilter(method=dynamic_search_filter("last_name", "first_name", ordering_field="last_name"))
+    excluded_id = excluded_filter("id")
     
     class Meta:
         model = Register
         fields = []
 
-class SuppliersViewSet(viewsets.ModelViewSet):
+class SuppliersViewSet(ReadDatabaseMixin, ConditionalResponseMixin, viewsets.ModelViewSet):
+    queryset = Register.objects.filter(is_supplier=True)
     serializer_class = RegisterSerializer
     filterset_class = SuppliersFilter
     filter_backends = [DjangoFilterBackend]
 
-    def get_queryset(self):
-        queryset = Register.objects.filter(
-            registry_type__name__in=["Fornitore", "Cliente/Fornitore"]
-        )
-
-        excluded_id = self.request.query_params.get("excluded_id")
-        if excluded_id and excluded_id.isdigit():
-            queryset = queryset.exclude(id=int(excluded_id))
-
-        return queryset.distinct()
-
 class ClientFilter(django_filters.FilterSet):
     _search = django_filters.CharFilter(method=dynamic_search_filter("last_name", "first_name", ordering_field="last_name"))
+    excluded_id = excluded_filter("id")
 
     class Meta:
         model = Register
         fields = []
 
-class ClientViewSet(viewsets.ModelViewSet):
+class ClientViewSet(ReadDatabaseMixin, ConditionalResponseMixin, viewsets.ModelViewSet):
+    queryset = Register.objects.filter(is_client=True)
     serializer_class = RegisterSerializer
     filterset_class = ClientFilter
     filter_backends = [DjangoFilterBackend]
-
-    def get_queryset(self):
-        queryset = Register.objects.filter(
-            registry_type__name__in=["Cliente", "Cliente/Fornitore"]
-        )
-
-        excluded_id = self.request.query_params.get("excluded_id")
-        if excluded_id and excluded_id.isdigit():
-            queryset = queryset.exclude(id=int(excluded_id))
-
-        return queryset.distinct()
     
 class SignFilter(django_filters.FilterSet):
     _search = django_filters.CharFilter(method=dynamic_search_filter("name", "code"))
+    excluded_supplier = excluded_filter("supplier")
     
     class Meta:
         model = Sign
         fields = {"supplier": ["exact"]}
  
-class SignViewSet(viewsets.ModelViewSet):
+class SignViewSet(ReadDatabaseMixin, ConditionalResponseMixin, viewsets.ModelViewSet):
+    queryset = Sign.objects.all()
     serializer_class = SignSerializer
     filterset_class = SignFilter
     filter_backends = [DjangoFilterBackend]
 
-    def get_queryset(self):
-        queryset = Sign.objects.all()
-
-        excluded_supplier = self.request.query_params.get("excluded_supplier")
-        if excluded_supplier and excluded_supplier.isdigit():
-            queryset = queryset.exclude(supplier=int(excluded_supplier))
-
-        return queryset.distinct()
-
 class DepositFilter(django_filters.FilterSet):
     _search = django_filters.CharFilter(method=dynamic_search_filter("name", "code"))
+    excluded_supplier = excluded_filter("supplier")
 
     class Meta:
         model = Deposit
         fields = {"supplier": ["exact"]}
 
-class DepositViewSet(viewsets.ModelViewSet):
+class DepositViewSet(ReadDatabaseMixin, ConditionalResponseMixin, viewsets.ModelViewSet):
+    queryset = Deposit.objects.all()
     serializer_class = DepositSerializer
     filterset_class = DepositFilter
     filter_backends = [DjangoFilterBackend]
 
-    def get_queryset(self):
-        queryset = Deposit.objects.all()
-
-        excluded_supplier = self.request.query_params.get("excluded_supplier")
-        if excluded_supplier and excluded_supplier.isdigit():
-            queryset = queryset.exclude(supplier=int(excluded_supplier))
-
-        return queryset.distinct()
-
 class ProfilesAndSubagenciesFilter(django_filters.FilterSet):
     client_display__icontains = django_filters.CharFilter(method='filter_client_display')
     sign_display__icontains = django_filters.CharFilter(method='filter_sign_display')
@@ -371,60 +419,29 @@ class ProfilesAndSubagenciesFilter(django_filters.FilterSet):
         }
 
     def filter_client_display(self, queryset, name, value):
-        return queryset.filter(client_display__icontains=value).order_by("client_display")
+        return search(queryset, value, ["client_display"], "client_display", ranked=False)
 
     def filter_sign_display(self, queryset, name, value):
-        return queryset.filter(sign_display__icontains=value).order_by("sign_display")
+        return search(queryset, value, ["sign_display"], "sign_display", ranked=False)
 
     def filter_deposit_display(self, queryset, name, value):
-        return queryset.filter(deposit_display__icontains=value).order_by("deposit_display")
+        return search(queryset, value, ["deposit_display"], "deposit_display", ranked=False)
 
     def filter_supplier_display(self, queryset, name, value):
-        return queryset.filter(supplier_display__icontains=value).order_by("supplier_display")
+        return search(queryset, value, ["supplier_display"], "supplier_display", ranked=False)
 
     def filter_division_display(self, queryset, name, value):
-        return queryset.filter(division_display__icontains=value).order_by("division_display")
-
-
-class ProfilesAndSubagenciesViewSet(viewsets.ModelViewSet):
-    queryset = ProfilesAndSubagencies.objects.all().annotate(
-        client_display = Concat(
-            F('client__last_name'), 
-            Value(' - '),
-            F('client__first_name'),
-            output_field=CharField()
-        ),
-        sign_display = Concat(
-            F('sign__code'), 
-            Value(' - '),
-            F('sign__name'),
-            output_field=CharField()
-        ),
-        deposit_display = Concat(
-            F('deposit__code'), 
-            Value(' - '),
-            F('deposit__name'),
-            output_field=CharField()
-        ),
-        supplier_display = Concat(
-            F('supplier__last_name'), 
-            Value(' - '),
-            F('supplier__first_name'),
-            output_field=CharField()
-        ),
-        division_display = Concat(
-            F('division__code'), 
-            Value(' - '),
-            F('division__name'),
-            output_field=CharField()
-        ),
-    )
+        return search(queryset, value, ["division_display"], "division_display", ranked=False)
+
+
+class ProfilesAndSubagenciesViewSet(ReadDatabaseMixin, ConditionalResponseMixin, FastListMixin, ExportMixin, BulkMixin, viewsets.ModelViewSet):
+    queryset = ProfilesAndSubagencies.objects.all()
     filterset_class = ProfilesAndSubagenciesFilter
     filter_fields = ["client_display", "sign_display", "corresponding_code", "deposit_display", "supplier_display", "division_display"]
     ordering_fields = ["client_display", "corresponding_code", "sign_display", "deposit_display", "supplier_display", "division_display"]
    
 
     def get_serializer_class(self):
-        if self.action in ["create", "update", "retrieve", "partial_update"]:
+        if self.action in ["create", "update", "retrieve", "partial_update", "bulk"]:
             return ProfilesAndSubagenciensSerializer
         return ProfilesAndSubagenciensListSerializer
\ No newline at end of file
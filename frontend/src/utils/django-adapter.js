@@ -13,25 +13,43 @@ let odataToDjango = {
   "endswith": "__iendswith",
 }
 
+// returned by the API after a write, sent back with every request so the reads of the next
+// seconds see the write (the API is on another origin, its cookies are not sent)
+const READ_PRIMARY_HEADER = "X-Read-Primary-Until"
+let readPrimaryUntil = null
+
 
 function djangoStore(url, extraParams = {}, key) {
   const endpoint = axios.create({
     baseURL: url,
     timeout: 5000,
   })
+  endpoint.interceptors.request.use((config) => {
+    if (readPrimaryUntil) {
+      config.headers[READ_PRIMARY_HEADER] = readPrimaryUntil
+    }
+    return config
+  })
+  endpoint.interceptors.response.use((response) => {
+    const until = response.headers.get(READ_PRIMARY_HEADER)
+    if (until) {
+      readPrimaryUntil = until
+    }
+    return response
+  })
+
+  // cursor of the row following the last loaded page, used when the next page is requested
+  let nextPage = null
+  // sent with the searches, a newer search of this store supersedes the ones still running
+  const lookupKey = `${Date.now().toString(36)}-${Math.random().toString(36).slice(2)}`
 
-  return new CustomStore({
+  const store = new CustomStore({
     key: key || "id",
     async load(loadOptions) {
       // console.log(url)
       // console.log(loadOptions)
       let params = { ...extraParams }
 
-      if (loadOptions.take) {
-        params.limit = loadOptions.take
-        params.offset = loadOptions.skip
-      }
-
       if (loadOptions.searchValue) {
         params._search = loadOptions.searchValue
       }
@@ -59,9 +77,42 @@ function djangoStore(url, extraParams = {}, key) {
         }
         recursiveSearch(loadOptions.filter)
       }
-      const response = await endpoint.get("/", { params });
+
+      // keyset pagination: sequential pages continue from the cursor of the previous one,
+      // any other page (first load, jump, different sort or filter) starts from its offset
+      const query = JSON.stringify(params)
+      const skip = loadOptions.skip || 0
+      if (loadOptions.take) {
+        params.limit = loadOptions.take
+        if (nextPage && nextPage.query === query && nextPage.skip === skip) {
+          params.cursor = nextPage.cursor
+        } else {
+          params.cursor = ""
+          params.offset = skip
+        }
+      }
+
+      const headers = params._search ? { "X-Lookup-Key": lookupKey } : {}
+      let response
+      try {
+        response = await endpoint.get("/", { params, headers });
+      } catch (error) {
+        // superseded by the search typed after it, whose result is shown instead
+        if (error.response && error.response.status === 409 && params._search) {
+          return { data: [], totalCount: 0 }
+        }
+        throw error
+      }
       const result = response.data
 
+      nextPage = null
+      if (loadOptions.take && result.next) {
+        const cursor = new URL(result.next).searchParams.get("cursor")
+        if (cursor) {
+          nextPage = { query, skip: skip + result.results.length, cursor }
+        }
+      }
+
       return {
         data: result.results || result,
         totalCount: result.count || result.length || 0,
@@ -84,6 +135,46 @@ function djangoStore(url, extraParams = {}, key) {
       await endpoint.delete(`/${key}/`)
     }
   });
+
+  // saves all the changes of a grid onSaving event with one request to the bulk endpoint,
+  // in one transaction: if a row is invalid nothing is saved and its first error is shown
+  store.saveGridChanges = (e) => {
+    if (!e.changes.length) {
+      return
+    }
+    const batch = { create: [], update: [], delete: [] }
+    e.changes.forEach((change) => {
+      if (change.type === "insert") {
+        batch.create.push(change.data)
+      } else if (change.type === "update") {
+        batch.update.push({ ...change.data, id: change.key })
+      } else if (change.type === "remove") {
+        batch.delete.push(change.key)
+      }
+    })
+
+    e.cancel = true
+    e.promise = endpoint.post("/bulk/", batch)
+      .catch((error) => {
+        const errors = error.response && error.response.data && error.response.data.errors
+        if (!errors) {
+          throw error
+        }
+        for (const items of Object.values(errors)) {
+          for (const item of items) {
+            const [field, messages] = Object.entries(item)[0] || []
+            if (field) {
+              throw new Error(`${field}: ${messages.join(" ")}`)
+            }
+          }
+        }
+        throw error
+      })
+      .then(() => e.component.refresh(true))
+      .then(() => e.component.cancelEditData())
+  }
+
+  return store
 }
 
 export default djangoStore
\ No newline at end of file